@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Anel de hashing consistente
+Cada nodo ocupa vários pontos virtuais do anel; uma chave pertence aos primeiros nodos distintos
+encontrados no sentido horário a partir do hash dela. Com nodos a mais ou a menos só as chaves
+vizinhas dos pontos afetados mudam de dono
+"""
+
+import bisect
+import hashlib
+
+
+def _hash(texto):
+    return int.from_bytes(hashlib.md5(texto.encode()).digest()[:8], 'big')
+
+
+# Pontos (hash, id_nodo) ordenados; a busca do dono é uma bisseção
+class AnelConsistente:
+    """Distribui chaves entre nodos por hashing consistente"""
+
+    def __init__(self, ids_nodos, virtuais=64):
+        self.ids_nodos = list(ids_nodos)
+        self.pontos = sorted((_hash(f'{id_nodo}#{i}'), id_nodo) for id_nodo in self.ids_nodos for i in range(virtuais))
+        self.posicoes = [posicao for posicao, _ in self.pontos]
+
+    # Os 'quantidade' nodos distintos responsáveis pela chave, na ordem do anel (o primeiro é o dono principal)
+    def donos(self, chave, quantidade):
+        """Retorna [id_nodo]"""
+        quantidade = min(quantidade, len(self.ids_nodos))
+        inicio = bisect.bisect(self.posicoes, _hash(str(chave)))
+        donos = []
+        for i in range(len(self.pontos)):
+            id_nodo = self.pontos[(inicio + i) % len(self.pontos)][1]
+            if id_nodo not in donos:
+                donos.append(id_nodo)
+                if len(donos) == quantidade:
+                    break
+        return donos
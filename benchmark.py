@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Benchmark do ShardBox: sobe um cluster local de N nodos (ou usa um já rodando), gera carga mista
+de upload e download com tamanhos e concorrência configuráveis, mata nodos no meio da carga se
+pedido e relata latência (p50/p90/p99), vazão em MB/s e o custo do banco de metadados
+
+Exemplos:
+    python benchmark.py --nodos 8 --duracao 60 --concorrencia 16 --tamanhos 4K:50,256K:30,8M:20
+    python benchmark.py --nodos 8 --duracao 90 --matar 3@30 --saida base.json
+    python benchmark.py --nodos 8 --duracao 60 --comparar base.json --tolerancia 0.2
+    python benchmark.py --portas-http 8001,8002,8003 --duracao 30   # cluster já rodando
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+
+UNIDADES = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+DIR_PROJETO = Path(__file__).resolve().parent
+
+
+# Converte '4K', '256K', '8M' em bytes
+def tamanho_em_bytes(texto):
+    """Retorna o tamanho em bytes"""
+    texto = texto.strip().upper().removesuffix('B')  # '4KB' = '4K', '100B' = '100'
+    unidade = texto[-1] if texto[-1:].isalpha() else ''
+    if unidade not in UNIDADES:
+        raise argparse.ArgumentTypeError(f'Unidade inválida em {texto!r} (use K, M ou G)')
+    return int(float(texto[:len(texto) - len(unidade)]) * UNIDADES[unidade])
+
+
+# '4K:50,256K:30,8M:20' -> [(4096, 50), (262144, 30), (8388608, 20)]
+def distribuicao_tamanhos(texto):
+    """Retorna a lista de (tamanho, peso)"""
+    distribuicao = []
+    for item in texto.split(','):
+        tamanho, _, peso = item.partition(':')
+        distribuicao.append((tamanho_em_bytes(tamanho), float(peso or 1)))
+    return distribuicao
+
+
+# '3@30' -> (3, 30.0): mata o nodo 3 aos 30 segundos de carga
+def evento_morte(texto):
+    """Retorna (id do nodo, segundos)"""
+    try:
+        id_nodo, segundos = texto.split('@')
+        return int(id_nodo), float(segundos)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Use NODO@SEGUNDOS, não {texto!r}')
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+# Cluster local: um processo node.py por nodo num diretório de trabalho próprio
+class Cluster:
+    """Sobe, mata e encerra os nodos do benchmark"""
+
+    def __init__(self, nodos, porta_tcp, porta_http, diretorio, variaveis):
+        self.ids = list(range(1, nodos + 1))
+        self.portas_http = [porta_http + i for i in range(nodos)]
+        self.diretorio = diretorio
+        self.ambiente = dict(os.environ)
+        self.ambiente.update(variaveis)
+        self.ambiente.update({
+            'PORTAS': ','.join(str(porta_tcp + i) for i in range(nodos)),
+            'PORTAS_HTTP': ','.join(str(porta) for porta in self.portas_http),
+            'LOG_TERMINAL': '0'
+        })
+        self.processos = {}
+
+    def iniciar(self):
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        for id_nodo in self.ids:
+            saida = open(self.diretorio / f'saida_nodo_{id_nodo}.txt', 'ab')
+            self.processos[id_nodo] = subprocess.Popen(
+                [sys.executable, str(DIR_PROJETO / 'node.py'), str(id_nodo)],
+                cwd=self.diretorio, env=self.ambiente, stdout=saida, stderr=subprocess.STDOUT
+            )
+
+    # Espera todos os nodos responderem e se verem vivos pelo heartbeat
+    def aguardar(self, timeout):
+        limite = time.monotonic() + timeout
+        pendentes = set(self.ids)
+        while pendentes and time.monotonic() < limite:
+            for id_nodo in list(pendentes):
+                try:
+                    visao = requests.get(f'{url_nodo(self.portas_http[id_nodo - 1])}/membership', timeout=1).json()
+                    vivos = sum(1 for membro in visao['members'] if membro['state'] == 'vivo')
+                    if vivos == len(self.ids):
+                        pendentes.discard(id_nodo)
+                except (requests.RequestException, ValueError, KeyError):
+                    pass
+            time.sleep(0.5)
+        if pendentes:
+            raise RuntimeError(f'Nodos {sorted(pendentes)} não ficaram prontos em {timeout:g}s')
+
+    # Igual ao mata_nodo.sh (SIGTERM) ou uma queda (SIGKILL)
+    def matar(self, id_nodo, sinal):
+        processo = self.processos.get(id_nodo)
+        if processo is not None and processo.poll() is None:
+            processo.send_signal(sinal)
+
+    # Processos de nodo rodando no diretório do benchmark, inclusive os que o cluster recriou sozinho
+    def _pids_no_diretorio(self):
+        pids = {processo.pid for processo in self.processos.values() if processo.poll() is None}
+        for entrada in Path('/proc').glob('[0-9]*'):
+            try:
+                if Path(os.readlink(entrada / 'cwd')) == self.diretorio.resolve() and b'node.py' in (entrada / 'cmdline').read_bytes():
+                    pids.add(int(entrada.name))
+            except OSError:
+                continue
+        return pids
+
+    def encerrar(self, timeout=15):
+        for pid in self._pids_no_diretorio():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        limite = time.monotonic() + timeout
+        while self._pids_no_diretorio() and time.monotonic() < limite:
+            time.sleep(0.2)
+        for pid in self._pids_no_diretorio():
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        for processo in self.processos.values():
+            try:
+                processo.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+
+    # Bytes do banco de metadados no disco (SQLite + WAL ou JSON)
+    def tamanho_metadados(self):
+        return sum(caminho.stat().st_size for caminho in self.diretorio.glob('files_db*') if caminho.is_file())
+
+
+def url_nodo(porta):
+    return f'http://127.0.0.1:{porta}'
+
+
+# Lê /metrics de um nodo como {'nome{rotulos}': valor}
+def coletar_metricas(porta):
+    """Retorna as séries do nodo ou None se ele não respondeu"""
+    try:
+        resposta = requests.get(f'{url_nodo(porta)}/metrics', timeout=2)
+        resposta.raise_for_status()
+    except requests.RequestException:
+        return None
+    series = {}
+    for linha in resposta.text.splitlines():
+        if linha and not linha.startswith('#'):
+            nome, _, valor = linha.rpartition(' ')
+            series[nome] = float(valor.replace('+Inf', 'inf'))
+    return series
+
+
+# Diferença das métricas entre o início e o fim da carga, somada entre os nodos
+# Um nodo que reiniciou no meio (contador menor no fim) conta só o valor final
+def diferenca_metricas(inicio, fim):
+    """Retorna {'nome{rotulos}': delta}"""
+    total = defaultdict(float)
+    for porta, series_fim in fim.items():
+        if series_fim is None:
+            continue
+        series_inicio = inicio.get(porta) or {}
+        reiniciou = any(series_fim[chave] < valor for chave, valor in series_inicio.items()
+                        if '_count' in chave and chave in series_fim)
+        for chave, valor in series_fim.items():
+            total[chave] += valor if reiniciou else valor - series_inicio.get(chave, 0)
+    return total
+
+
+# Soma e contagem de um histograma por valor de um rótulo: {'obter_arquivo': (segundos, chamadas)}
+def histograma_por_rotulo(delta, nome, rotulo):
+    """Agrupa _sum/_count do histograma pelo rótulo"""
+    grupos = defaultdict(lambda: [0.0, 0])
+    for chave, valor in delta.items():
+        for sufixo, indice in (('_sum', 0), ('_count', 1)):
+            prefixo = f'{nome}{sufixo}{{'
+            if chave.startswith(prefixo) and f'{rotulo}="' in chave:
+                grupo = chave.split(f'{rotulo}="', 1)[1].split('"', 1)[0]
+                grupos[grupo][indice] += valor
+    return {grupo: tuple(valores) for grupo, valores in grupos.items() if valores[1]}
+
+
+# Gerador de carga: cada thread sorteia operação, tamanho e nodo de destino
+class Carga:
+    """Uploads e downloads concorrentes com registro de cada operação"""
+
+    def __init__(self, portas_http, tamanhos, leituras, semente):
+        self.portas_http = list(portas_http)
+        self.tamanhos = [tamanho for tamanho, _ in tamanhos]
+        self.pesos = [peso for _, peso in tamanhos]
+        self.leituras = leituras
+        self.semente = semente
+        self.lock = threading.Lock()
+        self.objetos = []    # [(id, tamanho, sha256)]
+        self.operacoes = []  # dicts com tipo, inicio, duracao, bytes, status, ttfb
+        self.fora = set()    # portas dos nodos mortos pelo benchmark
+        self.inicio = None
+
+    def _destino(self, rng):
+        with self.lock:
+            portas = [porta for porta in self.portas_http if porta not in self.fora] or self.portas_http
+        return rng.choice(portas)
+
+    def _registrar(self, operacao):
+        with self.lock:
+            self.operacoes.append(operacao)
+
+    def upload(self, sessao, rng):
+        tamanho = rng.choices(self.tamanhos, self.pesos)[0]
+        dados = rng.randbytes(tamanho)
+        porta = self._destino(rng)
+        comeco = time.perf_counter()
+        operacao = {'tipo': 'upload', 'inicio': comeco - self.inicio, 'bytes': tamanho, 'nodo': porta}
+        try:
+            resposta = sessao.post(f'{url_nodo(porta)}/upload', params={'filename': f'bench_{tamanho}.bin'},
+                                   data=dados, timeout=120)
+            operacao['status'] = resposta.status_code
+            if resposta.status_code == 200:
+                with self.lock:
+                    self.objetos.append((resposta.json()['id'], tamanho, hashlib.sha256(dados).hexdigest()))
+        except requests.RequestException as e:
+            operacao['status'] = 0
+            operacao['erro'] = type(e).__name__
+        operacao['duracao'] = time.perf_counter() - comeco
+        self._registrar(operacao)
+
+    def download(self, sessao, rng):
+        with self.lock:
+            if not self.objetos:
+                return False
+            id_arquivo, tamanho, esperado = rng.choice(self.objetos)
+        porta = self._destino(rng)
+        comeco = time.perf_counter()
+        operacao = {'tipo': 'download', 'inicio': comeco - self.inicio, 'bytes': 0, 'nodo': porta}
+        try:
+            with sessao.get(f'{url_nodo(porta)}/download/{id_arquivo}', stream=True, timeout=120) as resposta:
+                operacao['ttfb'] = time.perf_counter() - comeco
+                operacao['status'] = resposta.status_code
+                if resposta.status_code == 200:
+                    resumo = hashlib.sha256()
+                    for bloco in resposta.iter_content(256 * 1024):
+                        resumo.update(bloco)
+                        operacao['bytes'] += len(bloco)
+                    if operacao['bytes'] != tamanho or resumo.hexdigest() != esperado:
+                        operacao['erro'] = 'conteudo_divergente'
+        except requests.RequestException as e:
+            operacao['status'] = 0
+            operacao['erro'] = type(e).__name__
+        operacao['duracao'] = time.perf_counter() - comeco
+        self._registrar(operacao)
+        return True
+
+    # Sobe 'quantidade' objetos antes da medição para os downloads terem o que ler
+    def popular(self, quantidade, concorrencia):
+        self.inicio = time.perf_counter()
+        contador = iter(range(quantidade))
+        lock_contador = threading.Lock()
+
+        def trabalhar(indice):
+            rng = random.Random(f'{self.semente}-popular-{indice}')
+            with requests.Session() as sessao:
+                while True:
+                    with lock_contador:
+                        if next(contador, None) is None:
+                            return
+                    self.upload(sessao, rng)
+
+        executar_threads(trabalhar, concorrencia)
+        populados = len(self.objetos)
+        self.operacoes = []
+        return populados
+
+    # Carga mista por 'duracao' segundos; 'mortes' = [(segundos, funcao)] disparadas no tempo certo
+    def executar(self, duracao, concorrencia, mortes=()):
+        self.inicio = time.perf_counter()
+        fim = self.inicio + duracao
+
+        def trabalhar(indice):
+            rng = random.Random(f'{self.semente}-carga-{indice}')
+            with requests.Session() as sessao:
+                while time.perf_counter() < fim:
+                    if rng.random() >= self.leituras or not self.download(sessao, rng):
+                        self.upload(sessao, rng)
+
+        def agendar():
+            for segundos, acao in sorted(mortes, key=lambda evento: evento[0]):
+                espera = self.inicio + segundos - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                if time.perf_counter() < fim:
+                    acao()
+
+        agendador = threading.Thread(target=agendar, daemon=True)
+        agendador.start()
+        executar_threads(trabalhar, concorrencia)
+        return time.perf_counter() - self.inicio
+
+
+def executar_threads(funcao, quantidade):
+    threads = [threading.Thread(target=funcao, args=(indice,), daemon=True) for indice in range(quantidade)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# Resumo das operações de um tipo
+def resumo_operacoes(operacoes, duracao):
+    """Latências em ms, vazão e contagem de erros"""
+    ok = [operacao for operacao in operacoes if operacao.get('status') == 200 and 'erro' not in operacao]
+    latencias = [operacao['duracao'] * 1000 for operacao in ok]
+    primeiros_bytes = [operacao['ttfb'] * 1000 for operacao in ok if 'ttfb' in operacao]
+    transferidos = sum(operacao['bytes'] for operacao in ok)
+    arredondar = lambda valor: None if valor is None else round(valor, 2)
+    resumo = {
+        'operations': len(operacoes),
+        'ok': len(ok),
+        'rejected_503': sum(1 for operacao in operacoes if operacao.get('status') == 503),
+        'errors': sum(1 for operacao in operacoes if operacao.get('status') not in (200, 503) or 'erro' in operacao),
+        'ops_per_second': round(len(ok) / duracao, 2),
+        'mb_per_second': round(transferidos / duracao / 1024 ** 2, 2),
+        'latency_ms': {f'p{p}': arredondar(percentil(latencias, p)) for p in (50, 90, 99)},
+    }
+    resumo['latency_ms']['max'] = arredondar(max(latencias, default=None))
+    if primeiros_bytes:
+        resumo['ttfb_ms'] = {f'p{p}': arredondar(percentil(primeiros_bytes, p)) for p in (50, 99)}
+    return resumo
+
+
+# Operações e erros por segundo (para ver o efeito das mortes)
+def linha_do_tempo(operacoes, duracao):
+    """Lista [{'second', 'ok', 'errors'}] por segundo de carga"""
+    segundos = [{'second': s, 'ok': 0, 'errors': 0} for s in range(int(duracao) + 1)]
+    for operacao in operacoes:
+        indice = min(int(operacao['inicio'] + operacao['duracao']), len(segundos) - 1)
+        chave = 'ok' if operacao.get('status') == 200 and 'erro' not in operacao else 'errors'
+        segundos[indice][chave] += 1
+    return segundos
+
+
+# Custo do banco de metadados a partir de shardbox_metadata_seconds e das etapas do upload/download
+def resumo_metadados(delta, resultado, bytes_banco, objetos):
+    """Chamadas, tempo total e médio por operação do backend"""
+    operacoes = histograma_por_rotulo(delta, 'shardbox_metadata_seconds', 'operation')
+    total = sum(segundos for segundos, _ in operacoes.values())
+    clientes = resultado['upload']['ok'] + resultado['download']['ok']
+    return {
+        'total_seconds': round(total, 4),
+        'seconds_per_client_operation': round(total / clientes, 6) if clientes else None,
+        'store_bytes': bytes_banco,
+        'store_bytes_per_object': round(bytes_banco / objetos) if bytes_banco and objetos else None,
+        'by_operation': {
+            nome: {'calls': int(chamadas), 'total_seconds': round(segundos, 4), 'mean_ms': round(segundos / chamadas * 1000, 3)}
+            for nome, (segundos, chamadas) in sorted(operacoes.items(), key=lambda item: -item[1][0])
+        },
+        'upload_stages_mean_ms': {
+            etapa: round(segundos / chamadas * 1000, 2)
+            for etapa, (segundos, chamadas) in histograma_por_rotulo(delta, 'shardbox_upload_stage_seconds', 'stage').items()
+        },
+        'download_stages_mean_ms': {
+            etapa: round(segundos / chamadas * 1000, 2)
+            for etapa, (segundos, chamadas) in histograma_por_rotulo(delta, 'shardbox_download_stage_seconds', 'stage').items()
+        }
+    }
+
+
+def imprimir(resultado):
+    print(f'\n== {resultado["config"]["nodes"]} nodos, {resultado["config"]["concurrency"]} clientes, '
+          f'{resultado["duration_seconds"]:.1f}s, tamanhos {resultado["config"]["sizes"]} ==')
+    for tipo in ('upload', 'download'):
+        r = resultado[tipo]
+        latencia = r['latency_ms']
+        print(f'{tipo:>8}: {r["ok"]:>6} ok  {r["errors"]:>4} erros  {r["rejected_503"]:>4} recusados  '
+              f'{r["ops_per_second"]:>8.1f} op/s  {r["mb_per_second"]:>8.2f} MB/s  '
+              f'p50 {latencia["p50"]} ms  p90 {latencia["p90"]} ms  p99 {latencia["p99"]} ms  max {latencia["max"]} ms')
+    metadados = resultado.get('metadata')
+    if metadados:
+        print(f'metadados: {metadados["total_seconds"]}s no total, '
+              f'{metadados["seconds_per_client_operation"]}s por operação de cliente, '
+              f'{metadados["store_bytes"]} bytes no disco ({metadados["store_bytes_per_object"]} por objeto)')
+        for nome, dados in list(metadados['by_operation'].items())[:6]:
+            print(f'           {nome:<28} {dados["calls"]:>7} chamadas  {dados["mean_ms"]:>8.3f} ms em média')
+        print(f'   upload: {metadados["upload_stages_mean_ms"]}')
+        print(f' download: {metadados["download_stages_mean_ms"]}')
+    for evento in resultado['kills']:
+        janela = [s for s in resultado['timeline'] if evento['at_seconds'] <= s['second'] < evento['at_seconds'] + 10]
+        print(f'    morte: nodo {evento["node"]} aos {evento["at_seconds"]:g}s -> '
+              f'{sum(s["errors"] for s in janela)} erros nos 10s seguintes')
+
+
+# Compara com um resultado anterior: regressão = p99 maior ou MB/s menor além da tolerância
+def comparar(resultado, caminho_base, tolerancia):
+    """Retorna a lista de regressões encontradas"""
+    base = json.loads(Path(caminho_base).read_text())
+    diferentes = [chave for chave in ('nodes', 'concurrency', 'sizes', 'read_fraction', 'env')
+                  if base['config'].get(chave) != resultado['config'][chave]]
+    if diferentes:
+        print(f'AVISO: configuração diferente da base em {", ".join(diferentes)}; a comparação pode não fazer sentido')
+    regressoes = []
+    for tipo in ('upload', 'download'):
+        atual, anterior = resultado[tipo], base[tipo]
+        p99, p99_base = atual['latency_ms']['p99'], anterior['latency_ms']['p99']
+        if p99 and p99_base and p99 > p99_base * (1 + tolerancia):
+            regressoes.append(f'{tipo}: p99 {p99_base} -> {p99} ms')
+        if anterior['mb_per_second'] and atual['mb_per_second'] < anterior['mb_per_second'] * (1 - tolerancia):
+            regressoes.append(f'{tipo}: {anterior["mb_per_second"]} -> {atual["mb_per_second"]} MB/s')
+        if atual['errors'] > anterior['errors']:
+            regressoes.append(f'{tipo}: erros {anterior["errors"]} -> {atual["errors"]}')
+    return regressoes
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description='Benchmark de carga do ShardBox')
+    parser.add_argument('--nodos', type=int, default=8, help='nodos do cluster local (padrão 8)')
+    parser.add_argument('--portas-http', help='usa um cluster já rodando nestas portas HTTP em vez de subir um')
+    parser.add_argument('--porta-tcp', type=int, default=16001, help='primeira porta TCP do cluster local')
+    parser.add_argument('--porta-http', type=int, default=18001, help='primeira porta HTTP do cluster local')
+    parser.add_argument('--env', action='append', default=[], metavar='CHAVE=VALOR',
+                        help='variável extra para os nodos (ex.: ESTRATEGIA_FRAGMENTACAO=fixa), pode repetir')
+    parser.add_argument('--diretorio', type=Path, help='diretório de trabalho do cluster (padrão: temporário)')
+    parser.add_argument('--manter', action='store_true', help='não apaga o diretório de trabalho no fim')
+    parser.add_argument('--duracao', type=float, default=30, help='segundos de carga medida')
+    parser.add_argument('--concorrencia', type=int, default=8, help='clientes simultâneos')
+    parser.add_argument('--tamanhos', type=distribuicao_tamanhos, default='4K:50,256K:30,4M:20',
+                        help='distribuição TAMANHO:PESO dos objetos (padrão 4K:50,256K:30,4M:20)')
+    parser.add_argument('--leituras', type=float, default=0.7, help='fração de downloads na carga (padrão 0.7)')
+    parser.add_argument('--objetos-iniciais', type=int, default=32, help='uploads antes da medição')
+    parser.add_argument('--matar', type=evento_morte, action='append', default=[], metavar='NODO@SEGUNDOS',
+                        help='mata um nodo durante a carga, pode repetir (o cluster o recria sozinho)')
+    parser.add_argument('--sinal', choices=('TERM', 'KILL'), default='TERM',
+                        help='TERM como o mata_nodo.sh ou KILL para simular uma queda')
+    parser.add_argument('--semente', default='shardbox', help='semente dos sorteios (reprodutibilidade)')
+    parser.add_argument('--timeout-inicio', type=float, default=90, help='espera máxima pelo cluster pronto')
+    parser.add_argument('--saida', type=Path, help='grava o resultado completo em JSON')
+    parser.add_argument('--comparar', type=Path, help='JSON de uma execução anterior para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='piora aceita na comparação (padrão 0.2)')
+    return parser.parse_args()
+
+
+def main():
+    args = argumentos()
+    cluster = None
+    diretorio_temporario = None
+    if args.portas_http:
+        portas_http = [int(porta) for porta in args.portas_http.split(',')]
+        if args.matar:
+            sys.exit('ERRO: --matar só funciona com o cluster local')
+    else:
+        if args.diretorio is None:
+            diretorio_temporario = Path(tempfile.mkdtemp(prefix='shardbox_bench_'))
+        variaveis = dict(item.split('=', 1) for item in args.env)
+        cluster = Cluster(args.nodos, args.porta_tcp, args.porta_http, args.diretorio or diretorio_temporario, variaveis)
+        portas_http = cluster.portas_http
+
+    try:
+        if cluster is not None:
+            print(f'Subindo {args.nodos} nodos em {cluster.diretorio}...')
+            cluster.iniciar()
+            cluster.aguardar(args.timeout_inicio)
+
+        carga = Carga(portas_http, args.tamanhos, args.leituras, args.semente)
+        print(f'Populando {args.objetos_iniciais} objetos...')
+        carga.popular(args.objetos_iniciais, args.concorrencia)
+
+        mortes = []
+        registro_mortes = []
+        for id_nodo, segundos in args.matar:
+            def acao(id_nodo=id_nodo, segundos=segundos):
+                carga.fora.add(portas_http[id_nodo - 1])
+                cluster.matar(id_nodo, getattr(signal, f'SIG{args.sinal}'))
+                registro_mortes.append({'node': id_nodo, 'at_seconds': segundos, 'signal': args.sinal})
+            mortes.append((segundos, acao))
+
+        metricas_inicio = {porta: coletar_metricas(porta) for porta in portas_http}
+        print(f'Carga: {args.duracao:g}s, {args.concorrencia} clientes, {args.leituras:.0%} downloads...')
+        duracao = carga.executar(args.duracao, args.concorrencia, mortes)
+        metricas_fim = {porta: coletar_metricas(porta) for porta in portas_http}
+
+        resultado = {
+            'config': {
+                'nodes': len(portas_http),
+                'concurrency': args.concorrencia,
+                'sizes': ','.join(f'{tamanho}:{peso:g}' for tamanho, peso in args.tamanhos),
+                'read_fraction': args.leituras,
+                'env': args.env,
+                'seed': args.semente
+            },
+            'duration_seconds': round(duracao, 3),
+            'objects': len(carga.objetos),
+            'kills': registro_mortes
+        }
+        for tipo in ('upload', 'download'):
+            resultado[tipo] = resumo_operacoes([operacao for operacao in carga.operacoes if operacao['tipo'] == tipo], duracao)
+        resultado['timeline'] = linha_do_tempo(carga.operacoes, duracao)
+        if any(metricas_fim.values()):
+            delta = diferenca_metricas(metricas_inicio, metricas_fim)
+            bytes_banco = cluster.tamanho_metadados() if cluster is not None else None
+            resultado['metadata'] = resumo_metadados(delta, resultado, bytes_banco, len(carga.objetos))
+
+        imprimir(resultado)
+        if args.saida:
+            args.saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+            print(f'Resultado gravado em {args.saida}')
+        if args.comparar:
+            regressoes = comparar(resultado, args.comparar, args.tolerancia)
+            for regressao in regressoes:
+                print(f'REGRESSÃO {regressao}')
+            if regressoes:
+                sys.exit(1)
+            print(f'Sem regressões em relação a {args.comparar}')
+
+    finally:
+        if cluster is not None:
+            print('Encerrando o cluster...')
+            cluster.encerrar()
+        if diretorio_temporario is not None and not args.manter:
+            shutil.rmtree(diretorio_temporario, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
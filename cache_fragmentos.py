@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Cache em memória dos fragmentos lidos de outros nodos
+LRU limitado em bytes; um fragmento só entra no cache na segunda vez que é pedido,
+então o download de um arquivo grande lido uma vez só não expulsa os fragmentos quentes
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+
+# LRU por bytes com admissão na segunda leitura (as chaves vistas uma vez ficam numa lista fantasma)
+class CacheFragmentos:
+    """Cache LRU de fragmentos {nome do fragmento: bytes}"""
+
+    def __init__(self, limite_bytes, tamanho_maximo_item=None, fantasmas=4096):
+        self.limite_bytes = limite_bytes
+        self.tamanho_maximo_item = tamanho_maximo_item or max(limite_bytes // 8, 1)
+        self.limite_fantasmas = fantasmas
+        self.itens = OrderedDict()      # {chave: bytes}, do menos para o mais recente
+        self.fantasmas = OrderedDict()  # chaves pedidas uma vez e ainda não admitidas
+        self.bytes_usados = 0
+        self.lock = Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.remocoes = 0
+        self.insercoes = 0
+
+    @property
+    def ativo(self):
+        return self.limite_bytes > 0
+
+    # Busca um fragmento (None se não estiver no cache)
+    def obter(self, chave):
+        if not self.ativo:
+            return None
+        with self.lock:
+            dados = self.itens.get(chave)
+            if dados is None:
+                self.faltas += 1
+                return None
+            self.itens.move_to_end(chave)
+            self.acertos += 1
+            return dados
+
+    # Decide se um fragmento que acabou de ser buscado entra no cache: só na segunda vez que é pedido
+    # (a primeira fica registrada na lista fantasma) e se couber no limite por item
+    def admitir(self, chave, tamanho):
+        if not self.ativo or tamanho > self.tamanho_maximo_item:
+            return False
+        with self.lock:
+            if chave in self.fantasmas:
+                return True
+            self.fantasmas[chave] = None
+            while len(self.fantasmas) > self.limite_fantasmas:
+                self.fantasmas.popitem(last=False)
+            return False
+
+    # Guarda um fragmento, expulsando os menos usados até caber
+    def guardar(self, chave, dados):
+        if not self.ativo or len(dados) > self.tamanho_maximo_item:
+            return
+        with self.lock:
+            self.fantasmas.pop(chave, None)
+            anterior = self.itens.pop(chave, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            self.itens[chave] = dados
+            self.bytes_usados += len(dados)
+            self.insercoes += 1
+            while self.bytes_usados > self.limite_bytes:
+                _, removido = self.itens.popitem(last=False)
+                self.bytes_usados -= len(removido)
+                self.remocoes += 1
+
+    # Tira fragmentos do cache (arquivo removido ou fragmento regravado)
+    def invalidar(self, *chaves):
+        with self.lock:
+            for chave in chaves:
+                self.fantasmas.pop(chave, None)
+                dados = self.itens.pop(chave, None)
+                if dados is not None:
+                    self.bytes_usados -= len(dados)
+
+    # Contadores para consulta (JSON)
+    def estatisticas(self):
+        with self.lock:
+            pedidos = self.acertos + self.faltas
+            return {
+                'enabled': self.ativo,
+                'capacity_bytes': self.limite_bytes,
+                'max_item_bytes': self.tamanho_maximo_item,
+                'used_bytes': self.bytes_usados,
+                'items': len(self.itens),
+                'hits': self.acertos,
+                'misses': self.faltas,
+                'hit_ratio': round(self.acertos / pedidos, 4) if pedidos else 0.0,
+                'insertions': self.insercoes,
+                'evictions': self.remocoes
+            }
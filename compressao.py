@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Compressão transparente dos fragmentos
+O codec de cada fragmento é escolhido comprimindo amostras do início, do meio e do fim:
+conteúdo que já vem comprimido (imagens, vídeo, zip) não ganha nada e é gravado cru
+"""
+
+import bz2
+import lzma
+import time
+import zlib
+
+# {codec: (cria o compressor a partir do nível, cria o descompressor, níveis aceitos)}
+CODECS = {
+    'zlib': (lambda nivel: zlib.compressobj(nivel), zlib.decompressobj, range(0, 10)),
+    'bz2': (lambda nivel: bz2.BZ2Compressor(nivel), bz2.BZ2Decompressor, range(1, 10)),
+    'lzma': (lambda nivel: lzma.LZMACompressor(preset=nivel), lzma.LZMADecompressor, range(0, 10)),
+}
+
+
+# Lê a lista de candidatos 'codec:nivel,...' (do mais barato para o mais caro)
+def ler_candidatos(texto):
+    """Retorna [(codec, nivel)]; ValueError se algum não existir"""
+    candidatos = []
+    for item in filter(None, (parte.strip() for parte in texto.split(','))):
+        codec, _, nivel = item.partition(':')
+        if codec not in CODECS:
+            raise ValueError(f'Codec de compressão desconhecido: {codec} (use {", ".join(CODECS)})')
+        nivel = int(nivel) if nivel else 6
+        if nivel not in CODECS[codec][2]:
+            raise ValueError(f'Nível inválido para {codec}: {nivel}')
+        candidatos.append((codec, nivel))
+    return candidatos
+
+
+# Escolha do codec por amostragem
+class Compressao:
+    """Decide se (e como) um fragmento é comprimido"""
+
+    def __init__(self, candidatos, ganho_minimo=0.1, ganho_extra=0.05, tamanho_minimo=4096, tamanho_amostra=64 * 1024):
+        if not candidatos:
+            raise ValueError('Nenhum codec de compressão configurado')
+        self.candidatos = candidatos
+        self.ganho_minimo = ganho_minimo      # fração mínima economizada para valer a pena comprimir
+        self.ganho_extra = ganho_extra        # fração a mais que um candidato mais caro precisa economizar
+        self.tamanho_minimo = tamanho_minimo  # fragmentos menores ficam crus
+        self.tamanho_amostra = tamanho_amostra
+
+    # Intervalos (deslocamento, tamanho) amostrados de um fragmento: início, meio e fim
+    def amostras(self, tamanho):
+        if tamanho <= self.tamanho_amostra:
+            return [(0, tamanho)]
+        janela = self.tamanho_amostra // 3
+        return [(0, janela), ((tamanho - janela) // 2, janela), (tamanho - janela, janela)]
+
+    # Comprime as amostras com cada candidato e retorna (codec, nivel) ou None para gravar cru
+    # Um candidato mais caro só substitui o anterior se economizar 'ganho_extra' a mais
+    def escolher(self, amostras):
+        total = sum(len(amostra) for amostra in amostras)
+        if total < self.tamanho_minimo:
+            return None
+        escolhido, economia_escolhida = None, self.ganho_minimo
+        for i, (codec, nivel) in enumerate(self.candidatos):
+            tamanho = sum(len(comprimir_bytes(amostra, codec, nivel)) for amostra in amostras)
+            economia = 1 - tamanho / total
+            if i == 0 and economia <= 0:
+                break  # nem o primeiro reduziu nada: o conteúdo já é comprimido
+            if escolhido is None and economia >= self.ganho_minimo:
+                escolhido, economia_escolhida = (codec, nivel), economia
+            elif escolhido is not None and economia >= economia_escolhida + self.ganho_extra:
+                escolhido, economia_escolhida = (codec, nivel), economia
+        return escolhido
+
+
+# Comprime um buffer inteiro (usado nas amostras)
+def comprimir_bytes(dados, codec, nivel):
+    compressor = CODECS[codec][0](nivel)
+    return compressor.compress(dados) + compressor.flush()
+
+
+# Comprime uma sequência de blocos; 'medicao' acumula bytes de entrada/saída e tempo de CPU
+def comprimir(blocos, codec, nivel, medicao):
+    """Gera os blocos comprimidos"""
+    compressor = CODECS[codec][0](nivel)
+    for bloco in blocos:
+        inicio = time.thread_time()
+        saida = compressor.compress(bloco)
+        medicao['cpu'] = medicao.get('cpu', 0) + time.thread_time() - inicio
+        medicao['entrada'] = medicao.get('entrada', 0) + len(bloco)
+        if saida:
+            medicao['saida'] = medicao.get('saida', 0) + len(saida)
+            yield saida
+    saida = compressor.flush()
+    medicao['saida'] = medicao.get('saida', 0) + len(saida)
+    if saida:
+        yield saida
+
+
+# Descomprime uma sequência de blocos sem gerar mais que 'limite' bytes por vez
+# (um bloco de zeros comprimido vira centenas de MB); 'medicao' acumula como em comprimir
+def descomprimir(blocos, codec, limite, medicao):
+    """Gera os blocos originais"""
+    descompressor = CODECS[codec][1]()
+    for bloco in blocos:
+        medicao['entrada'] = medicao.get('entrada', 0) + len(bloco)
+        yield from _expandir(descompressor, bloco, limite, medicao)
+    if codec == 'zlib':
+        inicio = time.thread_time()
+        saida = descompressor.flush()
+        medicao['cpu'] = medicao.get('cpu', 0) + time.thread_time() - inicio
+        medicao['saida'] = medicao.get('saida', 0) + len(saida)
+        if saida:
+            yield saida
+
+
+def _expandir(descompressor, bloco, limite, medicao):
+    while True:
+        inicio = time.thread_time()
+        saida = descompressor.decompress(bloco, limite)
+        medicao['cpu'] = medicao.get('cpu', 0) + time.thread_time() - inicio
+        medicao['saida'] = medicao.get('saida', 0) + len(saida)
+        if saida:
+            yield saida
+        if hasattr(descompressor, 'unconsumed_tail'):
+            # zlib devolve a entrada que não coube
+            bloco = descompressor.unconsumed_tail
+            if not bloco and len(saida) < limite:
+                return
+        else:
+            # bz2 e lzma guardam a entrada pendente e avisam quando precisam de mais
+            bloco = b''
+            if descompressor.needs_input or descompressor.eof:
+                return
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Chunking definido pelo conteúdo (CDC) para deduplicação de fragmentos
+Os cortes dependem só dos bytes próximos, então um trecho inserido no meio
+de um arquivo muda apenas os chunks em volta dele
+"""
+
+import hashlib
+
+import numpy as np
+
+# Janela do hash Gear de 32 bits: h_i = soma(G[b_(i-j)] << j) para j < 32,
+# ou seja, cada posição depende só dos últimos 32 bytes
+JANELA = 32
+
+# Tabela Gear fixa (precisa ser igual em todos os nodos e execuções)
+GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') for i in range(256)],
+    dtype=np.uint32
+)
+
+# Tamanho do bloco lido do disco por vez ao procurar cortes
+TAMANHO_LEITURA = 8 * 1024 * 1024
+
+
+# Posições candidatas a corte (fim de chunk) dentro de um buffer
+def _candidatos(buffer, mascara):
+    """buffer começa com os JANELA - 1 bytes anteriores; retorna índices relativos ao fim dessa sobra"""
+    valores = GEAR[np.frombuffer(buffer, dtype=np.uint8)]
+    hash_gear = np.zeros(len(valores) - (JANELA - 1), dtype=np.uint32)
+    for j in range(JANELA):
+        hash_gear += valores[JANELA - 1 - j:len(valores) - j] << np.uint32(j)
+    return np.flatnonzero((hash_gear & mascara) == 0)
+
+
+# Gera os chunks (inicio, tamanho, SHA-256) de um arquivo numa leitura só: o hash de cada chunk é
+# somado enquanto os blocos passam pela busca de cortes, sem reler o chunk depois
+def chunks_cdc(caminho, minimo, medio, maximo):
+    """Divide o arquivo em chunks de tamanho entre 'minimo' e 'maximo', em média ~'medio'"""
+    # os bits mais altos do hash dependem da janela inteira
+    bits = max(1, int(medio).bit_length() - 1)
+    mascara = np.uint32(((1 << bits) - 1) << (32 - bits))
+
+    inicio = 0
+    posicao = 0
+    sobra = b'\0' * (JANELA - 1)
+    aberto = 0  # início do chunk que está sendo somado no resumo (fica atrás de 'inicio' até os cortes do bloco saírem)
+    resumo = hashlib.sha256()
+
+    with open(caminho, 'rb') as f:
+        while True:
+            bloco = f.read(TAMANHO_LEITURA)
+            if not bloco:
+                break
+
+            cortes = []
+            for indice in _candidatos(sobra + bloco, mascara):
+                fim = posicao + int(indice) + 1
+                while fim - inicio > maximo:
+                    inicio += maximo
+                    cortes.append(inicio)
+                if fim - inicio >= minimo:
+                    inicio = fim
+                    cortes.append(inicio)
+            # um chunk que já passou de 'maximo' é cortado antes de o resto do bloco entrar no resumo dele
+            while posicao + len(bloco) - inicio > maximo:
+                inicio += maximo
+                cortes.append(inicio)
+
+            visao = memoryview(bloco)
+            lido = 0  # bytes do bloco já somados ao resumo
+            for corte in cortes:
+                resumo.update(visao[lido:corte - posicao])
+                lido = corte - posicao
+                yield aberto, corte - aberto, resumo.hexdigest()
+                aberto, resumo = corte, hashlib.sha256()
+            resumo.update(visao[lido:])
+
+            posicao += len(bloco)
+            sobra = (sobra + bloco)[-(JANELA - 1):]
+
+    if posicao > inicio or posicao == 0:
+        yield inicio, posicao - inicio, resumo.hexdigest()
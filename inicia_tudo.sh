@@ -6,7 +6,14 @@ echo "Iniciando todos os 8 nodos..."
 for i in {1..8}; do
     echo "Iniciando nodo $i"
     ./venv/bin/python3 node.py $i &
-    sleep 1  # 1 segundo entre cada nodo para evitar conflitos de porta
+done
+
+# Espera cada nodo responder 200 em /ready (portas HTTP 8001-8008)
+for i in {1..8}; do
+    until [ "$(curl -s -o /dev/null -w '%{http_code}' http://localhost:800$i/ready)" = "200" ]; do
+        sleep 0.1
+    done
+    echo "Nodo $i pronto"
 done
 
 echo "Todos os nodos foram iniciados!"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Integridade dos fragmentos: checksum (SHA-256) e acompanhamento da varredura
+que relê os fragmentos locais procurando corrupção
+"""
+
+import hashlib
+import time
+from threading import Lock
+
+
+# SHA-256 de uma sequência de blocos
+def checksum_blocos(blocos):
+    """Retorna o hexdigest dos blocos"""
+    resumo = hashlib.sha256()
+    for bloco in blocos:
+        resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+# SHA-256 de faixas consecutivas de um stream, calculado enquanto os blocos passam para outro lugar
+# (o staging do upload): os checksums dos fragmentos saem sem uma segunda leitura do arquivo
+class ChecksumsFaixas:
+    """'tamanhos': tamanho de cada faixa, em ordem (pode ser infinito); None = a faixa vai até o fim do stream"""
+
+    def __init__(self, tamanhos):
+        self.tamanhos = iter(tamanhos)
+        self.restante = next(self.tamanhos, None)
+        self.resumo = hashlib.sha256()
+        self.concluidos = []
+
+    # Repassa os blocos sem alterar, somando cada pedaço no resumo da faixa a que pertence
+    def passar(self, blocos):
+        for bloco in blocos:
+            visao = memoryview(bloco)
+            while visao:
+                if self.restante == 0:
+                    self.concluidos.append(self.resumo.hexdigest())
+                    self.resumo = hashlib.sha256()
+                    self.restante = next(self.tamanhos, None)
+                pedaco = visao if self.restante is None else visao[:self.restante]
+                self.resumo.update(pedaco)
+                visao = visao[len(pedaco):]
+                if self.restante is not None:
+                    self.restante -= len(pedaco)
+            yield bloco
+
+    def checksums(self):
+        """Retorna o hexdigest de cada faixa que recebeu bytes (só o da primeira, vazia, se o stream não tinha nada)"""
+        return self.concluidos + [self.resumo.hexdigest()]
+
+
+# Contadores da passada de varredura em andamento e da última concluída
+class ProgressoVarredura:
+    """Progresso da varredura dos fragmentos locais"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.atual = None
+        self.ultima = None
+
+    # Começa uma passada (retomada a partir de 'cursor', se a anterior foi interrompida)
+    def iniciar(self, fragmentos, cursor=''):
+        with self.lock:
+            self.atual = {
+                'started_at': time.time(),
+                'resumed_from': cursor or None,
+                'fragments_total': fragmentos,
+                'fragments_checked': 0,
+                'fragments_corrupt': 0,
+                'fragments_missing': 0,
+                'orphan_files': 0,
+                'bytes_checked': 0
+            }
+
+    # Soma um resultado: 'fragments_checked', 'fragments_corrupt', 'fragments_missing' ou 'orphan_files'
+    def registrar(self, contador, tamanho=0):
+        with self.lock:
+            if self.atual is None:
+                return
+            self.atual[contador] += 1
+            self.atual['bytes_checked'] += tamanho
+
+    def concluir(self):
+        with self.lock:
+            if self.atual is not None:
+                self.atual['finished_at'] = time.time()
+                self.ultima = self.atual
+                self.atual = None
+
+    @staticmethod
+    def _com_vazao(estado):
+        if estado is None:
+            return None
+        estado = dict(estado)
+        duracao = max(estado.get('finished_at', time.time()) - estado['started_at'], 1e-6)
+        estado['elapsed_seconds'] = round(duracao, 3)
+        estado['throughput_bytes_per_second'] = round(estado['bytes_checked'] / duracao)
+        return estado
+
+    # Retorna {'current': ..., 'last': ...} com tempo decorrido e vazão
+    def resumo(self):
+        with self.lock:
+            return {'current': self._com_vazao(self.atual), 'last': self._com_vazao(self.ultima)}
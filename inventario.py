@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Inventário dos fragmentos avulsos do nodo
+Guarda {nome: (tamanho, mtime, checksum conferido)} dos arquivos de files_nodo_N e é salvo de tempos
+em tempos (checkpoint): na partida o nodo sabe o que tem no disco só lendo o checkpoint, sem abrir
+nem reler nenhum fragmento. Um checksum só vale enquanto o tamanho e o mtime do arquivo não mudarem
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+
+# Inventário em memória com checkpoint em JSON
+class Inventario:
+    """Fragmentos avulsos de um diretório, com tamanho e checksum"""
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        self.lock = Lock()
+        self.itens = {}  # {nome: (tamanho, mtime_ns, checksum ou None)}
+        self.alterado = False
+        self.reconciliado = False  # já comparado com o diretório desde a partida
+        self.ultima_reconciliacao = None
+        inicio = time.perf_counter()
+        try:
+            self.itens = {nome: tuple(item) for nome, item in json.loads(self.caminho.read_text()).items()}
+        except (FileNotFoundError, ValueError):
+            self.itens = {}
+        self.tempo_carga = time.perf_counter() - inicio
+
+    # Registra (ou atualiza) um fragmento; 'checksum' só se o conteúdo foi conferido com essa assinatura
+    def registrar(self, nome, tamanho, mtime_ns, checksum=None):
+        with self.lock:
+            self.itens[nome] = (tamanho, mtime_ns, checksum)
+            self.alterado = True
+
+    def remover(self, nome):
+        with self.lock:
+            if self.itens.pop(nome, None) is not None:
+                self.alterado = True
+
+    def contem(self, nome):
+        return nome in self.itens
+
+    def nomes(self):
+        with self.lock:
+            return list(self.itens)
+
+    # Se o fragmento já foi conferido com este checksum e não mudou desde então
+    def verificado(self, nome, tamanho, mtime_ns, checksum):
+        return self.itens.get(nome) == (tamanho, mtime_ns, checksum)
+
+    # Compara com o diretório: acrescenta os arquivos desconhecidos, esquece os que sumiram e
+    # descarta o checksum dos que mudaram de tamanho ou mtime (o checkpoint é de antes de uma queda)
+    def reconciliar(self, diretorio, prefixos):
+        """Retorna {'added', 'changed', 'removed'}"""
+        inicio = time.perf_counter()
+        no_disco = {}
+        with os.scandir(diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith(prefixos) and entrada.is_file():
+                    try:
+                        estado = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    no_disco[entrada.name] = (estado.st_size, estado.st_mtime_ns)
+
+        resultado = {'added': 0, 'changed': 0, 'removed': 0}
+        with self.lock:
+            for nome in [nome for nome in self.itens if nome not in no_disco]:
+                # conferido de novo no disco: pode ter sido gravado depois da listagem
+                if not (Path(diretorio) / nome).is_file():
+                    del self.itens[nome]
+                    resultado['removed'] += 1
+            for nome, (tamanho, mtime_ns) in no_disco.items():
+                item = self.itens.get(nome)
+                if item is None:
+                    if not (Path(diretorio) / nome).is_file():
+                        continue  # removido depois da listagem
+                    self.itens[nome] = (tamanho, mtime_ns, None)
+                    resultado['added'] += 1
+                elif item[:2] != (tamanho, mtime_ns):
+                    self.itens[nome] = (tamanho, mtime_ns, None)
+                    resultado['changed'] += 1
+            if any(resultado.values()):
+                self.alterado = True
+            self.reconciliado = True
+            self.ultima_reconciliacao = dict(resultado, seconds=round(time.perf_counter() - inicio, 3))
+        return resultado
+
+    # Salva o inventário (gravação atômica por rename)
+    def salvar(self):
+        with self.lock:
+            if not self.alterado:
+                return False
+            itens = dict(self.itens)
+            self.alterado = False
+        temporario = self.caminho.with_suffix('.tmp')
+        temporario.write_text(json.dumps(itens, separators=(',', ':')))
+        os.replace(temporario, self.caminho)
+        return True
+
+    # Situação do inventário (JSON)
+    def estatisticas(self):
+        with self.lock:
+            return {
+                'fragments': len(self.itens),
+                'bytes': sum(item[0] for item in self.itens.values()),
+                'verified': sum(1 for item in self.itens.values() if item[2]),
+                'load_ms': round(self.tempo_carga * 1000, 3),
+                'reconciled': self.reconciliado,
+                'last_reconciliation': self.ultima_reconciliacao
+            }
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tempos de resposta das buscas de fragmentos em outros nodos
+Guarda uma média móvel por nodo (para escolher a réplica mais rápida) e as amostras recentes
+de todos os nodos (para o percentil que decide quando mandar uma leitura duplicada)
+"""
+
+from collections import deque
+from threading import Lock
+
+
+# Média móvel por nodo e janela das últimas amostras do cluster
+class LatenciaLeituras:
+    """Latência até o primeiro byte das buscas de fragmentos"""
+
+    def __init__(self, ids_nodos, amostras=512, peso=0.3):
+        self.lock = Lock()
+        self.peso = peso
+        self.medias = {id_nodo: None for id_nodo in ids_nodos}  # segundos
+        self.recentes = deque(maxlen=amostras)
+
+    # Registra o tempo de uma busca que respondeu
+    def registrar(self, id_nodo, segundos):
+        with self.lock:
+            anterior = self.medias.get(id_nodo)
+            self.medias[id_nodo] = segundos if anterior is None else (1 - self.peso) * anterior + self.peso * segundos
+            self.recentes.append(segundos)
+
+    # Busca que falhou: o nodo vai para o fim da fila como se tivesse levado 'penalidade' segundos
+    def registrar_falha(self, id_nodo, penalidade):
+        with self.lock:
+            anterior = self.medias.get(id_nodo) or 0
+            self.medias[id_nodo] = max(anterior, penalidade)
+
+    # Média móvel do nodo em segundos (None se ainda não houve busca nele)
+    def media(self, id_nodo):
+        with self.lock:
+            return self.medias.get(id_nodo)
+
+    # Percentil das amostras recentes (None se houver menos que 'minimo' amostras)
+    def percentil(self, p, minimo=20):
+        with self.lock:
+            if len(self.recentes) < minimo:
+                return None
+            ordenadas = sorted(self.recentes)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+    # Médias por nodo em milissegundos (JSON)
+    def resumo(self):
+        with self.lock:
+            return {
+                str(id_nodo): None if media is None else round(media * 1000, 3)
+                for id_nodo, media in sorted(self.medias.items())
+            }
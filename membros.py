@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Visão do cluster mantida por gossip
+Cada nodo incrementa o próprio contador de heartbeat a cada intervalo e troca a tabela
+de contadores com alguns nodos por rodada; um nodo cujo contador para de subir é dado como morto.
+O contador vem junto da geração (início do processo), então um nodo reiniciado volta a valer na hora
+"""
+
+import time
+from threading import Lock
+
+VIVO = 'vivo'
+SUSPEITO = 'suspeito'
+MORTO = 'morto'
+
+
+# Tabela de membros: (geração, contador) de heartbeat, quando ele subiu pela última vez e latência medida
+class Membros:
+    """Visão em memória da saúde e da latência dos nodos"""
+
+    def __init__(self, id_proprio, ids_nodos, tempo_suspeita, tempo_morte):
+        self.id_proprio = id_proprio
+        self.tempo_suspeita = tempo_suspeita
+        self.tempo_morte = tempo_morte
+        self.lock = Lock()
+        agora = time.time()
+        # nodo nunca visto conta a partir de agora, para não nascer morto
+        self.membros = {
+            id_nodo: {'geracao': 0, 'contador': 0, 'atualizado_em': agora, 'latencia': None}
+            for id_nodo in ids_nodos
+        }
+        self.membros[id_proprio]['geracao'] = time.time_ns() // 1_000_000
+
+    # Recomeça a contagem dos nodos ainda não vistos (chamado quando o heartbeat começa)
+    def iniciar(self):
+        agora = time.time()
+        with self.lock:
+            for membro in self.membros.values():
+                if membro['contador'] == 0:
+                    membro['atualizado_em'] = agora
+
+    # Avança o próprio contador (uma vez por rodada)
+    def incrementar_proprio(self):
+        with self.lock:
+            proprio = self.membros[self.id_proprio]
+            proprio['contador'] += 1
+            proprio['atualizado_em'] = time.time()
+
+    # Tabela que vai junto de cada heartbeat: {id_nodo: [geração, contador]}
+    def resumo_gossip(self):
+        with self.lock:
+            return {str(id_nodo): [membro['geracao'], membro['contador']] for id_nodo, membro in self.membros.items()}
+
+    # Junta a tabela recebida: só (geração, contador) maiores que os conhecidos contam como sinal de vida
+    def mesclar(self, gossip):
+        agora = time.time()
+        with self.lock:
+            for id_nodo, (geracao, contador) in gossip.items():
+                membro = self.membros.get(int(id_nodo))
+                if membro is None or int(id_nodo) == self.id_proprio:
+                    continue
+                if (geracao, contador) > (membro['geracao'], membro['contador']):
+                    membro['geracao'] = geracao
+                    membro['contador'] = contador
+                    membro['atualizado_em'] = agora
+
+    # Média móvel do tempo de ida e volta de um heartbeat direto
+    def registrar_latencia(self, id_nodo, segundos):
+        with self.lock:
+            membro = self.membros[id_nodo]
+            anterior = membro['latencia']
+            membro['latencia'] = segundos if anterior is None else 0.7 * anterior + 0.3 * segundos
+
+    def _estado(self, id_nodo, membro, agora):
+        if id_nodo == self.id_proprio:
+            return VIVO
+        idade = agora - membro['atualizado_em']
+        if idade > self.tempo_morte:
+            return MORTO
+        if idade > self.tempo_suspeita:
+            return SUSPEITO
+        return VIVO
+
+    # Estado de um nodo: vivo, suspeito ou morto
+    def estado(self, id_nodo):
+        with self.lock:
+            return self._estado(id_nodo, self.membros[id_nodo], time.time())
+
+    # Quando o contador do nodo subiu pela última vez (timestamp)
+    def visto_em(self, id_nodo):
+        with self.lock:
+            return self.membros[id_nodo]['atualizado_em']
+
+    # Latência média em segundos (None se ainda não foi medida)
+    def latencia(self, id_nodo):
+        with self.lock:
+            return self.membros[id_nodo]['latencia']
+
+    # Separa os outros nodos pelo estado: {'vivo': [...], 'suspeito': [...], 'morto': [...]}
+    def por_estado(self):
+        agora = time.time()
+        resultado = {VIVO: [], SUSPEITO: [], MORTO: []}
+        with self.lock:
+            for id_nodo, membro in self.membros.items():
+                if id_nodo != self.id_proprio:
+                    resultado[self._estado(id_nodo, membro, agora)].append(id_nodo)
+        return resultado
+
+    # Visão completa para consulta (JSON)
+    def visao(self):
+        agora = time.time()
+        with self.lock:
+            return [
+                {
+                    'id': id_nodo,
+                    'state': self._estado(id_nodo, membro, agora),
+                    'generation': membro['geracao'],
+                    'heartbeat': membro['contador'],
+                    'seconds_since_update': round(agora - membro['atualizado_em'], 3),
+                    'latency_ms': None if membro['latencia'] is None else round(membro['latencia'] * 1000, 3)
+                }
+                for id_nodo, membro in sorted(self.membros.items())
+            ]
@@ -0,0 +1,1012 @@
+#!/usr/bin/env python3
+"""
+Backends de metadados do ShardBox
+Guardam os arquivos, a localização dos fragmentos e o armazenamento por nodo
+"""
+
+import os
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import groupby
+from pathlib import Path
+from threading import Lock, local
+
+from anel import AnelConsistente
+
+try:
+    import fcntl
+except ImportError:  # Windows: fica só o lock entre threads
+    fcntl = None
+
+
+# Ordens aceitas na listagem e a posição do valor de ordenação em (id_arquivo, nome, tamanho)
+ORDENS_LISTAGEM = {'id': 0, 'nome': 1, 'tamanho': 2}
+
+# Maior caractere Unicode: 'prefixo' <= nome < 'prefixo' + FIM_PREFIXO são os nomes que começam com o prefixo
+FIM_PREFIXO = '\U0010ffff'
+
+
+# Soma um arquivo ao índice de chunks: fragmentos com 'hash' contam uma referência por
+# ocorrência e só ocupam espaço no nodo se o chunk ainda não estava lá
+def _contabilizar_fragmentos(fragmentos, chunks):
+    """Atualiza 'chunks' ({hash: {tamanho, refs, nodos}}) no lugar e retorna {id_nodo: bytes acrescentados}"""
+    deltas = {}
+    ocorrencias = {}
+    for frag in fragmentos:
+        id_nodo = frag['id_nodo']
+        hash_chunk = frag.get('hash')
+        if hash_chunk is None:
+            deltas[id_nodo] = deltas.get(id_nodo, 0) + frag['tamanho']
+            continue
+        chunk = chunks.setdefault(hash_chunk, {'tamanho': frag['tamanho'], 'refs': 0, 'nodos': []})
+        if id_nodo not in chunk['nodos']:
+            chunk['nodos'].append(id_nodo)
+            deltas[id_nodo] = deltas.get(id_nodo, 0) + frag['tamanho']
+        ocorrencias.setdefault(hash_chunk, set()).add(frag['id_fragmento'])
+    for hash_chunk, ids_fragmentos in ocorrencias.items():
+        chunks[hash_chunk]['refs'] += len(ids_fragmentos)
+    return deltas
+
+
+# Desconta um arquivo do índice de chunks: chunks sem referência saem do índice
+def _descontabilizar_fragmentos(fragmentos, chunks):
+    """Atualiza 'chunks' no lugar e retorna ({id_nodo: bytes liberados (negativo)}, fragmentos para apagar)"""
+    deltas = {}
+    apagar = []
+    ocorrencias = {}
+    for frag in fragmentos:
+        hash_chunk = frag.get('hash')
+        if hash_chunk is None:
+            deltas[frag['id_nodo']] = deltas.get(frag['id_nodo'], 0) - frag['tamanho']
+            apagar.append(frag)
+        else:
+            ocorrencias.setdefault(hash_chunk, set()).add(frag['id_fragmento'])
+    for hash_chunk, ids_fragmentos in ocorrencias.items():
+        chunk = chunks.get(hash_chunk)
+        if chunk is None:
+            continue
+        chunk['refs'] -= len(ids_fragmentos)
+        if chunk['refs'] <= 0:
+            _marcar_sem_uso(hash_chunk, chunk, min(ids_fragmentos), deltas, apagar)
+    return deltas, apagar
+
+
+# Chunk que ficou sem referência: sai da contabilidade dos nodos, mas continua no índice com
+# refs 0 (a marca) até cada nodo apagar o seu arquivo em coletar_chunk
+def _marcar_sem_uso(hash_chunk, chunk, id_fragmento, deltas, apagar):
+    for id_nodo in chunk['nodos']:
+        deltas[id_nodo] = deltas.get(id_nodo, 0) - chunk['tamanho']
+        apagar.append({'id_nodo': id_nodo, 'id_fragmento': id_fragmento,
+                       'tamanho': chunk['tamanho'], 'hash': hash_chunk})
+
+
+# Soma uma referência provisória a cada chunk de um upload, na mesma transação em que o índice é
+# consultado: enquanto o upload não terminar, um delete concorrente não zera as referências dele
+# Um chunk marcado (refs 0) pode já estar sendo apagado: perde os nodos e o upload grava o conteúdo de novo
+def _reservar_chunks(tamanhos, chunks):
+    """Atualiza 'chunks' no lugar e retorna {hash: [id_nodo, ...]} dos chunks que podem ser reaproveitados"""
+    conhecidos = {}
+    for hash_chunk, tamanho in tamanhos.items():
+        chunk = chunks.setdefault(hash_chunk, {'tamanho': tamanho, 'refs': 0, 'nodos': []})
+        if chunk['refs'] <= 0:
+            chunk['refs'], chunk['nodos'] = 0, []
+        elif chunk['nodos']:
+            conhecidos[hash_chunk] = list(chunk['nodos'])
+        chunk['refs'] += 1
+    return conhecidos
+
+
+# Devolve as referências provisórias de _reservar_chunks (o upload já gravou as suas ou falhou)
+def _liberar_chunks(hashes, chunks):
+    """Atualiza 'chunks' no lugar e retorna ({id_nodo: bytes liberados (negativo)}, fragmentos para apagar)"""
+    deltas = {}
+    apagar = []
+    for hash_chunk in hashes:
+        chunk = chunks.get(hash_chunk)
+        if chunk is None:
+            continue
+        chunk['refs'] -= 1
+        if chunk['refs'] <= 0:
+            _marcar_sem_uso(hash_chunk, chunk, 0, deltas, apagar)
+    return deltas, apagar
+
+
+# Coleta o arquivo de um chunk sem referência num nodo. Roda na transação do índice: um upload que
+# reservou o chunk depois da marca não perde o arquivo que está gravando
+def _coletar_chunk(hash_chunk, id_nodo, chunks, apagar):
+    """Retorna None se o chunk voltou a ser usado, senão o resultado de apagar()"""
+    chunk = chunks.get(hash_chunk)
+    if chunk is not None and chunk['refs'] > 0:
+        return None
+    resultado = apagar()
+    if chunk is not None and id_nodo in chunk['nodos']:
+        chunk['nodos'].remove(id_nodo)
+    return resultado
+
+
+# Chunks que saem do índice: sem referência e sem nenhum arquivo para apagar
+def _chunk_descartavel(chunk):
+    return chunk['refs'] <= 0 and not chunk['nodos']
+
+
+# Agrupa as réplicas de um arquivo por fragmento e devolve as que estão em 'id_nodo'
+def _replicas_no_nodo(id_arquivo, fragmentos, id_nodo):
+    """Retorna [{id_arquivo, id_fragmento, tamanho, nodos, hash?, checksum?}] dos fragmentos com réplica em 'id_nodo'"""
+    por_fragmento = {}
+    for frag in fragmentos:
+        por_fragmento.setdefault(frag['id_fragmento'], []).append(frag)
+    resultado = []
+    for id_fragmento, replicas in por_fragmento.items():
+        nodos = [frag['id_nodo'] for frag in replicas]
+        if id_nodo not in nodos:
+            continue
+        item = {'id_arquivo': int(id_arquivo), 'id_fragmento': id_fragmento, 'tamanho': replicas[0]['tamanho'], 'nodos': nodos}
+        for chave in ('hash', 'checksum'):
+            if replicas[0].get(chave):
+                item[chave] = replicas[0][chave]
+        resultado.append(item)
+    return resultado
+
+
+# Interface comum dos backends de metadados
+class BackendMetadados:
+    """Interface dos backends de metadados"""
+
+    def __init__(self, tamanho_lote_ids=1):
+        # cada processo reserva uma faixa de IDs por vez e distribui localmente
+        self.tamanho_lote_ids = max(1, tamanho_lote_ids)
+        self.lock_ids = Lock()
+        self.faixa_ids = iter(())
+
+    # Gera um novo ID de arquivo a partir da faixa reservada por este processo
+    def proximo_id(self):
+        """Retorna um novo ID de arquivo"""
+        with self.lock_ids:
+            id_arquivo = next(self.faixa_ids, None)
+            if id_arquivo is None:
+                inicio = self.reservar_ids(self.tamanho_lote_ids)
+                self.faixa_ids = iter(range(inicio + 1, inicio + self.tamanho_lote_ids))
+                id_arquivo = inicio
+            return id_arquivo
+
+    # Reserva atomicamente uma faixa de IDs no banco compartilhado
+    def reservar_ids(self, quantidade):
+        """Avança o último ID em 'quantidade' e retorna o primeiro ID da faixa"""
+        raise NotImplementedError
+
+    # Busca um arquivo pelo ID (consulta pontual)
+    def obter_arquivo(self, id_arquivo):
+        """Retorna {nome, tamanho, fragmentos} ou None"""
+        raise NotImplementedError
+
+    # Grava um arquivo e soma o tamanho dos fragmentos no armazenamento dos nodos
+    def salvar_arquivo(self, id_arquivo, info_arquivo):
+        """Grava os metadados de um único arquivo"""
+        raise NotImplementedError
+
+    # Remove um arquivo, descontando as referências dos chunks e o armazenamento dos nodos
+    def remover_arquivo(self, id_arquivo):
+        """Retorna os fragmentos que não são mais usados (para apagar dos nodos) ou None se o arquivo não existe"""
+        raise NotImplementedError
+
+    # Consulta o índice de chunks deduplicados
+    def obter_chunks(self, hashes):
+        """Retorna {hash: [id_nodo, ...]} dos chunks já armazenados"""
+        raise NotImplementedError
+
+    # Reserva os chunks de um upload em andamento (ver _reservar_chunks)
+    def reservar_chunks(self, tamanhos):
+        """Recebe {hash: tamanho} e retorna {hash: [id_nodo, ...]} dos chunks que o upload pode reaproveitar"""
+        raise NotImplementedError
+
+    # Devolve as reservas de reservar_chunks depois de salvar_arquivo (ou da falha do upload)
+    def liberar_chunks(self, hashes):
+        """Retorna os fragmentos que ficaram sem uso (para apagar dos nodos)"""
+        raise NotImplementedError
+
+    # Apaga o arquivo de um chunk sem uso num nodo, se nenhum upload o reservou de novo
+    def coletar_chunk(self, hash_chunk, id_nodo, apagar):
+        """Chama apagar() dentro da transação; retorna None se o chunk voltou a ser usado"""
+        raise NotImplementedError
+
+    # Lista os arquivos sem carregar os fragmentos, em ordem de 'ordem' ('id', 'nome' ou 'tamanho') e depois de ID
+    # Paginação por chave: 'apos' = (valor de ordenação, id_arquivo) da última linha da página anterior
+    def listar_arquivos(self, ordem='id', decrescente=False, prefixo='', apos=None, limite=None):
+        """Retorna lista de (id_arquivo, nome, tamanho)"""
+        raise NotImplementedError
+
+    # Fragmentos que têm uma réplica num nodo (usado no reparo)
+    def fragmentos_do_nodo(self, id_nodo):
+        """Retorna [{id_arquivo, id_fragmento, tamanho, nodos, hash?, checksum?}]"""
+        raise NotImplementedError
+
+    # Troca o nodo de uma réplica e ajusta o armazenamento dos dois nodos
+    # Com 'hash' a troca vale para o chunk em todos os arquivos que o usam
+    def mover_replica(self, id_arquivo, id_fragmento, id_nodo_antigo, id_nodo_novo, hash_chunk=None):
+        """Retorna o número de registros de fragmento alterados"""
+        raise NotImplementedError
+
+    # Retorna os bytes armazenados por nodo
+    def armazenamento_nodos(self):
+        """Retorna {id_nodo: bytes}"""
+        raise NotImplementedError
+
+    # Libera recursos do backend
+    def fechar(self):
+        """Fecha o backend"""
+        pass
+
+
+# Backend legado: um único arquivo JSON relido e reescrito a cada acesso
+class BackendJSON(BackendMetadados):
+    """Backend de metadados em JSON (formato original do files_db.json)"""
+
+    def __init__(self, caminho, ids_nodos, tamanho_lote_ids=1):
+        super().__init__(tamanho_lote_ids)
+        self.caminho = Path(caminho)
+        self.caminho_lock = self.caminho.with_name(self.caminho.name + '.lock')
+        self.lock_bd = Lock()
+
+        with self._transacao():
+            if not self.caminho.exists():
+                dados_iniciais = {
+                    'ultimo_id': 0,
+                    'arquivos': {},  # {id_arquivo: {nome, tamanho, fragmentos: [{id_nodo, id_fragmento, tamanho}]}}
+                    'armazenamento_nodo': {i: 0 for i in ids_nodos},  # Bytes armazenados por nodo
+                    'chunks': {}  # {hash: {tamanho, refs, nodos}} índice dos chunks deduplicados
+                }
+                self._escrever(dados_iniciais)
+
+    # Lock entre threads + flock no arquivo .lock para serializar os processos
+    @contextmanager
+    def _transacao(self):
+        with self.lock_bd, open(self.caminho_lock, 'a') as arquivo_lock:
+            if fcntl:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    # A troca por rename é atômica, então a leitura não precisa do lock
+    def _ler(self):
+        with open(self.caminho, 'r') as f:
+            return json.load(f)
+
+    # Escreve num temporário e troca por rename: nunca deixa o JSON pela metade
+    def _escrever(self, dados):
+        temporario = self.caminho.with_name(f'{self.caminho.name}.{os.getpid()}.tmp')
+        with open(temporario, 'w') as f:
+            json.dump(dados, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho)
+
+    def reservar_ids(self, quantidade):
+        with self._transacao():
+            bd = self._ler()
+            inicio = bd['ultimo_id'] + 1
+            bd['ultimo_id'] += quantidade
+            self._escrever(bd)
+            return inicio
+
+    def obter_arquivo(self, id_arquivo):
+        return self._ler()['arquivos'].get(str(id_arquivo))
+
+    @staticmethod
+    def _aplicar_deltas(bd, deltas):
+        for id_nodo, delta in deltas.items():
+            chave = str(id_nodo)
+            bd['armazenamento_nodo'][chave] = bd['armazenamento_nodo'].get(chave, 0) + delta
+
+    def salvar_arquivo(self, id_arquivo, info_arquivo):
+        with self._transacao():
+            bd = self._ler()
+            deltas = _contabilizar_fragmentos(info_arquivo['fragmentos'], bd.setdefault('chunks', {}))
+            self._aplicar_deltas(bd, deltas)
+            bd['arquivos'][str(id_arquivo)] = info_arquivo
+            self._escrever(bd)
+
+    def remover_arquivo(self, id_arquivo):
+        with self._transacao():
+            bd = self._ler()
+            info_arquivo = bd['arquivos'].pop(str(id_arquivo), None)
+            if info_arquivo is None:
+                return None
+            deltas, apagar = _descontabilizar_fragmentos(info_arquivo['fragmentos'], bd.setdefault('chunks', {}))
+            self._aplicar_deltas(bd, deltas)
+            self._escrever(bd)
+            return apagar
+
+    def obter_chunks(self, hashes):
+        chunks = self._ler().get('chunks', {})
+        return {h: chunks[h]['nodos'] for h in hashes if h in chunks and chunks[h]['refs'] > 0}
+
+    def reservar_chunks(self, tamanhos):
+        with self._transacao():
+            bd = self._ler()
+            conhecidos = _reservar_chunks(tamanhos, bd.setdefault('chunks', {}))
+            self._escrever(bd)
+            return conhecidos
+
+    def liberar_chunks(self, hashes):
+        with self._transacao():
+            bd = self._ler()
+            chunks = bd.setdefault('chunks', {})
+            deltas, apagar = _liberar_chunks(hashes, chunks)
+            for hash_chunk in hashes:
+                if hash_chunk in chunks and _chunk_descartavel(chunks[hash_chunk]):
+                    del chunks[hash_chunk]
+            self._aplicar_deltas(bd, deltas)
+            self._escrever(bd)
+            return apagar
+
+    def coletar_chunk(self, hash_chunk, id_nodo, apagar):
+        with self._transacao():
+            bd = self._ler()
+            chunks = bd.setdefault('chunks', {})
+            resultado = _coletar_chunk(hash_chunk, id_nodo, chunks, apagar)
+            if resultado is not None and hash_chunk in chunks:
+                if _chunk_descartavel(chunks[hash_chunk]):
+                    del chunks[hash_chunk]
+                self._escrever(bd)
+            return resultado
+
+    # Sem índice: filtra e ordena o banco inteiro a cada página
+    def listar_arquivos(self, ordem='id', decrescente=False, prefixo='', apos=None, limite=None):
+        posicao = ORDENS_LISTAGEM[ordem]
+        chave = lambda linha: (linha[posicao], linha[0])
+        linhas = [
+            (int(id_arquivo), info['nome'], info['tamanho']) for id_arquivo, info in self._ler()['arquivos'].items()
+            if info['nome'].startswith(prefixo)
+        ]
+        if apos is not None:
+            apos = tuple(apos)
+            linhas = [linha for linha in linhas if (chave(linha) < apos if decrescente else chave(linha) > apos)]
+        linhas.sort(key=chave, reverse=decrescente)
+        return linhas if limite is None else linhas[:limite]
+
+    def fragmentos_do_nodo(self, id_nodo):
+        resultado = []
+        for id_arquivo, info in self._ler()['arquivos'].items():
+            resultado.extend(_replicas_no_nodo(id_arquivo, info['fragmentos'], id_nodo))
+        return resultado
+
+    def mover_replica(self, id_arquivo, id_fragmento, id_nodo_antigo, id_nodo_novo, hash_chunk=None):
+        with self._transacao():
+            bd = self._ler()
+            if hash_chunk:
+                arquivos = bd['arquivos'].values()
+            else:
+                arquivos = [bd['arquivos'].get(str(id_arquivo), {'fragmentos': []})]
+
+            movidas = 0
+            tamanho = 0
+            for info in arquivos:
+                for frag in info['fragmentos']:
+                    if frag['id_nodo'] != id_nodo_antigo:
+                        continue
+                    if frag.get('hash') == hash_chunk if hash_chunk else frag['id_fragmento'] == id_fragmento:
+                        frag['id_nodo'] = id_nodo_novo
+                        tamanho = frag['tamanho']
+                        movidas += 1
+            if not movidas:
+                return 0
+
+            deltas = {id_nodo_antigo: -tamanho, id_nodo_novo: tamanho}
+            chunk = bd.setdefault('chunks', {}).get(hash_chunk) if hash_chunk else None
+            if chunk is not None:
+                if id_nodo_novo in chunk['nodos']:
+                    deltas[id_nodo_novo] = 0
+                chunk['nodos'] = [n for n in chunk['nodos'] if n not in (id_nodo_antigo, id_nodo_novo)] + [id_nodo_novo]
+            self._aplicar_deltas(bd, deltas)
+            self._escrever(bd)
+            return movidas
+
+    def armazenamento_nodos(self):
+        bd = self._ler()
+        return {int(id_nodo): total for id_nodo, total in bd['armazenamento_nodo'].items()}
+
+
+# Backend SQLite em modo WAL com índices por arquivo e por nodo
+class BackendSQLite(BackendMetadados):
+    """Backend de metadados em SQLite (consultas pontuais e escrita incremental)"""
+
+    ESQUEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS arquivos (
+            id_arquivo INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            extra TEXT
+        );
+        CREATE TABLE IF NOT EXISTS fragmentos (
+            id_arquivo INTEGER NOT NULL,
+            posicao INTEGER NOT NULL,
+            id_fragmento INTEGER NOT NULL,
+            id_nodo INTEGER NOT NULL,
+            tamanho INTEGER NOT NULL,
+            extra TEXT,
+            PRIMARY KEY (id_arquivo, posicao)
+        );
+        CREATE INDEX IF NOT EXISTS idx_arquivos_nome ON arquivos (nome, id_arquivo);
+        CREATE INDEX IF NOT EXISTS idx_arquivos_tamanho ON arquivos (tamanho, id_arquivo);
+        CREATE INDEX IF NOT EXISTS idx_fragmentos_nodo ON fragmentos (id_nodo);
+        CREATE TABLE IF NOT EXISTS armazenamento_nodo (
+            id_nodo INTEGER PRIMARY KEY,
+            bytes INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            hash TEXT PRIMARY KEY,
+            tamanho INTEGER NOT NULL,
+            refs INTEGER NOT NULL,
+            nodos TEXT NOT NULL
+        );
+    '''
+
+    # Campos que têm coluna própria, o resto vai serializado em 'extra'
+    CAMPOS_ARQUIVO = ('nome', 'tamanho', 'fragmentos')
+    CAMPOS_FRAGMENTO = ('id_nodo', 'id_fragmento', 'tamanho')
+
+    def __init__(self, caminho, ids_nodos, caminho_json_legado=None, tamanho_lote_ids=1, timeout=30.0):
+        super().__init__(tamanho_lote_ids)
+        self.caminho = Path(caminho)
+        self.lock_bd = Lock()
+
+        # uma conexão por processo, serializada pelo lock (as threads do Flask compartilham)
+        # isolation_level=None: as transações são abertas explicitamente em _transacao
+        self.conexao = sqlite3.connect(
+            str(self.caminho), check_same_thread=False, isolation_level=None, timeout=timeout
+        )
+        self.conexao.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        # a troca para WAL não espera pelo busy_timeout quando vários processos abrem o banco ao mesmo tempo
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                self.conexao.execute('PRAGMA journal_mode=WAL')
+                break
+            except sqlite3.OperationalError:
+                if time.monotonic() > limite:
+                    raise
+                time.sleep(0.05)
+        self.conexao.execute('PRAGMA synchronous=NORMAL')
+
+        with self._transacao():
+            for comando in self.ESQUEMA.split(';'):
+                if comando.strip():
+                    self.conexao.execute(comando)
+            self.conexao.execute("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('ultimo_id', 0)")
+            self.conexao.executemany(
+                'INSERT OR IGNORE INTO armazenamento_nodo (id_nodo, bytes) VALUES (?, 0)',
+                [(i,) for i in ids_nodos]
+            )
+
+        # importa o files_db.json antigo na primeira execução
+        if caminho_json_legado and Path(caminho_json_legado).exists() and self._vazio():
+            self.importar_json(caminho_json_legado)
+
+    # BEGIN IMMEDIATE pega o lock de escrita já no início: leitura-modificação-escrita
+    # não intercala com outros processos. Leituras usam BEGIN (snapshot consistente).
+    @contextmanager
+    def _transacao(self, modo='IMMEDIATE'):
+        with self.lock_bd:
+            self.conexao.execute(f'BEGIN {modo}')
+            try:
+                yield self.conexao
+            except BaseException:
+                self.conexao.execute('ROLLBACK')
+                raise
+            self.conexao.execute('COMMIT')
+
+    def _vazio(self):
+        with self.lock_bd:
+            linha = self.conexao.execute('SELECT 1 FROM arquivos LIMIT 1').fetchone()
+        return linha is None
+
+    # Importa um banco no layout do files_db.json
+    def importar_json(self, caminho_json):
+        """Importa arquivos, último ID e armazenamento de um files_db.json"""
+        with open(caminho_json, 'r') as f:
+            bd = json.load(f)
+
+        with self._transacao():
+            for id_arquivo, info_arquivo in bd.get('arquivos', {}).items():
+                self._inserir_arquivo(int(id_arquivo), info_arquivo)
+            for id_nodo, total in bd.get('armazenamento_nodo', {}).items():
+                self.conexao.execute(
+                    'INSERT INTO armazenamento_nodo (id_nodo, bytes) VALUES (?, ?) '
+                    'ON CONFLICT (id_nodo) DO UPDATE SET bytes = excluded.bytes',
+                    (int(id_nodo), total)
+                )
+            self.conexao.execute(
+                "UPDATE meta SET valor = MAX(valor, ?) WHERE chave = 'ultimo_id'",
+                (bd.get('ultimo_id', 0),)
+            )
+
+    @staticmethod
+    def _extra(dados, campos):
+        resto = {k: v for k, v in dados.items() if k not in campos}
+        return json.dumps(resto) if resto else None
+
+    def _inserir_arquivo(self, id_arquivo, info_arquivo):
+        self.conexao.execute('DELETE FROM fragmentos WHERE id_arquivo = ?', (id_arquivo,))
+        self.conexao.execute(
+            'INSERT OR REPLACE INTO arquivos (id_arquivo, nome, tamanho, extra) VALUES (?, ?, ?, ?)',
+            (id_arquivo, info_arquivo['nome'], info_arquivo['tamanho'],
+             self._extra(info_arquivo, self.CAMPOS_ARQUIVO))
+        )
+        self.conexao.executemany(
+            'INSERT INTO fragmentos (id_arquivo, posicao, id_fragmento, id_nodo, tamanho, extra) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (id_arquivo, posicao, frag['id_fragmento'], frag['id_nodo'], frag['tamanho'],
+                 self._extra(frag, self.CAMPOS_FRAGMENTO))
+                for posicao, frag in enumerate(info_arquivo['fragmentos'])
+            ]
+        )
+
+    def reservar_ids(self, quantidade):
+        with self._transacao():
+            self.conexao.execute("UPDATE meta SET valor = valor + ? WHERE chave = 'ultimo_id'", (quantidade,))
+            ultimo = self.conexao.execute("SELECT valor FROM meta WHERE chave = 'ultimo_id'").fetchone()[0]
+            return ultimo - quantidade + 1
+
+    def obter_arquivo(self, id_arquivo):
+        with self._transacao('DEFERRED'):
+            return self._ler_arquivo(id_arquivo)
+
+    # Lê um arquivo e os fragmentos dele (dentro de uma transação já aberta)
+    def _ler_arquivo(self, id_arquivo):
+        linha = self.conexao.execute(
+            'SELECT nome, tamanho, extra FROM arquivos WHERE id_arquivo = ?', (int(id_arquivo),)
+        ).fetchone()
+        if linha is None:
+            return None
+        linhas_fragmentos = self.conexao.execute(
+            'SELECT id_nodo, id_fragmento, tamanho, extra FROM fragmentos '
+            'WHERE id_arquivo = ? ORDER BY posicao', (int(id_arquivo),)
+        ).fetchall()
+
+        nome, tamanho, extra = linha
+        info_arquivo = json.loads(extra) if extra else {}
+        info_arquivo.update({'nome': nome, 'tamanho': tamanho, 'fragmentos': []})
+        for id_nodo, id_fragmento, tamanho_fragmento, extra_fragmento in linhas_fragmentos:
+            frag = json.loads(extra_fragmento) if extra_fragmento else {}
+            frag.update({'id_nodo': id_nodo, 'id_fragmento': id_fragmento, 'tamanho': tamanho_fragmento})
+            info_arquivo['fragmentos'].append(frag)
+        return info_arquivo
+
+    # Carrega as linhas do índice de chunks usadas pelos fragmentos
+    def _carregar_chunks(self, fragmentos):
+        hashes = list({frag['hash'] for frag in fragmentos if 'hash' in frag})
+        chunks = {}
+        for inicio in range(0, len(hashes), 500):
+            lote = hashes[inicio:inicio + 500]
+            linhas = self.conexao.execute(
+                f'SELECT hash, tamanho, refs, nodos FROM chunks WHERE hash IN ({",".join("?" * len(lote))})', lote
+            ).fetchall()
+            for hash_chunk, tamanho, refs, nodos in linhas:
+                chunks[hash_chunk] = {'tamanho': tamanho, 'refs': refs, 'nodos': json.loads(nodos)}
+        return chunks
+
+    # Os chunks marcados (refs 0) continuam na tabela até o último nodo apagar o arquivo
+    def _gravar_chunks(self, chunks):
+        self.conexao.executemany('DELETE FROM chunks WHERE hash = ?',
+                                 [(h,) for h, chunk in chunks.items() if _chunk_descartavel(chunk)])
+        self.conexao.executemany(
+            'INSERT OR REPLACE INTO chunks (hash, tamanho, refs, nodos) VALUES (?, ?, ?, ?)',
+            [(h, chunk['tamanho'], max(chunk['refs'], 0), json.dumps(chunk['nodos']))
+             for h, chunk in chunks.items() if not _chunk_descartavel(chunk)]
+        )
+
+    def _aplicar_deltas(self, deltas):
+        self.conexao.executemany(
+            'INSERT INTO armazenamento_nodo (id_nodo, bytes) VALUES (?, ?) '
+            'ON CONFLICT (id_nodo) DO UPDATE SET bytes = bytes + excluded.bytes',
+            list(deltas.items())
+        )
+
+    def salvar_arquivo(self, id_arquivo, info_arquivo):
+        with self._transacao():
+            self._inserir_arquivo(int(id_arquivo), info_arquivo)
+            chunks = self._carregar_chunks(info_arquivo['fragmentos'])
+            self._aplicar_deltas(_contabilizar_fragmentos(info_arquivo['fragmentos'], chunks))
+            self._gravar_chunks(chunks)
+
+    # A leitura dos fragmentos fica na mesma transação do DELETE: um mover_replica do reparo
+    # não pode trocar o nodo de uma réplica entre a leitura e a remoção
+    def remover_arquivo(self, id_arquivo):
+        with self._transacao():
+            info_arquivo = self._ler_arquivo(id_arquivo)
+            if info_arquivo is None:
+                return None
+            self.conexao.execute('DELETE FROM arquivos WHERE id_arquivo = ?', (int(id_arquivo),))
+            self.conexao.execute('DELETE FROM fragmentos WHERE id_arquivo = ?', (int(id_arquivo),))
+            chunks = self._carregar_chunks(info_arquivo['fragmentos'])
+            deltas, apagar = _descontabilizar_fragmentos(info_arquivo['fragmentos'], chunks)
+            self._aplicar_deltas(deltas)
+            self._gravar_chunks(chunks)
+            return apagar
+
+    def obter_chunks(self, hashes):
+        with self._transacao('DEFERRED'):
+            chunks = self._carregar_chunks([{'hash': h} for h in hashes])
+        return {h: chunk['nodos'] for h, chunk in chunks.items() if chunk['refs'] > 0}
+
+    def reservar_chunks(self, tamanhos):
+        with self._transacao():
+            chunks = self._carregar_chunks([{'hash': h} for h in tamanhos])
+            conhecidos = _reservar_chunks(tamanhos, chunks)
+            self._gravar_chunks(chunks)
+            return conhecidos
+
+    def liberar_chunks(self, hashes):
+        with self._transacao():
+            chunks = self._carregar_chunks([{'hash': h} for h in hashes])
+            deltas, apagar = _liberar_chunks(hashes, chunks)
+            self._aplicar_deltas(deltas)
+            self._gravar_chunks(chunks)
+            return apagar
+
+    def coletar_chunk(self, hash_chunk, id_nodo, apagar):
+        with self._transacao():
+            chunks = self._carregar_chunks([{'hash': hash_chunk}])
+            resultado = _coletar_chunk(hash_chunk, id_nodo, chunks, apagar)
+            if resultado is not None:
+                self._gravar_chunks(chunks)
+            return resultado
+
+    # Cada página é uma busca por faixa num índice (chave primária, idx_arquivos_nome ou idx_arquivos_tamanho)
+    def listar_arquivos(self, ordem='id', decrescente=False, prefixo='', apos=None, limite=None):
+        coluna = {'id': 'id_arquivo', 'nome': 'nome', 'tamanho': 'tamanho'}[ordem]
+        direcao, comparacao = ('DESC', '<') if decrescente else ('ASC', '>')
+        condicoes = []
+        parametros = []
+        if prefixo:
+            condicoes.append('nome >= ? AND nome < ?')
+            parametros += [prefixo, prefixo + FIM_PREFIXO]
+        if apos is not None and coluna == 'id_arquivo':
+            condicoes.append(f'id_arquivo {comparacao} ?')
+            parametros.append(apos[1])
+        elif apos is not None:
+            condicoes.append(f'({coluna}, id_arquivo) {comparacao} (?, ?)')
+            parametros += list(apos)
+        consulta = 'SELECT id_arquivo, nome, tamanho FROM arquivos'
+        if condicoes:
+            consulta += ' WHERE ' + ' AND '.join(condicoes)
+        consulta += f' ORDER BY {coluna} {direcao}' if coluna == 'id_arquivo' else f' ORDER BY {coluna} {direcao}, id_arquivo {direcao}'
+        if limite is not None:
+            consulta += ' LIMIT ?'
+            parametros.append(limite)
+        with self.lock_bd:
+            return self.conexao.execute(consulta, parametros).fetchall()
+
+    def armazenamento_nodos(self):
+        with self.lock_bd:
+            return dict(self.conexao.execute('SELECT id_nodo, bytes FROM armazenamento_nodo').fetchall())
+
+    def fragmentos_do_nodo(self, id_nodo):
+        # todas as réplicas dos fragmentos que têm uma cópia no nodo (índice idx_fragmentos_nodo)
+        with self._transacao('DEFERRED'):
+            linhas = self.conexao.execute(
+                'SELECT r.id_arquivo, r.id_nodo, r.id_fragmento, r.tamanho, r.extra FROM fragmentos f '
+                'JOIN fragmentos r ON r.id_arquivo = f.id_arquivo AND r.id_fragmento = f.id_fragmento '
+                'WHERE f.id_nodo = ? ORDER BY r.id_arquivo, r.posicao',
+                (id_nodo,)
+            ).fetchall()
+
+        resultado = []
+        for id_arquivo, grupo in groupby(linhas, key=lambda linha: linha[0]):
+            fragmentos = []
+            for _, id_nodo_replica, id_fragmento, tamanho, extra in grupo:
+                frag = json.loads(extra) if extra else {}
+                frag.update(id_nodo=id_nodo_replica, id_fragmento=id_fragmento, tamanho=tamanho)
+                fragmentos.append(frag)
+            resultado.extend(_replicas_no_nodo(id_arquivo, fragmentos, id_nodo))
+        return resultado
+
+    def mover_replica(self, id_arquivo, id_fragmento, id_nodo_antigo, id_nodo_novo, hash_chunk=None):
+        with self._transacao():
+            if hash_chunk:
+                linhas = self.conexao.execute(
+                    "SELECT id_arquivo, posicao, tamanho FROM fragmentos "
+                    "WHERE id_nodo = ? AND json_extract(extra, '$.hash') = ?",
+                    (id_nodo_antigo, hash_chunk)
+                ).fetchall()
+            else:
+                linhas = self.conexao.execute(
+                    'SELECT id_arquivo, posicao, tamanho FROM fragmentos '
+                    'WHERE id_arquivo = ? AND id_fragmento = ? AND id_nodo = ?',
+                    (int(id_arquivo), id_fragmento, id_nodo_antigo)
+                ).fetchall()
+            if not linhas:
+                return 0
+
+            self.conexao.executemany(
+                'UPDATE fragmentos SET id_nodo = ? WHERE id_arquivo = ? AND posicao = ?',
+                [(id_nodo_novo, id_arq, posicao) for id_arq, posicao, _ in linhas]
+            )
+            tamanho = linhas[0][2]
+            deltas = {id_nodo_antigo: -tamanho, id_nodo_novo: tamanho}
+            if hash_chunk:
+                chunks = self._carregar_chunks([{'hash': hash_chunk}])
+                chunk = chunks.get(hash_chunk)
+                if chunk is not None:
+                    if id_nodo_novo in chunk['nodos']:
+                        deltas[id_nodo_novo] = 0
+                    chunk['nodos'] = [n for n in chunk['nodos'] if n not in (id_nodo_antigo, id_nodo_novo)] + [id_nodo_novo]
+                    self._gravar_chunks(chunks)
+            self._aplicar_deltas(deltas)
+            return len(linhas)
+
+    def fechar(self):
+        with self.lock_bd:
+            self.conexao.close()
+
+
+# Parte local dos metadados distribuídos: os arquivos dos quais este nodo é dono
+# Cada arquivo é contabilizado em armazenamento_nodo por um só dono (o 'contabilizado_por' da entrada),
+# então somar as tabelas de todos os nodos dá o armazenamento do cluster sem contar réplica duas vezes
+class ShardLocal(BackendSQLite):
+    """SQLite com os arquivos de um nodo; só contabiliza o armazenamento quando pedido"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.contexto = local()
+
+    # Executa uma operação do backend com (ou sem) contabilidade de armazenamento
+    def executar(self, operacao, argumentos, contabilizar=False):
+        """Retorna o resultado da operação"""
+        self.contexto.contabilizar = contabilizar
+        try:
+            return getattr(self, operacao)(*argumentos)
+        finally:
+            self.contexto.contabilizar = False
+
+    def _aplicar_deltas(self, deltas):
+        if getattr(self.contexto, 'contabilizar', False):
+            super()._aplicar_deltas(deltas)
+
+
+# Metadados repartidos entre os nodos por hashing consistente sobre o ID do arquivo
+# Os 'replicas' donos de um arquivo guardam a entrada dele no próprio ShardLocal; leituras vão ao
+# primeiro dono vivo (nenhuma chamada se o próprio nodo for dono) e escritas valem com a maioria dos donos
+# Listagens e consultas do reparo juntam as respostas de todos os nodos vivos
+class BackendDistribuido(BackendMetadados):
+    """Backend de metadados sem banco compartilhado"""
+
+    # Operações que um nodo atende para os outros (rota /metadata/<operacao>)
+    OPERACOES = ('obter_arquivo', 'salvar_arquivo', 'remover_arquivo', 'listar_arquivos',
+                 'fragmentos_do_nodo', 'mover_replica', 'armazenamento_nodos', 'arquivos_do_dono')
+
+    def __init__(self, id_nodo, ids_nodos, caminho, chamar, vivos, replicas=3, virtuais=64,
+                 tamanho_lote_ids=1, validade_armazenamento=2.0):
+        super().__init__(tamanho_lote_ids)
+        self.id_nodo = id_nodo
+        self.ids_nodos = list(ids_nodos)
+        self.anel = AnelConsistente(self.ids_nodos, virtuais)
+        self.replicas = max(1, min(replicas, len(self.ids_nodos)))
+        self.quorum = self.replicas // 2 + 1
+        self.local = ShardLocal(caminho, self.ids_nodos, tamanho_lote_ids=tamanho_lote_ids)
+        self.chamar = chamar  # chamar(id_nodo, operacao, argumentos) -> resultado; exceção se o nodo não respondeu
+        self.vivos = vivos    # vivos() -> [id_nodo] na visão do heartbeat
+        self.executor = ThreadPoolExecutor(max_workers=2 * len(self.ids_nodos), thread_name_prefix='metadados')
+        self.validade_armazenamento = validade_armazenamento
+        self.lock_armazenamento = Lock()
+        self.armazenamento = (0.0, {})  # (momento da soma, {id_nodo: bytes})
+
+    # Donos de um arquivo na ordem do anel
+    def donos(self, id_arquivo):
+        """Retorna [id_nodo]"""
+        return self.anel.donos(int(id_arquivo), self.replicas)
+
+    # Os IDs vêm do contador local intercalado pelo número de nodos: nodo 1 gera 1, 9, 17...; nodo 2 gera 2, 10, 18...
+    def proximo_id(self):
+        return (super().proximo_id() - 1) * len(self.ids_nodos) + self.id_nodo
+
+    def reservar_ids(self, quantidade):
+        return self.local.reservar_ids(quantidade)
+
+    # Atende uma operação no ShardLocal (chamada pelo próprio nodo ou pela rota /metadata/<operacao>)
+    def executar_local(self, operacao, argumentos):
+        """Retorna o resultado da operação no shard deste nodo"""
+        if operacao not in self.OPERACOES:
+            raise ValueError(f'Operação de metadados desconhecida: {operacao}')
+        if operacao == 'arquivos_do_dono':
+            return [linha[0] for linha in self.local.listar_arquivos() if argumentos[0] in self.donos(linha[0])]
+        contabilizar = False
+        if operacao == 'salvar_arquivo':
+            contabilizar = argumentos[1].get('contabilizado_por') == self.id_nodo
+        elif operacao in ('remover_arquivo', 'mover_replica'):
+            info_arquivo = self.local.obter_arquivo(argumentos[0])
+            contabilizar = info_arquivo is not None and info_arquivo.get('contabilizado_por') == self.id_nodo
+        return self.local.executar(operacao, argumentos, contabilizar)
+
+    def _executar(self, id_nodo, operacao, argumentos):
+        if id_nodo == self.id_nodo:
+            return self.executar_local(operacao, argumentos)
+        return self.chamar(id_nodo, operacao, argumentos)
+
+    # Manda a operação a vários nodos em paralelo e gera os resultados conforme chegam
+    def _espalhar(self, ids_nodos, operacao, argumentos):
+        """Gera (id_nodo, resultado, erro)"""
+        futuros = {self.executor.submit(self._executar, id_nodo, operacao, argumentos): id_nodo for id_nodo in ids_nodos}
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as e:
+                yield futuros[futuro], None, e
+
+    # Escrita nos donos vivos; retorna assim que a maioria dos donos confirmou (os outros terminam sozinhos)
+    def _escrever(self, id_arquivo, operacao, argumentos):
+        """Retorna os resultados dos donos que confirmaram"""
+        vivos = set(self.vivos())
+        resultados, erros = [], []
+        for id_nodo, resultado, erro in self._espalhar([d for d in self.donos(id_arquivo) if d in vivos], operacao, argumentos):
+            if erro is None:
+                resultados.append(resultado)
+                if len(resultados) >= self.quorum:
+                    return resultados
+            else:
+                erros.append(f'nodo {id_nodo}: {erro}')
+        raise RuntimeError(f'Sem quórum de metadados para o arquivo {id_arquivo} '
+                           f'({len(resultados)} de {self.quorum}): {"; ".join(erros) or "donos fora do ar"}')
+
+    # Resposta de todos os nodos vivos (os que falharem ficam de fora)
+    def _juntar(self, operacao, argumentos):
+        return [resultado for _, resultado, erro in self._espalhar(self.vivos(), operacao, argumentos) if erro is None]
+
+    # Leitura no primeiro dono vivo (ele mesmo, se for dono); se não tiver o arquivo ou falhar, tenta o próximo
+    def obter_arquivo(self, id_arquivo):
+        donos = self.donos(id_arquivo)
+        vivos = set(self.vivos())
+        ordem = sorted(donos, key=lambda id_nodo: (id_nodo != self.id_nodo, id_nodo not in vivos))
+        respondeu = False
+        ultimo_erro = None
+        for id_nodo in ordem:
+            try:
+                info_arquivo = self._executar(id_nodo, 'obter_arquivo', [int(id_arquivo)])
+            except Exception as e:
+                ultimo_erro = e
+                continue
+            if info_arquivo is not None:
+                return info_arquivo
+            respondeu = True
+        if not respondeu and ultimo_erro is not None:
+            raise RuntimeError(f'Nenhum dono dos metadados do arquivo {id_arquivo} respondeu: {ultimo_erro}')
+        return None
+
+    # O primeiro dono vivo fica com a contabilidade do arquivo
+    def salvar_arquivo(self, id_arquivo, info_arquivo):
+        vivos = set(self.vivos())
+        donos = self.donos(id_arquivo)
+        contabilizador = next((id_nodo for id_nodo in donos if id_nodo in vivos), donos[0])
+        info_arquivo = dict(info_arquivo, contabilizado_por=contabilizador, gravado_em=time.time())
+        self._escrever(id_arquivo, 'salvar_arquivo', [int(id_arquivo), info_arquivo])
+        self._invalidar_armazenamento()
+
+    def remover_arquivo(self, id_arquivo):
+        resultados = self._escrever(id_arquivo, 'remover_arquivo', [int(id_arquivo)])
+        self._invalidar_armazenamento()
+        return next((apagar for apagar in resultados if apagar is not None), None)
+
+    # Sem índice global de chunks: a estratégia cdc não é aceita com este backend
+    def obter_chunks(self, hashes):
+        return {}
+
+    def reservar_chunks(self, tamanhos):
+        return {}
+
+    def liberar_chunks(self, hashes):
+        return []
+
+    def coletar_chunk(self, hash_chunk, id_nodo, apagar):
+        return apagar()
+
+    # Junta as páginas de cada nodo e corta no limite; um arquivo aparece uma vez mesmo vindo de vários donos
+    def listar_arquivos(self, ordem='id', decrescente=False, prefixo='', apos=None, limite=None):
+        posicao = ORDENS_LISTAGEM[ordem]
+        linhas = {}
+        for parte in self._juntar('listar_arquivos', [ordem, decrescente, prefixo, list(apos) if apos is not None else None, limite]):
+            for linha in parte:
+                linhas.setdefault(linha[0], tuple(linha))
+        ordenadas = sorted(linhas.values(), key=lambda linha: (linha[posicao], linha[0]), reverse=decrescente)
+        return ordenadas[:limite] if limite is not None else ordenadas
+
+    def fragmentos_do_nodo(self, id_nodo):
+        resultado = {}
+        for parte in self._juntar('fragmentos_do_nodo', [id_nodo]):
+            for item in parte:
+                resultado.setdefault((item['id_arquivo'], item['id_fragmento']), item)
+        return [resultado[chave] for chave in sorted(resultado)]
+
+    def mover_replica(self, id_arquivo, id_fragmento, id_nodo_antigo, id_nodo_novo, hash_chunk=None):
+        resultados = self._escrever(id_arquivo, 'mover_replica', [int(id_arquivo), id_fragmento, id_nodo_antigo, id_nodo_novo, hash_chunk])
+        self._invalidar_armazenamento()
+        return max(resultados)
+
+    # Soma das contabilidades dos nodos vivos, guardada por 'validade_armazenamento' segundos
+    # (o upload consulta a cada arquivo; os arquivos contabilizados por um nodo fora do ar ficam de fora)
+    def armazenamento_nodos(self):
+        with self.lock_armazenamento:
+            momento, total = self.armazenamento
+            if time.monotonic() - momento < self.validade_armazenamento:
+                return dict(total)
+        total = {id_nodo: 0 for id_nodo in self.ids_nodos}
+        for parte in self._juntar('armazenamento_nodos', []):
+            for id_nodo, quantidade in parte.items():
+                if int(id_nodo) in total:
+                    total[int(id_nodo)] += quantidade
+        with self.lock_armazenamento:
+            self.armazenamento = (time.monotonic(), total)
+        return dict(total)
+
+    def _invalidar_armazenamento(self):
+        with self.lock_armazenamento:
+            self.armazenamento = (0.0, self.armazenamento[1])
+
+    # Acerta o shard local com os outros donos (anti-entropia, depois de o nodo ter ficado fora do ar):
+    # copia os arquivos gravados enquanto ele estava parado e apaga os que os outros donos já removeram.
+    # Só apaga arquivo gravado há mais de 'idade_minima' segundos, que não pode mais estar a caminho dos outros donos
+    def sincronizar(self, idade_minima=60.0):
+        """Retorna (arquivos copiados, arquivos removidos)"""
+        outros = [id_nodo for id_nodo in self.vivos() if id_nodo != self.id_nodo]
+        respostas = {id_nodo: set(ids) for id_nodo, ids, erro in self._espalhar(outros, 'arquivos_do_dono', [self.id_nodo])
+                     if erro is None}
+        locais = {linha[0] for linha in self.local.listar_arquivos()}
+
+        removidos = 0
+        for id_arquivo in locais:
+            donos = [id_nodo for id_nodo in self.donos(id_arquivo) if id_nodo != self.id_nodo]
+            if not donos or not all(id_nodo in respostas for id_nodo in donos):
+                continue
+            if any(id_arquivo in respostas[id_nodo] for id_nodo in donos):
+                continue
+            info_arquivo = self.local.obter_arquivo(id_arquivo)
+            if info_arquivo is not None and time.time() - info_arquivo.get('gravado_em', 0) > idade_minima:
+                if self.executar_local('remover_arquivo', [id_arquivo]) is not None:
+                    removidos += 1
+
+        copiados = 0
+        faltando = {}
+        for id_nodo, ids in respostas.items():
+            for id_arquivo in ids - locais:
+                faltando.setdefault(id_arquivo, id_nodo)
+        for id_arquivo, id_nodo in sorted(faltando.items()):
+            try:
+                info_arquivo = self._executar(id_nodo, 'obter_arquivo', [id_arquivo])
+            except Exception:
+                continue
+            if info_arquivo is not None:
+                self.executar_local('salvar_arquivo', [id_arquivo, info_arquivo])
+                copiados += 1
+        if copiados or removidos:
+            self._invalidar_armazenamento()
+        return copiados, removidos
+
+    def fechar(self):
+        self.executor.shutdown(wait=False)
+        self.local.fechar()
+
+
+# Cria o backend configurado (BACKEND_METADADOS=sqlite|json|distribuido)
+# 'distribuido' recebe em 'opcoes' o que só o nodo conhece: id_nodo, caminho do shard, chamar, vivos, replicas
+def criar_backend(tipo, ids_nodos, caminho_json='files_db.json', caminho_sqlite='files_db.sqlite3',
+                  tamanho_lote_ids=1, **opcoes):
+    """Instancia o backend de metadados pelo nome"""
+    if tipo == 'json':
+        return BackendJSON(caminho_json, ids_nodos, tamanho_lote_ids=tamanho_lote_ids)
+    if tipo == 'sqlite':
+        return BackendSQLite(
+            caminho_sqlite, ids_nodos, caminho_json_legado=caminho_json, tamanho_lote_ids=tamanho_lote_ids
+        )
+    if tipo == 'distribuido':
+        return BackendDistribuido(ids_nodos=ids_nodos, tamanho_lote_ids=tamanho_lote_ids, **opcoes)
+    raise ValueError(f'Backend de metadados desconhecido: {tipo}')
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Métricas no formato texto do Prometheus (sem dependência externa)
+Contadores e histogramas são atualizados por quem mede; medidores e contadores mantidos
+em outro lugar (cache, heartbeat, banco) são lidos por funções na hora da coleta
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+# limites dos buckets de latência em segundos (de 1 ms a 10 s)
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _chave(rotulos):
+    return tuple(sorted((nome, str(valor)) for nome, valor in rotulos.items()))
+
+
+def _formatar_rotulos(chave, extra=()):
+    pares = list(chave) + list(extra)
+    if not pares:
+        return ''
+    escapados = (valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, valor in pares)
+    return '{' + ','.join(f'{nome}="{valor}"' for (nome, _), valor in zip(pares, escapados)) + '}'
+
+
+def _formatar_valor(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# Registro das famílias de métricas de um nodo
+class Metricas:
+    """Contadores, histogramas e medidores exportados em /metrics"""
+
+    def __init__(self, prefixo):
+        self.prefixo = prefixo
+        self.lock = Lock()
+        self.familias = {}  # {nome: {'tipo', 'ajuda', 'limites', 'series': {rotulos: valor ou [buckets, soma, total]}}}
+        self.coletados = []  # [(nome, tipo, ajuda, funcao)]; funcao() -> [(rotulos, valor)]
+
+    def contador(self, nome, ajuda):
+        self.familias[nome] = {'tipo': 'counter', 'ajuda': ajuda, 'series': {}}
+
+    def histograma(self, nome, ajuda, limites=LIMITES_LATENCIA):
+        self.familias[nome] = {'tipo': 'histogram', 'ajuda': ajuda, 'limites': tuple(limites), 'series': {}}
+
+    # Métrica lida na hora da coleta (tipo 'gauge' ou 'counter')
+    def coletado(self, nome, ajuda, funcao, tipo='gauge'):
+        self.coletados.append((nome, tipo, ajuda, funcao))
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = _chave(rotulos)
+        series = self.familias[nome]['series']
+        with self.lock:
+            series[chave] = series.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **rotulos):
+        familia = self.familias[nome]
+        chave = _chave(rotulos)
+        indice = bisect_left(familia['limites'], valor)
+        with self.lock:
+            serie = familia['series'].get(chave)
+            if serie is None:
+                serie = familia['series'][chave] = [[0] * (len(familia['limites']) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    # Observa no histograma o tempo do bloco 'with'
+    @contextmanager
+    def cronometrar(self, nome, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def _linhas_familia(self, nome, familia):
+        completo = f'{self.prefixo}_{nome}'
+        yield f'# HELP {completo} {familia["ajuda"]}'
+        yield f'# TYPE {completo} {familia["tipo"]}'
+        with self.lock:
+            series = {chave: (list(serie[0]), serie[1], serie[2]) if familia['tipo'] == 'histogram' else serie
+                      for chave, serie in familia['series'].items()}
+        for chave, serie in sorted(series.items()):
+            if familia['tipo'] != 'histogram':
+                yield f'{completo}{_formatar_rotulos(chave)} {_formatar_valor(serie)}'
+                continue
+            buckets, soma, total = serie
+            acumulado = 0
+            for limite, quantidade in zip(familia['limites'] + (float('inf'),), buckets):
+                acumulado += quantidade
+                yield f'{completo}_bucket{_formatar_rotulos(chave, [("le", _formatar_valor(limite))])} {acumulado}'
+            yield f'{completo}_sum{_formatar_rotulos(chave)} {_formatar_valor(soma)}'
+            yield f'{completo}_count{_formatar_rotulos(chave)} {total}'
+
+    # Texto no formato de exposição do Prometheus (versão 0.0.4)
+    def exportar(self):
+        linhas = []
+        for nome, familia in list(self.familias.items()):
+            linhas.extend(self._linhas_familia(nome, familia))
+        for nome, tipo, ajuda, funcao in self.coletados:
+            try:
+                valores = funcao()
+            except Exception:
+                continue  # uma fonte com erro não derruba a coleta inteira
+            completo = f'{self.prefixo}_{nome}'
+            linhas.append(f'# HELP {completo} {ajuda}')
+            linhas.append(f'# TYPE {completo} {tipo}')
+            for rotulos, valor in valores:
+                if valor is not None:
+                    linhas.append(f'{completo}{_formatar_rotulos(_chave(rotulos))} {_formatar_valor(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+# Embrulha um objeto e mede o tempo de cada chamada de método público no histograma 'nome'
+class Instrumentado:
+    """Proxy que cronometra as chamadas (rótulo 'operation' = nome do método)"""
+
+    def __init__(self, objeto, metricas, nome):
+        self._objeto = objeto
+        self._metricas = metricas
+        self._nome = nome
+
+    def __getattr__(self, atributo):
+        valor = getattr(self._objeto, atributo)
+        if atributo.startswith('_') or not callable(valor):
+            return valor
+
+        @wraps(valor)
+        def medido(*args, **kwargs):
+            with self._metricas.cronometrar(self._nome, operation=atributo):
+                return valor(*args, **kwargs)
+        return medido
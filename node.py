@@ -5,31 +5,93 @@ Cada nodo atua como servidor e cliente simultaneamente
 """
 
 import os
+import base64
 import sys
+import asyncio
+import random
 import time
 import socket
 import threading
 import json
+import logging
 import subprocess
+import mmap
+import mimetypes
+import tempfile
+import hashlib
 import io
-from datetime import datetime
+import queue
+import signal
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import partial
+from itertools import chain, groupby, repeat
 from pathlib import Path
+from urllib.parse import quote
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_file
-from threading import Lock
+from flask import Flask, Response, g, request, jsonify, make_response, send_file
+from werkzeug.wsgi import ClosingIterator
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from metadados import criar_backend, ORDENS_LISTAGEM
+from posicionamento import Posicionador
+from membros import Membros, VIVO, SUSPEITO, MORTO
+from reparo import LimitadorTaxa, ProgressoReparo
+from cache_fragmentos import CacheFragmentos
+from latencia import LatenciaLeituras
+from integridade import checksum_blocos, ChecksumsFaixas, ProgressoVarredura
+from compressao import Compressao, ler_candidatos, comprimir, descomprimir
+from volumes import Volumes
+from inventario import Inventario
+from registro import RegistroAssincrono
+from metricas import Metricas, Instrumentado
+from servidor_http import ServidorLimitado, TratadorKeepAlive
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava do diretório do nodo
+    fcntl = None
 
 # env vars
 load_dotenv()
 
+# Nenhuma réplica de um fragmento respondeu
+class FragmentoIndisponivel(Exception):
+    pass
+
+
+# Um fragmento não atingiu o número mínimo de réplicas gravadas
+class QuorumNaoAtingido(Exception):
+    pass
+
+
+# O conteúdo recebido para um chunk não bate com o hash do nome
+class HashDivergente(Exception):
+    pass
+
+
+# Repetição das requisições entre nodos: só repete um método idempotente quando uma conexão
+# keep-alive reaproveitada foi fechada pelo outro nodo antes da resposta (ProtocolError);
+# um timeout de leitura sobe como antes, sem nova tentativa
+class RepeticaoKeepAlive(Retry):
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+
+
 # Classe do Nodo
 class Nodo:
     def __init__(self, id_nodo):
+        self.inicio_partida = time.monotonic()
         self.id_nodo = id_nodo
         self.portas = list(map(int, os.getenv('PORTAS', '').split(',')))
         self.porta = self.portas[id_nodo - 1]
         self.portas_http = list(map(int, os.getenv('PORTAS_HTTP', '').split(',')))
         self.porta_http = self.portas_http[id_nodo - 1]
+        self.ids_nodos = list(range(1, len(self.portas) + 1))
         self.intervalo_heartbeat = int(os.getenv('INTERVALO_HEARTBEAT', '5'))
         self.timeout_heartbeat = int(os.getenv('TIMEOUT_HEARTBEAT', '15'))
         
@@ -37,209 +99,1004 @@ class Nodo:
         self.dir_arquivos = Path(f'files_nodo_{id_nodo}')
         self.dir_log = Path('log')
         self.arquivo_log = self.dir_log / f'nodo_{id_nodo}.log'
-        self.arquivo_bd = Path('files_db.json')  # Banco de dados compartilhado em formato JSON
+        self.arquivo_bd = Path('files_db.json')  # Banco de dados compartilhado em formato JSON (legado/importação)
+        self.arquivo_bd_sqlite = Path('files_db.sqlite3')
+        self.tipo_backend = os.getenv('BACKEND_METADADOS', 'sqlite')
+        self.tamanho_lote_ids = int(os.getenv('TAMANHO_LOTE_IDS', '10'))  # IDs reservados por vez
+        # backend distribuido: cada nodo guarda os arquivos dos quais é dono no próprio shard
+        self.arquivo_shard_metadados = self.dir_arquivos / '.metadados.sqlite3'
+        self.replicas_metadados = int(os.getenv('REPLICAS_METADADOS', '3'))
+        self.nodos_virtuais = int(os.getenv('NODOS_VIRTUAIS', '64'))  # pontos de cada nodo no anel
+        self.intervalo_sincronizacao_metadados = float(os.getenv('INTERVALO_SINCRONIZACAO_METADADOS', '300'))
         
         # cria dirs do nodo se não houver, exist_ok do pathlib pra não dar exception se existe
         self.dir_arquivos.mkdir(exist_ok=True)
         self.dir_log.mkdir(exist_ok=True)
         
-        # lock pra acesso thread-safe ao banco de dados
-        self.lock_bd = Lock()
+        # só um processo por nodo: uma segunda partida (recuperação repetida) sai antes de abrir volumes e banco
+        self.trava_diretorio = self._travar_diretorio()
+        
+        # log assíncrono em JSON lines (nodo_N.log), com rotação por tamanho e cópia legível no terminal
+        self.log = RegistroAssincrono(
+            self.arquivo_log, id_nodo,
+            nivel=os.getenv('NIVEL_LOG', 'info'),
+            tamanho_maximo=int(os.getenv('TAMANHO_MAXIMO_LOG', str(10 * 1024 * 1024))),
+            arquivos_antigos=int(os.getenv('ARQUIVOS_LOG_ANTIGOS', '3')),
+            terminal=os.getenv('LOG_TERMINAL', '1') == '1'
+        )
+        
+        # métricas expostas em /metrics (formato Prometheus)
+        self.metricas = Metricas('shardbox')
+        self._configurar_metricas()
+        
+        # temporários (staging de upload e gravação atômica de fragmentos)
+        self.dir_temporario = self.dir_arquivos / '.tmp'
+        self.dir_temporario.mkdir(exist_ok=True)
+        
+        # tamanho dos blocos de leitura/escrita em stream
+        self.tamanho_bloco = int(os.getenv('TAMANHO_BLOCO', str(256 * 1024)))
+        
+        # cliente HTTP entre nodos: conexões persistentes e timeouts (conexão, leitura) configuráveis
+        self.tamanho_pool_http = int(os.getenv('POOL_HTTP_POR_NODO', '8'))
+        self.timeout_http = (
+            float(os.getenv('TIMEOUT_CONEXAO_HTTP', '2')),
+            float(os.getenv('TIMEOUT_LEITURA_HTTP', '5'))
+        )
+        self.sessao_http = self._criar_sessao_http()
+        
+        # servidor HTTP: 'limitado' (pool fixo de threads com fila limitada) ou 'desenvolvimento' (app.run, uma thread por requisição)
+        self.modo_servidor_http = os.getenv('SERVIDOR_HTTP', 'limitado')
+        if self.modo_servidor_http not in ('limitado', 'desenvolvimento'):
+            raise ValueError(f'SERVIDOR_HTTP inválido: {self.modo_servidor_http}')
+        self.threads_http = int(os.getenv('THREADS_HTTP', '32'))
+        self.tamanho_fila_http = int(os.getenv('FILA_HTTP', '64'))
+        self.timeout_cliente_http = float(os.getenv('TIMEOUT_CLIENTE_HTTP', '60'))
+        self.timeout_ocioso_http = float(os.getenv('TIMEOUT_OCIOSO_HTTP', '5'))
+        self.tempo_encerramento = float(os.getenv('TEMPO_ENCERRAMENTO', '30'))
+        self.servidor_http = None
+        # uploads e downloads seguram a thread enquanto esperam outros nodos: com um teto para cada,
+        # sobram threads para store_fragment/get_fragment e uma rajada não trava o cluster inteiro
+        self.limite_uploads = threading.BoundedSemaphore(int(os.getenv('UPLOADS_SIMULTANEOS', str(max(1, self.threads_http // 4)))))
+        self.limite_downloads = threading.BoundedSemaphore(int(os.getenv('DOWNLOADS_SIMULTANEOS', str(max(1, self.threads_http // 2)))))
+        
+        # estratégia de fragmentação: adaptativa (1/2/4 fragmentos), fixa (TAMANHO_FRAGMENTO),
+        # erasure (Reed-Solomon k+m) ou cdc (chunks definidos pelo conteúdo, deduplicados pelo hash)
+        self.estrategia_fragmentacao = os.getenv('ESTRATEGIA_FRAGMENTACAO', 'adaptativa')
+        self.tamanho_fragmento = int(os.getenv('TAMANHO_FRAGMENTO', str(1024 * 1024)))
+        self.replicas_fragmento = int(os.getenv('REPLICAS_FRAGMENTO', '2'))
+        self.erasure_k = int(os.getenv('ERASURE_K', '4'))
+        self.erasure_m = int(os.getenv('ERASURE_M', '2'))
+        self.codificadores_erasure = {}  # {(k, m): ReedSolomon}
+        self.cdc_minimo = int(os.getenv('CDC_MINIMO', str(16 * 1024)))
+        self.cdc_medio = int(os.getenv('CDC_MEDIO', str(64 * 1024)))
+        self.cdc_maximo = int(os.getenv('CDC_MAXIMO', str(256 * 1024)))
+        if self.estrategia_fragmentacao not in ('adaptativa', 'fixa', 'erasure', 'cdc'):
+            raise ValueError(f'ESTRATEGIA_FRAGMENTACAO inválida: {self.estrategia_fragmentacao}')
+        if self.estrategia_fragmentacao == 'erasure' and self.erasure_k + self.erasure_m > len(self.portas):
+            raise ValueError('ERASURE_K + ERASURE_M não pode passar do número de nodos')
+        if not 0 < self.cdc_minimo <= self.cdc_medio <= self.cdc_maximo:
+            raise ValueError('É preciso 0 < CDC_MINIMO <= CDC_MEDIO <= CDC_MAXIMO')
+        if self.estrategia_fragmentacao == 'cdc' and self.tipo_backend == 'distribuido':
+            raise ValueError('A estratégia cdc precisa do índice global de chunks (BACKEND_METADADOS sqlite ou json)')
+        
+        # compressão transparente dos fragmentos (estratégias adaptativa e fixa): o codec é escolhido por amostragem
+        # entre os candidatos de COMPRESSAO_CODECS e o fragmento que não encolhe o bastante fica cru
+        self.compressao = None
+        if os.getenv('COMPRESSAO', '0') == '1':
+            self.compressao = Compressao(
+                ler_candidatos(os.getenv('COMPRESSAO_CODECS', 'zlib:1,zlib:6')),
+                ganho_minimo=float(os.getenv('COMPRESSAO_GANHO_MINIMO', '0.1')),
+                ganho_extra=float(os.getenv('COMPRESSAO_GANHO_EXTRA', '0.05')),
+                tamanho_minimo=int(os.getenv('COMPRESSAO_TAMANHO_MINIMO', '4096'))
+            )
+        
+        # gravação paralela das réplicas no upload
+        self.quorum_escrita = int(os.getenv('QUORUM_ESCRITA', '1'))  # réplicas duráveis por fragmento antes de responder (0 = todas)
+        self.executor_replicas = ThreadPoolExecutor(
+            max_workers=int(os.getenv('MAX_THREADS_REPLICAS', '16')),
+            thread_name_prefix=f'replicas_nodo_{id_nodo}'
+        )
+        
+        # busca paralela de fragmentos no download (pool compartilhado entre as requisições)
+        self.janela_leitura = int(os.getenv('JANELA_LEITURA', '4'))  # fragmentos buscados à frente
+        self.executor_fragmentos = ThreadPoolExecutor(
+            max_workers=int(os.getenv('MAX_THREADS_FRAGMENTOS', '16')),
+            thread_name_prefix=f'fragmentos_nodo_{id_nodo}'
+        )
+        
+        # /list: arquivos por página sem ?limit e o máximo aceito em ?limit
+        self.pagina_listagem = int(os.getenv('PAGINA_LISTAGEM', '100'))
+        self.pagina_listagem_maxima = int(os.getenv('PAGINA_LISTAGEM_MAXIMA', '1000'))
+        
+        # escolha da réplica pela latência medida e leitura duplicada (hedge) quando a primeira demora
+        # mais que o percentil PERCENTIL_HEDGE das buscas recentes (0 = sem hedge)
+        self.latencias = LatenciaLeituras(self.ids_nodos)
+        self.percentil_hedge = float(os.getenv('PERCENTIL_HEDGE', '95'))
+        self.atraso_minimo_hedge = float(os.getenv('ATRASO_MINIMO_HEDGE', '0.05'))
+        self.leituras_duplicadas = 0
+        self.lock_leituras_duplicadas = threading.Lock()  # o contador é somado pelas threads de download
+        self.executor_leituras = ThreadPoolExecutor(  # tentativas individuais (separado para não travar o pool de fragmentos)
+            max_workers=int(os.getenv('MAX_THREADS_FRAGMENTOS', '16')) * 2,
+            thread_name_prefix=f'leituras_nodo_{id_nodo}'
+        )
+        
+        # integridade: fragmentos em volume já conferidos {nome: entrada do volume} (os avulsos ficam no inventário),
+        # os corrompidos vão para .corrompidos e a varredura relê os fragmentos locais a cada INTERVALO_VARREDURA segundos (0 = desligada)
+        self.fragmentos_verificados = {}
+        self.dir_corrompidos = self.dir_arquivos / '.corrompidos'
+        self.dir_corrompidos.mkdir(exist_ok=True)
+        self.arquivo_cursor_varredura = self.dir_arquivos / '.varredura'
+        self.intervalo_varredura = float(os.getenv('INTERVALO_VARREDURA', '3600'))
+        self.limitador_varredura = LimitadorTaxa(int(os.getenv('TAXA_VARREDURA', str(5 * 1024 * 1024))))  # bytes/s (0 = sem limite)
+        self.progresso_varredura = ProgressoVarredura()
+        
+        # volumes: fragmentos de até LIMITE_VOLUME bytes vão para volumes append-only em files_nodo_N/.volumes
+        # (um índice em memória em vez de um arquivo por fragmento); 0 = todos em arquivos avulsos
+        limite_volume = int(os.getenv('LIMITE_VOLUME', str(64 * 1024)))
+        self.volumes = None
+        if limite_volume > 0:
+            self.volumes = Volumes(
+                self.dir_arquivos / '.volumes', limite_volume,
+                tamanho_maximo=int(os.getenv('TAMANHO_VOLUME', str(1024 * 1024 * 1024))),
+                fracao_compactacao=float(os.getenv('FRACAO_COMPACTACAO', '0.5'))
+            )
+        self.intervalo_checkpoint_volumes = float(os.getenv('INTERVALO_CHECKPOINT_VOLUMES', '30'))
+        
+        # inventário dos fragmentos avulsos (tamanho, mtime e checksum conferido) em files_nodo_N/.inventario.json:
+        # na partida o nodo sabe o que tem sem listar nem reler o diretório; a comparação com o disco fica em segundo plano
+        self.inventario = Inventario(self.dir_arquivos / '.inventario.json')
+        self.inventario_pronto = threading.Event()  # comparado com o disco desde a partida
+        self.intervalo_checkpoint_inventario = float(os.getenv('INTERVALO_CHECKPOINT_INVENTARIO', '30'))
+        self.intervalo_compactacao = float(os.getenv('INTERVALO_COMPACTACAO', '600'))
+        self.limitador_compactacao = LimitadorTaxa(int(os.getenv('TAXA_COMPACTACAO', str(20 * 1024 * 1024))))  # bytes/s (0 = sem limite)
         
-        # inicializa banco de dados
+        # cache em memória dos fragmentos buscados em outros nodos (0 = desligado)
+        limite_cache = int(os.getenv('CACHE_FRAGMENTOS_BYTES', str(64 * 1024 * 1024)))
+        self.cache_fragmentos = CacheFragmentos(limite_cache, int(os.getenv('CACHE_ITEM_MAXIMO', '0')) or None)
+        
+        # inicializa banco de dados (o backend faz o próprio lock)
         self._inicializar_bd()
         
-        # manter estados dos nodos durante heartbeat
-        self.status_nodos = {}  # {porta: ultimo_heartbeat}
-        self.tentativas_recuperacao = {}  # {porta: ultima_tentativa} para evitar tentativas duplicadas
+        # escolha dos nodos das réplicas: só nodos vivos, por bytes armazenados + bytes em gravação
+        self.posicionador = Posicionador(self.ids_nodos)
+        
+        # reparo: réplicas de nodos mortos há mais de ESPERA_REPARO segundos são recriadas em outros nodos
+        self.espera_reparo = float(os.getenv('ESPERA_REPARO', '60'))
+        self.limitador_reparo = LimitadorTaxa(int(os.getenv('TAXA_REPARO', str(20 * 1024 * 1024))))  # bytes/s (0 = sem limite)
+        self.threads_reparo = int(os.getenv('THREADS_REPARO', '2'))
+        self.progresso_reparo = ProgressoReparo()
+        self.fila_reparo = queue.Queue()  # (id_nodo, motivo)
+        self.nodos_em_reparo = set()
+        self.lock_reparo = threading.Lock()
         
-        # estado do nodo
+        # visão do cluster mantida por gossip (estado e latência de cada nodo)
+        self.membros = Membros(self.id_nodo, self.ids_nodos, self.timeout_heartbeat / 2, self.timeout_heartbeat)
+        self.fanout_heartbeat = int(os.getenv('FANOUT_HEARTBEAT', '3'))  # nodos sondados por rodada
+        self.timeout_sonda = float(os.getenv('TIMEOUT_SONDA_HEARTBEAT', '2'))
+        self.fila_alvos_heartbeat = []
+        self.recuperacoes = {}  # {id_nodo: processo} partidas lançadas por este nodo e ainda não prontas
+        self.lock_recuperacao = threading.Lock()
+        self.tempo_maximo_partida = float(os.getenv('TEMPO_MAXIMO_PARTIDA', '30'))  # sem ficar pronto nisso, a partida é abortada
+        self.conexoes_heartbeat = {}  # {porta: (leitor, escritor)} conexões persistentes (asyncio) com os outros nodos
+        
+        # estado do nodo: 'pronto' quando os servidores TCP e HTTP aceitam conexões (GET /ready)
         self.rodando = True
         self.socket_servidor = None
         self.tempo_inicializacao = time.time()  # Timestamp de quando o nodo foi criado
+        self.http_pronto = threading.Event()
+        self.pronto = threading.Event()
+        self.tempo_partida = None  # segundos do início do processo até ficar pronto
         
         # Flask app
         self.app = Flask(f'nodo_{id_nodo}')
         self._configurar_rotas()
         
-    # Registra mensagens no arquivo de log com timestamp
-    def registrar_log(self, mensagem):
-        """Registra mensagem no log com timestamp"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        mensagem_log = f'[{timestamp}] {mensagem}'
-        print(mensagem_log)
+    # Registra mensagens no log sem bloquear: a gravação em disco é feita em lotes pela thread do log
+    # 'campos' viram chaves do registro JSON (file_id, fragment_id, fragment, peer)
+    def registrar_log(self, mensagem, nivel=None, **campos):
+        """Registra mensagem no log (mensagens 'ERRO...' têm nível error se 'nivel' não for dado)"""
+        if nivel is None:
+            nivel = 'error' if mensagem.startswith('ERRO') else 'info'
+        self.log.registrar(mensagem, nivel, **campos)
+    
+    # Declara as métricas do nodo; as lidas na hora da coleta consultam o estado atual (banco, heartbeat, cache)
+    def _configurar_metricas(self):
+        """Registra contadores, histogramas e medidores de /metrics"""
+        metricas = self.metricas
+        metricas.histograma('http_request_seconds', 'Tempo de resposta por rota (nas respostas em stream, até o início do corpo)')
+        metricas.contador('http_responses_total', 'Respostas por rota e status')
+        metricas.histograma('upload_stage_seconds', 'Tempo de cada etapa do upload')
+        metricas.histograma('download_stage_seconds', 'Tempo de cada etapa do download')
+        metricas.histograma('metadata_seconds', 'Tempo das operações no banco de metadados')
+        metricas.contador('node_recoveries_total', 'Processos de recuperação lançados por este nodo, por desfecho')
+        metricas.contador('metadata_peer_requests_total', 'Operações de metadados mandadas ao shard de outro nodo (backend distribuido)')
+        metricas.histograma('peer_transfer_seconds', 'Tempo das transferências de fragmentos com outros nodos')
+        metricas.contador('peer_bytes_total', 'Bytes de fragmentos trocados com outros nodos')
+        metricas.contador('client_bytes_total', 'Bytes de arquivos recebidos de clientes e enviados a eles')
+        metricas.contador('compressed_fragments_total', 'Fragmentos gravados por codec no upload (none = cru)')
+        metricas.contador('compression_bytes_total', 'Bytes antes (original) e depois (stored) da compressão dos fragmentos')
+        metricas.contador('compression_cpu_seconds_total', 'Tempo de CPU gasto comprimindo e descomprimindo fragmentos')
         
-        with open(self.arquivo_log, 'a') as f:
-            f.write(mensagem_log + '\n')
+        outros = lambda: [id_nodo for id_nodo in self.ids_nodos if id_nodo != self.id_nodo]
+        metricas.coletado('stored_bytes', 'Bytes armazenados por nodo segundo o banco de metadados',
+                          lambda: [({'node': id_nodo}, total) for id_nodo, total in sorted(self.bd.armazenamento_nodos().items())])
+        metricas.coletado('peers', 'Outros nodos por estado na visão do heartbeat',
+                          lambda: [({'state': estado}, len(ids)) for estado, ids in self.membros.por_estado().items()])
+        metricas.coletado('heartbeat_rtt_seconds', 'Média móvel do tempo de ida e volta do heartbeat',
+                          lambda: [({'peer': id_nodo}, self.membros.latencia(id_nodo)) for id_nodo in outros()])
+        metricas.coletado('peer_read_latency_seconds', 'Média móvel do tempo até o primeiro byte das buscas de fragmentos',
+                          lambda: [({'peer': id_nodo}, self.latencias.media(id_nodo)) for id_nodo in outros()])
+        metricas.coletado('hedged_reads_total', 'Buscas de fragmentos duplicadas em outra réplica',
+                          lambda: [({}, self.leituras_duplicadas)], 'counter')
+        metricas.coletado('cache_bytes', 'Bytes no cache de fragmentos',
+                          lambda: [({}, self.cache_fragmentos.estatisticas()['used_bytes'])])
+        for chave, nome in (('hits', 'cache_hits_total'), ('misses', 'cache_misses_total'), ('evictions', 'cache_evictions_total')):
+            metricas.coletado(nome, f'Cache de fragmentos: {chave}',
+                              lambda chave=chave: [({}, self.cache_fragmentos.estatisticas()[chave])], 'counter')
+        metricas.coletado('http_workers_busy', 'Threads do servidor HTTP atendendo uma requisição',
+                          lambda: [({}, self.servidor_http.estado()['busy'])] if self.servidor_http else [])
+        metricas.coletado('http_queued_connections', 'Conexões aceitas esperando uma thread do servidor HTTP',
+                          lambda: [({}, self.servidor_http.estado()['queued'])] if self.servidor_http else [])
+        metricas.coletado('http_idle_connections', 'Conexões keep-alive abertas esperando a próxima requisição (sem thread)',
+                          lambda: [({}, self.servidor_http.estado()['idle_connections'])] if self.servidor_http else [])
+        metricas.coletado('http_rejected_connections_total', 'Conexões recusadas com 503 (fila do servidor HTTP cheia)',
+                          lambda: [({}, self.servidor_http.estado()['rejected'])] if self.servidor_http else [], 'counter')
+        metricas.coletado('compression_ratio', 'Bytes originais / bytes gravados dos fragmentos comprimidos por este nodo',
+                          self._taxa_compressao)
+        for chave, nome in (('fragments', 'volume_fragments'), ('bytes', 'volume_bytes'), ('dead_bytes', 'volume_dead_bytes')):
+            metricas.coletado(nome, f'Volumes locais: {chave}',
+                              lambda chave=chave: [({}, self.volumes.estatisticas()[chave])] if self.volumes else [])
+        metricas.coletado('volume_compactions_total', 'Volumes compactados desde que o nodo subiu',
+                          lambda: [({}, self.volumes.compactados)] if self.volumes else [], 'counter')
+        metricas.coletado('startup_seconds', 'Segundos do início do processo até o nodo ficar pronto',
+                          lambda: [({}, self.tempo_partida)] if self.tempo_partida is not None else [])
+        metricas.coletado('inventory_fragments', 'Fragmentos avulsos no inventário local',
+                          lambda: [({}, self.inventario.estatisticas()['fragments'])])
+        metricas.coletado('repair_queued_nodes', 'Nodos na fila de reparo deste nodo',
+                          lambda: [({}, len(self.nodos_em_reparo))])
+    
+    # Razão de compressão acumulada por codec (a partir de compression_bytes_total)
+    def _taxa_compressao(self):
+        """Retorna [(rótulos, razão)] para a coleta"""
+        totais = {}
+        for chave, valor in list(self.metricas.familias['compression_bytes_total']['series'].items()):
+            rotulos = dict(chave)
+            totais.setdefault(rotulos['codec'], {})[rotulos['kind']] = valor
+        return [({'codec': codec}, total['original'] / total['stored'])
+                for codec, total in sorted(totais.items()) if total.get('stored')]
+    
+    # Soma uma transferência de fragmento com outro nodo nas métricas
+    def _registrar_transferencia(self, id_nodo, operacao, quantidade, inicio, sucesso):
+        """operacao: 'store' (bytes enviados) ou 'fetch' (bytes recebidos)"""
+        resultado = 'ok' if sucesso else 'error'
+        self.metricas.observar('peer_transfer_seconds', time.perf_counter() - inicio, peer=id_nodo, operation=operacao, result=resultado)
+        self.metricas.incrementar('peer_bytes_total', quantidade, peer=id_nodo, direction='out' if operacao == 'store' else 'in')
+    
+    # Repassa blocos somando o total em contador[0]
+    @staticmethod
+    def _contar_blocos(blocos, contador):
+        """Gera os mesmos blocos"""
+        for bloco in blocos:
+            contador[0] += len(bloco)
+            yield bloco
     
-    # Inicializa o banco de dados JSON compartilhado se não existir
+    # Inicializa o backend de metadados: compartilhado (SQLite por padrão, JSON legado) ou distribuído entre os nodos
     def _inicializar_bd(self):
-        """Inicializa o banco de dados JSON compartilhado"""
-        with self.lock_bd:
-            if not self.arquivo_bd.exists():
-                dados_iniciais = {
-                    'ultimo_id': 0,
-                    'arquivos': {},  # {id_arquivo: {nome, tamanho, fragmentos: [{id_nodo, id_fragmento, tamanho}]}}
-                    'armazenamento_nodo': {i: 0 for i in range(1, 9)}  # Bytes armazenados por nodo
-                }
-                with open(self.arquivo_bd, 'w') as f:
-                    json.dump(dados_iniciais, f, indent=2)
-    
-    # Lê o banco de dados JSON com lock para thread-safety
-    def _ler_bd(self):
-        """Lê o banco de dados"""
-        with self.lock_bd:
-            with open(self.arquivo_bd, 'r') as f:
-                return json.load(f)
-    
-    # Escreve no banco de dados JSON com lock para thread-safety
-    def _escrever_bd(self, dados):
-        """Escreve no banco de dados"""
-        with self.lock_bd:
-            with open(self.arquivo_bd, 'w') as f:
-                json.dump(dados, f, indent=2)
-    
-    # Retorna os nodos com menor carga de armazenamento para balanceamento
-    def _obter_nodos_menos_carregados(self, quantidade):
-        """Retorna os 'quantidade' nodos com menor armazenamento"""
-        bd = self._ler_bd()
-        armazenamento = bd['armazenamento_nodo']
-        nodos_ordenados = sorted(armazenamento.items(), key=lambda x: x[1])
-        return [int(id_nodo) for id_nodo, _ in nodos_ordenados[:quantidade]]
+        """Inicializa o backend de metadados"""
+        opcoes = {}
+        if self.tipo_backend == 'distribuido':
+            opcoes = {
+                'id_nodo': self.id_nodo,
+                'caminho': self.arquivo_shard_metadados,
+                'chamar': self._chamar_metadados,
+                'vivos': lambda: self.posicionador.vivos(),
+                'replicas': self.replicas_metadados,
+                'virtuais': self.nodos_virtuais
+            }
+        backend = criar_backend(
+            self.tipo_backend,
+            self.ids_nodos,
+            caminho_json=self.arquivo_bd,
+            caminho_sqlite=self.arquivo_bd_sqlite,
+            tamanho_lote_ids=self.tamanho_lote_ids,
+            **opcoes
+        )
+        # cada chamada ao backend entra no histograma metadata_seconds{operation=<método>}
+        self.bd = Instrumentado(backend, self.metricas, 'metadata_seconds')
     
-    # Fragmenta o arquivo em partes baseado no tamanho e define número de réplicas
-    def _fragmentar_arquivo(self, dados_arquivo, nome_arquivo):
-        """Fragmenta arquivo e retorna fragmentos com estratégia de distribuição"""
-        tamanho_arquivo = len(dados_arquivo)
+    # Executa uma operação de metadados no shard de outro nodo (backend distribuido)
+    def _chamar_metadados(self, id_nodo, operacao, argumentos):
+        """Retorna o resultado da operação; exceção se o nodo não respondeu ou falhou"""
+        try:
+            resposta = self.sessao_http.post(self._url_nodo(id_nodo, f'/metadata/{operacao}'),
+                                             json={'args': argumentos}, timeout=self.timeout_http)
+            resposta.raise_for_status()
+        except requests.RequestException:
+            self.metricas.incrementar('metadata_peer_requests_total', peer=id_nodo, operation=operacao, result='error')
+            raise
+        self.metricas.incrementar('metadata_peer_requests_total', peer=id_nodo, operation=operacao, result='ok')
+        return resposta.json()['result']
+    
+    # Retorna os nodos vivos com menor carga para balanceamento e reserva 'tamanho' bytes em cada um
+    # (a reserva é devolvida com self.posicionador.liberar quando a gravação termina)
+    def _obter_nodos_menos_carregados(self, quantidade, tamanho, excluir=()):
+        """Retorna até 'quantidade' nodos distintos com menor carga"""
+        return self.posicionador.escolher(quantidade, tamanho, excluir)
+    
+    # Fragmenta o arquivo conforme a estratégia configurada (ESTRATEGIA_FRAGMENTACAO)
+    # 'checksums' são os dos fragmentos já calculados no staging (adaptativa e fixa, ver _faixas_fragmentos)
+    def _fragmentar_arquivo(self, caminho_arquivo, tamanho_arquivo, checksums=None):
+        """Retorna (fragmentos, info da estratégia para os metadados, arquivos temporários criados)
         
+        Cada fragmento tem 'replicas' (cópias) e 'grupo': fragmentos do mesmo grupo vão para nodos distintos
+        """
+        if self.estrategia_fragmentacao == 'fixa':
+            return self._fragmentar_fixa(caminho_arquivo, tamanho_arquivo, checksums)
+        if self.estrategia_fragmentacao == 'erasure':
+            return self._fragmentar_erasure(caminho_arquivo, tamanho_arquivo)
+        if self.estrategia_fragmentacao == 'cdc':
+            return self._fragmentar_cdc(caminho_arquivo, tamanho_arquivo)
+        return self._fragmentar_adaptativa(caminho_arquivo, tamanho_arquivo, checksums)
+    
+    # Tamanho de cada fragmento, em ordem, para calcular os checksums enquanto o upload chega ao staging
+    # None se não dá para saber antes: a adaptativa depende do tamanho do arquivo, e erasure e cdc
+    # calculam os seus na própria fragmentação
+    def _faixas_fragmentos(self, tamanho_previsto):
+        """Retorna os tamanhos para ChecksumsFaixas (None no último = até o fim) ou None"""
+        if self.estrategia_fragmentacao == 'fixa':
+            return repeat(self.tamanho_fragmento)
+        if self.estrategia_fragmentacao == 'adaptativa' and tamanho_previsto is not None:
+            num_fragmentos, _ = self._divisao_adaptativa(tamanho_previsto)
+            return [tamanho_previsto // num_fragmentos] * (num_fragmentos - 1) + [None]
+        return None
+    
+    # Número de fragmentos e de réplicas da estratégia adaptativa, pelo tamanho do arquivo
+    @staticmethod
+    def _divisao_adaptativa(tamanho_arquivo):
+        """Retorna (num_fragmentos, replicas_por_fragmento)"""
         if tamanho_arquivo <= 100:
             # Arquivo pequeno: 1 fragmento + 1 réplica
-            num_fragmentos = 1
-            replicas_por_fragmento = 2
-        elif tamanho_arquivo <= 1024:
+            return 1, 2
+        if tamanho_arquivo <= 1024:
             # Arquivo médio: 2 fragmentos + 2 réplicas cada
-            num_fragmentos = 2
-            replicas_por_fragmento = 2
-        else:
-            # Arquivo grande: 4 fragmentos + 2 réplicas cada
-            num_fragmentos = 4
-            replicas_por_fragmento = 4
+            return 2, 2
+        # Arquivo grande: 4 fragmentos + 2 réplicas cada
+        return 4, 4
+    
+    # Fragmenta o arquivo em partes baseado no tamanho e define número de réplicas
+    def _fragmentar_adaptativa(self, caminho_arquivo, tamanho_arquivo, checksums=None):
+        """Fragmenta arquivo e retorna fragmentos com estratégia de distribuição"""
+        num_fragmentos, replicas_por_fragmento = self._divisao_adaptativa(tamanho_arquivo)
         
         # Divisão inteira do arquivo
-        tamanho_fragmento = len(dados_arquivo) // num_fragmentos
+        tamanho_fragmento = tamanho_arquivo // num_fragmentos
         fragmentos = []
         
         for i in range(num_fragmentos):
             inicio = i * tamanho_fragmento
             if i == num_fragmentos - 1:
                 # Último fragmento pega o resto
-                fim = len(dados_arquivo)
+                fim = tamanho_arquivo
             else:
                 fim = inicio + tamanho_fragmento
             
-            dados_fragmento = dados_arquivo[inicio:fim]
+            # Os dados não são copiados: cada réplica relê o intervalo do arquivo em blocos
+            fragmentos.append({
+                'id_fragmento': i,
+                'blocos': partial(self._ler_intervalo, caminho_arquivo, inicio, fim - inicio),
+                'checksum': checksums[i] if checksums else checksum_blocos(self._ler_intervalo(caminho_arquivo, inicio, fim - inicio)),
+                'tamanho': fim - inicio,
+                'inicio': inicio,
+                'replicas': replicas_por_fragmento,
+                'grupo': i
+            })
+        
+        return fragmentos, {}, []
+    
+    # Fragmentos de tamanho fixo (TAMANHO_FRAGMENTO), cada um com REPLICAS_FRAGMENTO cópias
+    def _fragmentar_fixa(self, caminho_arquivo, tamanho_arquivo, checksums=None):
+        """Divide o arquivo em fragmentos de tamanho fixo"""
+        fragmentos = []
+        for i, inicio in enumerate(range(0, max(tamanho_arquivo, 1), self.tamanho_fragmento)):
+            tamanho = min(self.tamanho_fragmento, tamanho_arquivo - inicio)
             fragmentos.append({
                 'id_fragmento': i,
-                'dados': dados_fragmento,
-                'tamanho': len(dados_fragmento)
+                'blocos': partial(self._ler_intervalo, caminho_arquivo, inicio, tamanho),
+                'checksum': checksums[i] if checksums else checksum_blocos(self._ler_intervalo(caminho_arquivo, inicio, tamanho)),
+                'tamanho': tamanho,
+                'inicio': inicio,
+                'replicas': self.replicas_fragmento,
+                'grupo': i
             })
+        return fragmentos, {'estrategia': 'fixa'}, []
+    
+    # Codificador Reed-Solomon (NumPy só é importado se o modo erasure for usado)
+    def _codificador_erasure(self, k, m):
+        """Retorna o codificador (k+m), reaproveitando os já criados"""
+        if (k, m) not in self.codificadores_erasure:
+            from reed_solomon import ReedSolomon
+            self.codificadores_erasure[(k, m)] = ReedSolomon(k, m)
+        return self.codificadores_erasure[(k, m)]
+    
+    # Divide uma faixa de 'tamanho_dados' bytes em k shards de dados: [(inicio, tamanho)] relativos à faixa
+    @staticmethod
+    def _shards_da_faixa(tamanho_dados, k):
+        """Retorna (tamanho do shard, intervalos dos k shards de dados)"""
+        tamanho_shard = -(-tamanho_dados // k)  # arredonda pra cima
+        intervalos = []
+        for i in range(k):
+            inicio = min(i * tamanho_shard, tamanho_dados)
+            intervalos.append((inicio, min(tamanho_shard, tamanho_dados - inicio)))
+        return tamanho_shard, intervalos
+    
+    # Código de apagamento: faixas de k * TAMANHO_FRAGMENTO bytes viram k shards de dados + m de paridade
+    def _fragmentar_erasure(self, caminho_arquivo, tamanho_arquivo):
+        """Divide o arquivo em faixas e calcula a paridade de cada uma (uma faixa por vez na memória)"""
+        k, m = self.erasure_k, self.erasure_m
+        codificador = self._codificador_erasure(k, m)
+        tamanho_faixa = k * self.tamanho_fragmento
+        fragmentos = []
+        temporarios = []
         
-        return fragmentos, replicas_por_fragmento
+        with open(caminho_arquivo, 'rb') as f:
+            for faixa, inicio_faixa in enumerate(range(0, tamanho_arquivo, tamanho_faixa)):
+                tamanho_dados = min(tamanho_faixa, tamanho_arquivo - inicio_faixa)
+                tamanho_shard, intervalos = self._shards_da_faixa(tamanho_dados, k)
+                
+                # shards de dados: intervalos do próprio arquivo (o último pode ser menor, sem preenchimento)
+                for i, (inicio, tamanho) in enumerate(intervalos):
+                    fragmentos.append({
+                        'id_fragmento': faixa * (k + m) + i,
+                        'blocos': partial(self._ler_intervalo, caminho_arquivo, inicio_faixa + inicio, tamanho),
+                        'tamanho': tamanho,
+                        'replicas': 1,
+                        'grupo': faixa
+                    })
+                
+                # shards de paridade: calculados e guardados em temporários até serem enviados
+                f.seek(inicio_faixa)
+                dados_faixa = f.read(tamanho_dados)
+                shards_dados = [dados_faixa[inicio:inicio + tamanho] for inicio, tamanho in intervalos]
+                for fragmento, shard in zip(fragmentos[-k:], shards_dados):
+                    fragmento['checksum'] = hashlib.sha256(shard).hexdigest()
+                for j, paridade in enumerate(codificador.codificar(shards_dados, tamanho_shard)):
+                    id_fragmento = faixa * (k + m) + k + j
+                    caminho_paridade = Path(f'{caminho_arquivo}.paridade_{id_fragmento}')
+                    caminho_paridade.write_bytes(paridade)
+                    temporarios.append(caminho_paridade)
+                    fragmentos.append({
+                        'id_fragmento': id_fragmento,
+                        'blocos': partial(self._ler_intervalo, caminho_paridade, 0, len(paridade)),
+                        'checksum': hashlib.sha256(paridade).hexdigest(),
+                        'tamanho': len(paridade),
+                        'replicas': 1,
+                        'grupo': faixa
+                    })
+        
+        return fragmentos, {'estrategia': 'erasure', 'k': k, 'm': m, 'tamanho_faixa': tamanho_faixa}, temporarios
+    
+    # Chunks definidos pelo conteúdo (CDC_MINIMO/CDC_MEDIO/CDC_MAXIMO), endereçados pelo SHA-256
+    # Trechos repetidos, no mesmo arquivo ou em outros, viram o mesmo chunk e são guardados uma vez só
+    def _fragmentar_cdc(self, caminho_arquivo, tamanho_arquivo):
+        """Divide o arquivo em chunks de conteúdo e calcula o hash de cada um (na mesma leitura da busca de cortes)"""
+        from deduplicacao import chunks_cdc
+        fragmentos = []
+        for i, (inicio, tamanho, hash_chunk) in enumerate(chunks_cdc(caminho_arquivo, self.cdc_minimo, self.cdc_medio, self.cdc_maximo)):
+            fragmentos.append({
+                'id_fragmento': i,
+                'hash': hash_chunk,
+                'blocos': partial(self._ler_intervalo, caminho_arquivo, inicio, tamanho),
+                'tamanho': tamanho,
+                'replicas': self.replicas_fragmento,
+                'grupo': i
+            })
+        return fragmentos, {'estrategia': 'cdc'}, []
+    
+    # Nome do arquivo de um fragmento nos nodos: chunks deduplicados são endereçados pelo hash
+    @staticmethod
+    def _nome_fragmento(id_arquivo, fragmento):
+        """Retorna 'chunk_<sha256>' ou 'file_<id>_frag_<n>'"""
+        if fragmento.get('hash'):
+            return f'chunk_{fragmento["hash"]}'
+        return f'file_{id_arquivo}_frag_{fragmento["id_fragmento"]}'
+    
+    # SHA-256 esperado do conteúdo de um fragmento (o de um chunk é o próprio hash; arquivos antigos não têm)
+    @staticmethod
+    def _checksum(fragmento):
+        """Retorna o checksum do fragmento ou None"""
+        return fragmento.get('checksum') or fragmento.get('hash')
+    
+    # Lê um intervalo de um arquivo em blocos de tamanho fixo
+    def _ler_intervalo(self, caminho, inicio, tamanho):
+        """Gera os bytes de [inicio, inicio + tamanho) em blocos"""
+        with open(caminho, 'rb') as f:
+            f.seek(inicio)
+            restante = tamanho
+            while restante > 0:
+                bloco = f.read(min(self.tamanho_bloco, restante))
+                if not bloco:
+                    break
+                restante -= len(bloco)
+                yield bloco
+    
+    # Grava um stream em disco bloco a bloco, num temporário trocado por rename no final
+    # Com 'hash_esperado' o conteúdo é conferido antes do rename (HashDivergente se não bater)
+    # Com 'duravel' o conteúdo (fsync antes do rename) e o rename (fsync do diretório) já estão
+    # no disco quando a função retorna: uma réplica confirmada sobrevive a uma queda de energia
+    # Com 'resumo' (um hashlib.sha256()) o conteúdo gravado também é somado nele, sem reler o arquivo depois
+    def _gravar_stream(self, caminho_destino, blocos, hash_esperado=None, duravel=False, resumo=None):
+        """Grava os blocos em caminho_destino de forma atômica e retorna o total de bytes"""
+        temporario = self.dir_temporario / f'{caminho_destino.name}.{threading.get_ident()}.tmp'
+        if resumo is None and hash_esperado:
+            resumo = hashlib.sha256()
+        total = 0
+        try:
+            with open(temporario, 'wb') as f:
+                for bloco in blocos:
+                    f.write(bloco)
+                    total += len(bloco)
+                    if resumo is not None:
+                        resumo.update(bloco)
+                if duravel:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if hash_esperado and resumo.hexdigest() != hash_esperado:
+                raise HashDivergente(f'{caminho_destino.name}: conteúdo com hash {resumo.hexdigest()}')
+            os.replace(temporario, caminho_destino)
+            if duravel:
+                self._sincronizar_diretorio(caminho_destino.parent)
+        finally:
+            if temporario.exists():
+                temporario.unlink()
+        return total
+    
+    # fsync de um diretório: torna duráveis os renames feitos nele (no Windows não há como abrir um diretório)
+    @staticmethod
+    def _sincronizar_diretorio(diretorio):
+        if os.name != 'posix':
+            return
+        descritor = os.open(diretorio, os.O_RDONLY)
+        try:
+            os.fsync(descritor)
+        finally:
+            os.close(descritor)
+    
+    # Tamanho de um stream que aceita seek, sem mudar a posição atual
+    @staticmethod
+    def _tamanho_stream(stream):
+        """Retorna o tamanho do que falta ler ou None se o stream não aceita seek"""
+        try:
+            posicao = stream.tell()
+            tamanho = stream.seek(0, os.SEEK_END) - posicao
+            stream.seek(posicao)
+            return tamanho
+        except (AttributeError, OSError, ValueError):
+            return None
+    
+    # Lê o corpo de uma requisição em blocos (sem carregar tudo na memória)
+    def _blocos_do_stream(self, stream):
+        """Gera blocos de um stream de entrada"""
+        while True:
+            bloco = stream.read(self.tamanho_bloco)
+            if not bloco:
+                break
+            yield bloco
+    
+    # Grava uma réplica de um fragmento num nodo (localmente ou via HTTP)
+    # Um chunk que o nodo já tem não é gravado nem transferido de novo
+    def _gravar_replica(self, id_nodo, id_arquivo, fragmento):
+        """Grava uma réplica e retorna True se ela ficou durável"""
+        nome_fragmento = self._nome_fragmento(id_arquivo, fragmento)
+        
+        if id_nodo != self.id_nodo:
+            # Envia para outro nodo
+            return self._enviar_fragmento_para_nodo(id_nodo, nome_fragmento, fragmento['blocos'], fragmento.get('hash'),
+                                                    self._checksum(fragmento))
+        
+        # Salva localmente
+        try:
+            if fragmento.get('hash') and self._fragmento_existe(nome_fragmento):
+                return True
+            self._gravar_fragmento_local(nome_fragmento, fragmento['blocos'](), self._checksum(fragmento))
+            self.registrar_log(f'Fragmento {fragmento["id_fragmento"]} do arquivo {id_arquivo} salvo localmente', 'debug', file_id=id_arquivo, fragment_id=fragmento['id_fragmento'])
+            return True
+        except Exception as e:
+            self.registrar_log(f'ERRO ao salvar fragmento {fragmento["id_fragmento"]} do arquivo {id_arquivo} localmente: {e}', file_id=id_arquivo, fragment_id=fragmento['id_fragmento'])
+            return False
+    
+    # Espera até 'quorum' réplicas de um fragmento ficarem duráveis
+    def _aguardar_quorum(self, futuros, quorum):
+        """Retorna (nodos gravados, nodos ainda em andamento)"""
+        concluidos = 0
+        for futuro in as_completed(futuros):
+            if futuro.result():
+                concluidos += 1
+                if concluidos >= quorum:
+                    break
+        
+        # Uma só olhada em cada futuro: o que terminou depois do quorum também conta como gravado
+        gravados, pendentes = [], []
+        for futuro, id_nodo in futuros.items():
+            if not futuro.done():
+                pendentes.append(id_nodo)
+            elif futuro.result():
+                gravados.append(id_nodo)
+        return gravados, pendentes
+    
+    # Comprime os fragmentos que valem a pena (só os que têm 'inicio' no staging: adaptativa e fixa)
+    # O fragmento comprimido passa a ler de um temporário próprio; 'tamanho' vira o tamanho gravado
+    # e 'tamanho_original' guarda o tamanho dentro do arquivo (usado no download e nos Ranges)
+    def _comprimir_fragmentos(self, fragmentos, caminho_staging):
+        """Retorna os temporários criados"""
+        temporarios = []
+        for fragmento in fragmentos:
+            if 'inicio' not in fragmento or 'hash' in fragmento:
+                continue
+            inicio, tamanho = fragmento['inicio'], fragmento['tamanho']
+            amostras = [b''.join(self._ler_intervalo(caminho_staging, inicio + deslocamento, tamanho_amostra))
+                        for deslocamento, tamanho_amostra in self.compressao.amostras(tamanho)]
+            escolha = self.compressao.escolher(amostras)
+            if escolha is None:
+                self.metricas.incrementar('compressed_fragments_total', codec='none')
+                continue
+            
+            codec, nivel = escolha
+            caminho = Path(f'{caminho_staging}.{fragmento["id_fragmento"]}.{codec}')
+            temporarios.append(caminho)
+            medicao = {}
+            resumo = hashlib.sha256()
+            tamanho_comprimido = self._gravar_stream(caminho, comprimir(fragmento['blocos'](), codec, nivel, medicao), resumo=resumo)
+            self._registrar_compressao(codec, 'compress', medicao)
+            if tamanho_comprimido > tamanho * (1 - self.compressao.ganho_minimo):
+                # a amostra enganou: o fragmento inteiro não encolheu o bastante
+                self.metricas.incrementar('compressed_fragments_total', codec='none')
+                continue
+            
+            self.metricas.incrementar('compressed_fragments_total', codec=codec)
+            self.metricas.incrementar('compression_bytes_total', tamanho, codec=codec, kind='original')
+            self.metricas.incrementar('compression_bytes_total', tamanho_comprimido, codec=codec, kind='stored')
+            fragmento.update({
+                'blocos': partial(self._ler_intervalo, caminho, 0, tamanho_comprimido),
+                'checksum': resumo.hexdigest(),
+                'tamanho': tamanho_comprimido,
+                'tamanho_original': tamanho,
+                'codec': codec
+            })
+        return temporarios
+    
+    # Soma o tempo de CPU de uma compressão ou descompressão nas métricas
+    def _registrar_compressao(self, codec, operacao, medicao):
+        """operacao: 'compress' ou 'decompress'"""
+        self.metricas.incrementar('compression_cpu_seconds_total', medicao.get('cpu', 0), codec=codec, operation=operacao)
     
     # Distribui os fragmentos entre os nodos e atualiza o banco de dados
-    def _distribuir_fragmentos(self, fragmentos, replicas_por_fragmento, id_arquivo, nome_arquivo):
+    # Todas as réplicas são gravadas em paralelo; a resposta sai quando cada fragmento tem
+    # 'quorum_escrita' réplicas duráveis e o resto termina em segundo plano
+    # Chunks com hash já indexados (ou repetidos no próprio arquivo) reaproveitam os nodos onde já estão
+    def _distribuir_fragmentos(self, fragmentos, id_arquivo, nome_arquivo, tamanho_arquivo, info_estrategia):
         """Distribui fragmentos entre os nodos com menor carga"""
-        bd = self._ler_bd()
-        localizacoes_fragmentos = []
+        # Lê os contadores uma vez; as gravações em andamento entram como reserva no posicionador
+        self.posicionador.atualizar_armazenamento(self.bd.armazenamento_nodos())
+        # Os chunks do arquivo ficam reservados até o fim do upload: um delete concorrente não os apaga
+        # entre a consulta ao índice e o salvar_arquivo
+        tamanhos_chunks = {f['hash']: f['tamanho'] for f in fragmentos if 'hash' in f}
+        chunks_conhecidos = self.bd.reservar_chunks(tamanhos_chunks) if tamanhos_chunks else {}
+        futuros_por_fragmento = []  # [(fragmento, {future: id_nodo})]
+        sem_uso = []
+        try:
+            return self._gravar_fragmentos(fragmentos, id_arquivo, nome_arquivo, tamanho_arquivo, info_estrategia,
+                                           chunks_conhecidos, futuros_por_fragmento)
+        except QuorumNaoAtingido:
+            sem_uso = self._descartar_replicas(futuros_por_fragmento)
+            raise
+        finally:
+            # as réplicas descartadas só são apagadas depois de devolver a reserva: um chunk que
+            # outro arquivo usa continua com referência e fica nos nodos
+            if tamanhos_chunks:
+                sem_uso.extend(self.bd.liberar_chunks(list(tamanhos_chunks)))
+            if sem_uso:
+                self._apagar_sem_uso(id_arquivo, sem_uso)
+    
+    # Upload sem quorum: cancela as réplicas que ainda não começaram, espera as que estão em
+    # andamento e devolve todas as que chegaram a ser gravadas (o arquivo não vai para o banco)
+    def _descartar_replicas(self, futuros_por_fragmento):
+        """Retorna as réplicas gravadas, no formato das localizações de fragmento"""
+        replicas = {}
+        for fragmento, futuros in futuros_por_fragmento:
+            for futuro, id_nodo in futuros.items():
+                if not futuro.cancel():
+                    replicas.setdefault(futuro, (fragmento, id_nodo))
+        wait(replicas)
         
-        for fragmento in fragmentos:
-            # Escolhe nodos com menor carga para este fragmento
-            nodos_alvo = self._obter_nodos_menos_carregados(replicas_por_fragmento)
+        gravadas = []
+        for futuro, (fragmento, id_nodo) in replicas.items():
+            if futuro.result():
+                gravada = {'id_nodo': id_nodo, 'id_fragmento': fragmento['id_fragmento'], 'tamanho': fragmento['tamanho']}
+                if 'hash' in fragmento:
+                    gravada['hash'] = fragmento['hash']
+                gravadas.append(gravada)
+        return gravadas
+    
+    # Grava as réplicas de todos os fragmentos e registra o arquivo (corpo de _distribuir_fragmentos)
+    # As réplicas submetidas ficam em 'futuros_por_fragmento' para o descarte se faltar quorum
+    def _gravar_fragmentos(self, fragmentos, id_arquivo, nome_arquivo, tamanho_arquivo, info_estrategia,
+                           chunks_conhecidos, futuros_por_fragmento):
+        """Retorna (localizações dos fragmentos, futuros das réplicas ainda em andamento)"""
+        futuros_por_hash = {}  # {hash: {future: id_nodo}} da primeira ocorrência no arquivo
+        
+        for _, grupo in groupby(fragmentos, key=lambda f: f['grupo']):
+            grupo = list(grupo)
             
-            for id_nodo in nodos_alvo:
-                # Salva o fragmento
-                nome_fragmento = f'file_{id_arquivo}_frag_{fragmento["id_fragmento"]}'
-                
-                if id_nodo == self.id_nodo:
-                    # Salva localmente
-                    caminho_fragmento = self.dir_arquivos / nome_fragmento
-                    with open(caminho_fragmento, 'wb') as f:
-                        f.write(fragmento['dados'])
-                    self.registrar_log(f'Fragmento {fragmento["id_fragmento"]} do arquivo {id_arquivo} salvo localmente')
+            # Chunk repetido: não envia nada, confere só a existência nos nodos que já o têm
+            novos = []
+            for fragmento in grupo:
+                hash_chunk = fragmento.get('hash')
+                if hash_chunk in futuros_por_hash:
+                    futuros_por_fragmento.append((fragmento, futuros_por_hash[hash_chunk]))
+                elif hash_chunk in chunks_conhecidos:
+                    futuros = {self.executor_replicas.submit(self._gravar_replica, id_nodo, id_arquivo, fragmento): id_nodo
+                               for id_nodo in chunks_conhecidos[hash_chunk]}
+                    futuros_por_hash[hash_chunk] = futuros
+                    futuros_por_fragmento.append((fragmento, futuros))
                 else:
-                    # Envia para outro nodo
-                    self._enviar_fragmento_para_nodo(id_nodo, id_arquivo, fragmento['id_fragmento'], fragmento['dados'])
-                
-                # Atualiza o armazenamento do nodo
-                bd['armazenamento_nodo'][str(id_nodo)] += fragmento['tamanho']
+                    novos.append(fragmento)
+            
+            # Escolhe nodos vivos, distintos e com menor carga para todas as cópias do grupo
+            nodos_do_grupo = []
+            for fragmento in novos:
+                nodos_alvo = self._obter_nodos_menos_carregados(fragmento['replicas'], fragmento['tamanho'], nodos_do_grupo)
+                if not nodos_alvo:
+                    raise QuorumNaoAtingido(f'Fragmento {fragmento["id_fragmento"]}: nenhum nodo vivo disponível')
+                nodos_do_grupo.extend(nodos_alvo)
                 
-                localizacoes_fragmentos.append({
-                    'id_nodo': id_nodo,
-                    'id_fragmento': fragmento['id_fragmento'],
-                    'tamanho': fragmento['tamanho']
-                })
+                futuros = {}
+                for id_nodo in nodos_alvo:
+                    futuro = self.executor_replicas.submit(self._gravar_replica, id_nodo, id_arquivo, fragmento)
+                    futuro.add_done_callback(lambda _, id_nodo=id_nodo, tamanho=fragmento['tamanho']: self.posicionador.liberar(id_nodo, tamanho))
+                    futuros[futuro] = id_nodo
+                futuros_por_fragmento.append((fragmento, futuros))
+                if 'hash' in fragmento:
+                    futuros_por_hash[fragmento['hash']] = futuros
         
-        # Atualiza banco de dados
-        bd['arquivos'][str(id_arquivo)] = {
+        localizacoes_fragmentos = []
+        em_andamento = set()
+        realocados = set()
+        
+        for fragmento, futuros in futuros_por_fragmento:
+            quorum = min(self.quorum_escrita or len(futuros), len(futuros))
+            gravados, pendentes = self._aguardar_quorum(futuros, quorum)
+            
+            hash_chunk = fragmento.get('hash')
+            if len(gravados) < quorum and hash_chunk in chunks_conhecidos and hash_chunk not in realocados:
+                realocados.add(hash_chunk)
+                quorum = self._realocar_chunk(id_arquivo, fragmento, futuros)
+                gravados, pendentes = self._aguardar_quorum(futuros, quorum)
+            
+            if len(gravados) < quorum:
+                raise QuorumNaoAtingido(
+                    f'Fragmento {fragmento["id_fragmento"]}: {len(gravados)} de {quorum} réplicas gravadas'
+                )
+            
+            # Registra as réplicas gravadas e as que ainda estão em andamento (as que falharam ficam de fora)
+            for futuro, id_nodo in futuros.items():
+                if id_nodo in gravados or id_nodo in pendentes:
+                    localizacao = {
+                        'id_nodo': id_nodo,
+                        'id_fragmento': fragmento['id_fragmento'],
+                        'tamanho': fragmento['tamanho']
+                    }
+                    for chave in ('hash', 'checksum', 'codec', 'tamanho_original'):
+                        if chave in fragmento:
+                            localizacao[chave] = fragmento[chave]
+                    localizacoes_fragmentos.append(localizacao)
+                if id_nodo in pendentes and futuro not in em_andamento:
+                    futuro.add_done_callback(partial(self._registrar_replica_em_segundo_plano, id_arquivo, fragmento['id_fragmento'], id_nodo))
+                    em_andamento.add(futuro)
+        
+        # Atualiza banco de dados (só o registro deste arquivo)
+        self.bd.salvar_arquivo(id_arquivo, {
             'nome': nome_arquivo,
-            'tamanho': sum(f['tamanho'] for f in fragmentos),
-            'fragmentos': localizacoes_fragmentos
-        }
-        self._escrever_bd(bd)
+            'tamanho': tamanho_arquivo,
+            'fragmentos': localizacoes_fragmentos,
+            **info_estrategia
+        })
+        
+        return localizacoes_fragmentos, list(em_andamento)
+    
+    # Chunk indexado que não atingiu o quorum nos nodos do índice (fora do ar ou sem o arquivo):
+    # grava cópias novas em outros nodos, como um chunk novo. As sondagens que falharam saem de
+    # 'futuros' (compartilhado com as repetições do chunk no arquivo) e o salvar_arquivo acrescenta
+    # os nodos novos no índice
+    def _realocar_chunk(self, id_arquivo, fragmento, futuros):
+        """Acrescenta em 'futuros' as gravações nos nodos novos e retorna o quorum do fragmento"""
+        sondados = list(futuros.values())
+        for futuro in [futuro for futuro in futuros if futuro.done() and not futuro.result()]:
+            del futuros[futuro]
         
-        return localizacoes_fragmentos
+        faltam = fragmento['replicas'] - len(futuros)
+        nodos_alvo = self._obter_nodos_menos_carregados(faltam, fragmento['tamanho'], sondados) if faltam > 0 else []
+        for id_nodo in nodos_alvo:
+            futuro = self.executor_replicas.submit(self._gravar_replica, id_nodo, id_arquivo, fragmento)
+            futuro.add_done_callback(lambda _, id_nodo=id_nodo, tamanho=fragmento['tamanho']: self.posicionador.liberar(id_nodo, tamanho))
+            futuros[futuro] = id_nodo
+        
+        self.registrar_log(f'Chunk {fragmento["hash"]} sem quorum nos nodos do índice {sondados}: gravando em {nodos_alvo}',
+                           'warning', file_id=id_arquivo, fragment_id=fragmento['id_fragmento'])
+        return max(1, min(self.quorum_escrita or fragmento['replicas'], len(futuros)))
+    
+    # Loga o resultado de uma réplica que terminou depois da resposta do upload
+    def _registrar_replica_em_segundo_plano(self, id_arquivo, id_fragmento, id_nodo, futuro):
+        """Callback das réplicas gravadas em segundo plano"""
+        if not futuro.result():
+            self.registrar_log(f'ERRO: réplica do fragmento {id_fragmento} do arquivo {id_arquivo} no nodo {id_nodo} falhou em segundo plano',
+                              file_id=id_arquivo, fragment_id=id_fragmento, peer=id_nodo)
+    
+    # Remove arquivos temporários quando todas as tarefas que ainda leem deles terminarem
+    def _remover_quando_concluir(self, caminhos, futuros):
+        """Apaga 'caminhos' depois que os futuros terminarem"""
+        def remover():
+            for caminho in caminhos:
+                caminho.unlink(missing_ok=True)
+        
+        if not futuros:
+            remover()
+            return
+        
+        restantes = [len(futuros)]
+        lock_restantes = threading.Lock()
+        
+        def concluir(_):
+            with lock_restantes:
+                restantes[0] -= 1
+                if restantes[0] == 0:
+                    remover()
+        
+        for futuro in futuros:
+            futuro.add_done_callback(concluir)
     
-    # Envia um fragmento para outro nodo via requisição HTTP POST
-    def _enviar_fragmento_para_nodo(self, id_nodo_alvo, id_arquivo, id_fragmento, dados):
-        """Envia um fragmento para outro nodo via HTTP"""
+    # Cria o cliente HTTP compartilhado: um pool de conexões keep-alive por nodo
+    def _criar_sessao_http(self):
+        """Cria a sessão HTTP usada entre nodos"""
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(
+            pool_connections=len(self.portas_http),  # um pool por nodo
+            pool_maxsize=self.tamanho_pool_http,     # conexões mantidas abertas por nodo
+            pool_block=True,                         # passou do limite: espera uma conexão livre
+            # uma nova tentativa para GET/HEAD/DELETE numa conexão fechada pelo outro lado
+            # (POST nunca: o corpo é um gerador e não dá para reenviar)
+            max_retries=RepeticaoKeepAlive(total=1, connect=0, read=1, status=0, other=0, redirect=0)
+        )
+        sessao.mount('http://', adaptador)
+        return sessao
+    
+    # Monta a URL HTTP de outro nodo
+    def _url_nodo(self, id_nodo, caminho):
+        """Retorna a URL de 'caminho' no nodo id_nodo"""
+        return f'http://localhost:{self.portas_http[id_nodo - 1]}{caminho}'
+    
+    # Envia um fragmento para outro nodo via HTTP POST com corpo em chunked transfer encoding
+    # Para chunks com hash pergunta antes (HEAD) se o nodo já tem o conteúdo
+    def _enviar_fragmento_para_nodo(self, id_nodo_alvo, nome_fragmento, blocos, hash_chunk=None, checksum=None):
+        """Envia um fragmento para outro nodo via HTTP (com 'checksum' o nodo confere o conteúdo antes de gravar)"""
+        url = self._url_nodo(id_nodo_alvo, '/store_fragment')
+        parametros = {'nome': nome_fragmento}
+        if checksum and not hash_chunk:
+            parametros['checksum'] = checksum
+        inicio = time.perf_counter()
+        enviados = [0]
+        sucesso = False
         try:
-            porta_alvo = self.portas_http[id_nodo_alvo - 1]
-            url = f'http://localhost:{porta_alvo}/store_fragment'
+            if hash_chunk:
+                resposta = self.sessao_http.head(url, params={'nome': nome_fragmento}, timeout=self.timeout_http)
+                if resposta.status_code == 200:
+                    sucesso = True
+                    return True
             
-            arquivos = {'fragment': (f'file_{id_arquivo}_frag_{id_fragmento}', io.BytesIO(dados))}
-            resposta = requests.post(url, files=arquivos, timeout=5)
+            # um gerador como corpo faz o requests usar Transfer-Encoding: chunked
+            resposta = self.sessao_http.post(
+                url,
+                params=parametros,
+                data=self._contar_blocos(blocos(), enviados),
+                headers={'Content-Type': 'application/octet-stream'},
+                timeout=self.timeout_http
+            )
             
             if resposta.status_code == 200:
-                self.registrar_log(f'Fragmento {id_fragmento} do arquivo {id_arquivo} enviado para nodo {id_nodo_alvo}')
-            else:
-                self.registrar_log(f'ERRO ao enviar fragmento para nodo {id_nodo_alvo}: {resposta.status_code}')
+                self.registrar_log(f'Fragmento {nome_fragmento} enviado para nodo {id_nodo_alvo}', 'debug', fragment=nome_fragmento, peer=id_nodo_alvo)
+                sucesso = True
+                return True
+            self.registrar_log(f'ERRO ao enviar fragmento para nodo {id_nodo_alvo}: {resposta.status_code}', fragment=nome_fragmento, peer=id_nodo_alvo)
+        except requests.ConnectionError as e:
+            # Nodo inacessível: sai da escolha de nodos até o heartbeat vê-lo de novo
+            self.posicionador.marcar_mortos([id_nodo_alvo])
+            self.registrar_log(f'ERRO ao enviar fragmento para nodo {id_nodo_alvo}: {e}', fragment=nome_fragmento, peer=id_nodo_alvo)
         except Exception as e:
-            self.registrar_log(f'ERRO ao enviar fragmento para nodo {id_nodo_alvo}: {e}')
+            self.registrar_log(f'ERRO ao enviar fragmento para nodo {id_nodo_alvo}: {e}', fragment=nome_fragmento, peer=id_nodo_alvo)
+        finally:
+            self._registrar_transferencia(id_nodo_alvo, 'store', enviados[0], inicio, sucesso)
+        return False
     
     # Configura todas as rotas HTTP do servidor Flask
     def _configurar_rotas(self):
         """Configura rotas HTTP do Flask"""
         
+        @self.app.before_request
+        def iniciar_cronometro():
+            g.inicio_requisicao = time.perf_counter()
+        
+        @self.app.after_request
+        def medir_requisicao(resposta):
+            inicio = g.get('inicio_requisicao')
+            if inicio is not None:
+                rota = request.endpoint or 'unknown'
+                self.metricas.observar('http_request_seconds', time.perf_counter() - inicio, endpoint=rota, method=request.method)
+                self.metricas.incrementar('http_responses_total', endpoint=rota, method=request.method, status=resposta.status_code)
+            return resposta
+        
         @self.app.route('/upload', methods=['POST'])
         def upload():
+            if not self.limite_uploads.acquire(blocking=False):
+                return jsonify({'error': 'Muitos uploads em andamento, tente de novo'}), 503, {'Retry-After': '1'}
+            temporarios = []
+            inicio_upload = time.perf_counter()
             try:
-                if 'file' not in request.files:
-                    return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+                # Multipart (-F file=@...) ou corpo cru (--data-binary @... ?filename=nome)
+                if request.mimetype == 'multipart/form-data':
+                    if 'file' not in request.files:
+                        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+                    arquivo = request.files['file']
+                    nome_arquivo = arquivo.filename
+                    stream = arquivo.stream
+                    tamanho_previsto = self._tamanho_stream(stream)  # o werkzeug já guardou a parte num temporário
+                else:
+                    nome_arquivo = request.args.get('filename', '')
+                    stream = request.stream
+                    tamanho_previsto = request.content_length  # None em chunked
                 
-                arquivo = request.files['file']
-                if arquivo.filename == '':
+                if not nome_arquivo:
                     return jsonify({'error': 'Nome de arquivo vazio'}), 400
                 
-                # Lê o arquivo
-                dados_arquivo = arquivo.read()
-                nome_arquivo = arquivo.filename
+                # Recebe o arquivo em blocos numa área de staging local (memória constante); os checksums
+                # dos fragmentos saem dessa mesma passada quando as faixas são conhecidas antes (_faixas_fragmentos)
+                caminho_staging = self.dir_temporario / f'upload_{threading.get_ident()}_{time.time_ns()}'
+                temporarios.append(caminho_staging)
+                faixas = self._faixas_fragmentos(tamanho_previsto)
+                resumos = None if faixas is None else ChecksumsFaixas(faixas)
+                blocos = self._blocos_do_stream(stream)
+                with self.metricas.cronometrar('upload_stage_seconds', stage='receive'):
+                    tamanho_arquivo = self._gravar_stream(caminho_staging, blocos if resumos is None else resumos.passar(blocos))
+                # um tamanho diferente do previsto muda a divisão: os fragmentos calculam os seus
+                checksums = None
+                if resumos is not None and tamanho_previsto in (None, tamanho_arquivo):
+                    checksums = resumos.checksums()
+                self.metricas.incrementar('client_bytes_total', tamanho_arquivo, direction='in')
                 
                 # Gera novo ID
-                bd = self._ler_bd()
-                id_arquivo = bd['ultimo_id'] + 1
-                bd['ultimo_id'] = id_arquivo
-                self._escrever_bd(bd)
+                id_arquivo = self.bd.proximo_id()
                 
                 # Fragmenta e distribui
-                fragmentos, replicas = self._fragmentar_arquivo(dados_arquivo, nome_arquivo)
-                localizacoes = self._distribuir_fragmentos(fragmentos, replicas, id_arquivo, nome_arquivo)
+                with self.metricas.cronometrar('upload_stage_seconds', stage='fragment'):
+                    fragmentos, info_estrategia, temporarios_estrategia = self._fragmentar_arquivo(caminho_staging, tamanho_arquivo, checksums)
+                temporarios.extend(temporarios_estrategia)
+                if self.compressao is not None:
+                    with self.metricas.cronometrar('upload_stage_seconds', stage='compress'):
+                        temporarios.extend(self._comprimir_fragmentos(fragmentos, caminho_staging))
+                with self.metricas.cronometrar('upload_stage_seconds', stage='distribute'):
+                    localizacoes, em_andamento = self._distribuir_fragmentos(
+                        fragmentos, id_arquivo, nome_arquivo, tamanho_arquivo, info_estrategia
+                    )
+                self.metricas.observar('upload_stage_seconds', time.perf_counter() - inicio_upload, stage='total')
+                
+                # As réplicas em segundo plano ainda leem do staging: ele é apagado quando terminarem
+                self._remover_quando_concluir(temporarios, em_andamento)
+                temporarios = []
                 
-                self.registrar_log(f'Arquivo {nome_arquivo} (ID: {id_arquivo}) recebido e distribuído')
+                self.registrar_log(f'Arquivo {nome_arquivo} (ID: {id_arquivo}) recebido e distribuído', file_id=id_arquivo)
                 
                 return jsonify({
                     'id': id_arquivo,
                     'filename': nome_arquivo,
-                    'size': len(dados_arquivo),
+                    'size': tamanho_arquivo,
                     'fragments': len(fragmentos),
                     'locations': localizacoes
                 }), 200
@@ -247,87 +1104,155 @@ class Nodo:
             except Exception as e:
                 self.registrar_log(f'ERRO no upload: {e}')
                 return jsonify({'error': str(e)}), 500
+            finally:
+                self.limite_uploads.release()
+                for caminho in temporarios:
+                    caminho.unlink(missing_ok=True)
         
-        @self.app.route('/download/<int:file_id>', methods=['GET'])
-        def download(file_id):
+        # Monta a resposta do download (a rota abaixo só controla o limite de downloads simultâneos)
+        def baixar(file_id):
+            inicio_download = time.perf_counter()
             try:
-                bd = self._ler_bd()
+                with self.metricas.cronometrar('download_stage_seconds', stage='metadata'):
+                    info_arquivo = self.bd.obter_arquivo(file_id)
+                    fragmentos_ordenados = None if info_arquivo is None else self._agrupar_fragmentos(file_id, info_arquivo)
                 
-                if str(file_id) not in bd['arquivos']:
+                if info_arquivo is None:
                     return jsonify({'error': 'Arquivo não encontrado'}), 404
                 
-                info_arquivo = bd['arquivos'][str(file_id)]
-                
-                # Agrupa fragmentos por id_fragmento
-                fragmentos_por_id = {}
-                for frag in info_arquivo['fragmentos']:
-                    id_frag = frag['id_fragmento']
-                    if id_frag not in fragmentos_por_id:
-                        fragmentos_por_id[id_frag] = []
-                    fragmentos_por_id[id_frag].append(frag['id_nodo'])
-                
-                # Reconstrói o arquivo
-                dados_arquivo = b''
-                for id_frag in sorted(fragmentos_por_id.keys()):
-                    # Tenta buscar de um dos nodos que tem este fragmento
-                    dados_fragmento = None
-                    for id_nodo in fragmentos_por_id[id_frag]:
-                        dados_fragmento = self._obter_fragmento(file_id, id_frag, id_nodo)
-                        if dados_fragmento:
-                            break
-                    
-                    if dados_fragmento is None:
-                        return jsonify({'error': f'Fragmento {id_frag} não encontrado'}), 500
-                    
-                    dados_arquivo += dados_fragmento
-                
-                self.registrar_log(f'Arquivo {file_id} ({info_arquivo["nome"]}) baixado')
-                
-                return send_file(
-                    io.BytesIO(dados_arquivo),
-                    download_name=info_arquivo['nome'],
-                    as_attachment=True
+                tamanho_arquivo = info_arquivo['tamanho']
+                
+                # Range: só um intervalo por requisição, mapeado nos fragmentos que o cobrem
+                inicio, fim, status = 0, tamanho_arquivo, 200
+                if request.range is not None and len(request.range.ranges) == 1:
+                    intervalo = request.range.range_for_length(tamanho_arquivo)
+                    if intervalo is None:
+                        return Response(status=416, headers={'Content-Range': f'bytes */{tamanho_arquivo}'})
+                    inicio, fim = intervalo
+                    status = 206
+                
+                # Arquivo de um único fragmento local e sem compressão: send_file (sendfile no servidor que suportar, Range incluso)
+                if len(fragmentos_ordenados) == 1 and info_arquivo.get('estrategia') != 'erasure':
+                    _, _, nodos, nome_fragmento, checksum, codec = fragmentos_ordenados[0]
+                    caminho_local = None if codec else self._fragmento_local(nome_fragmento, nodos, checksum)
+                    if isinstance(caminho_local, Path):
+                        self.registrar_log(f'Arquivo {file_id} ({info_arquivo["nome"]}) baixado', file_id=file_id)
+                        self.metricas.incrementar('client_bytes_total', fim - inicio, direction='out')
+                        return send_file(caminho_local, download_name=info_arquivo['nome'], as_attachment=True)
+                
+                # Stream dos fragmentos em ordem, buscando os próximos em paralelo
+                if info_arquivo.get('estrategia') == 'erasure':
+                    gerador = self._stream_arquivo_erasure(file_id, info_arquivo, fragmentos_ordenados, inicio, fim)
+                else:
+                    pedacos = self._pedacos_do_intervalo(fragmentos_ordenados, inicio, fim)
+                    gerador = self._stream_arquivo(file_id, info_arquivo, pedacos)
+                try:
+                    # o primeiro bloco sai antes do cabeçalho: se nada estiver acessível ainda dá pra responder 500
+                    primeiro_bloco = next(gerador, b'')
+                except FragmentoIndisponivel as e:
+                    return jsonify({'error': str(e)}), 500
+                self.metricas.observar('download_stage_seconds', time.perf_counter() - inicio_download, stage='first_byte')
+                
+                cabecalhos = {
+                    'Content-Length': str(fim - inicio),
+                    'Content-Disposition': self._cabecalho_anexo(info_arquivo['nome']),
+                    'Accept-Ranges': 'bytes'
+                }
+                if status == 206:
+                    cabecalhos['Content-Range'] = f'bytes {inicio}-{fim - 1}/{tamanho_arquivo}'
+                
+                return Response(
+                    self._medir_stream(chain([primeiro_bloco], gerador), inicio_download),
+                    status=status,
+                    mimetype=mimetypes.guess_type(info_arquivo['nome'])[0] or 'application/octet-stream',
+                    headers=cabecalhos,
+                    direct_passthrough=True
                 )
                 
             except Exception as e:
-                self.registrar_log(f'ERRO no download: {e}')
+                self.registrar_log(f'ERRO no download: {e}', file_id=file_id)
                 return jsonify({'error': str(e)}), 500
         
-        @self.app.route('/store_fragment', methods=['POST'])
+        @self.app.route('/download/<int:file_id>', methods=['GET'])
+        def download(file_id):
+            if not self.limite_downloads.acquire(blocking=False):
+                return jsonify({'error': 'Muitos downloads em andamento, tente de novo'}), 503, {'Retry-After': '1'}
+            try:
+                resposta = make_response(baixar(file_id))
+            except BaseException:
+                self.limite_downloads.release()
+                raise
+            # o corpo sai depois que a rota retorna: o limite só é liberado quando o servidor fecha a resposta
+            # (call_on_close não serve, as respostas em stream usam direct_passthrough)
+            resposta.response = ClosingIterator(resposta.response, self.limite_downloads.release)
+            return resposta
+        
+        @self.app.route('/store_fragment', methods=['POST', 'HEAD'])
         def store_fragment():
-            """Recebe e armazena um fragmento enviado por outro nodo"""
+            """Recebe e armazena um fragmento enviado por outro nodo
+            
+            Chunks ('chunk_<sha256>') são idempotentes: HEAD responde 200 se o nodo já tem o chunk
+            (404 se não), um POST de chunk existente não grava nada e um conteúdo que não bate com o hash dá 400
+            """
             try:
-                if 'fragment' not in request.files:
-                    return jsonify({'error': 'Nenhum fragmento enviado'}), 400
+                if request.method == 'HEAD':
+                    return Response(status=200 if self._fragmento_existe(Path(request.args.get('nome', '')).name) else 404)
                 
-                arquivo_fragmento = request.files['fragment']
-                nome_fragmento = arquivo_fragmento.filename
+                # Corpo cru em stream (?nome=...) ou multipart legado (fragment=@...)
+                if 'nome' in request.args:
+                    nome_fragmento = request.args['nome']
+                    stream = request.stream
+                else:
+                    if 'fragment' not in request.files:
+                        return jsonify({'error': 'Nenhum fragmento enviado'}), 400
+                    arquivo_fragmento = request.files['fragment']
+                    nome_fragmento = arquivo_fragmento.filename
+                    stream = arquivo_fragmento.stream
                 
-                # Salva o fragmento
-                caminho_fragmento = self.dir_arquivos / nome_fragmento
-                arquivo_fragmento.save(caminho_fragmento)
+                # Salva o fragmento em blocos (só o nome, sem caminho)
+                nome_fragmento = Path(nome_fragmento).name
+                hash_chunk = nome_fragmento[len('chunk_'):] if nome_fragmento.startswith('chunk_') else None
+                if hash_chunk and self._fragmento_existe(nome_fragmento):
+                    return jsonify({'status': 'exists'}), 200
+                checksum = hash_chunk or request.args.get('checksum')
+                self._gravar_fragmento_local(nome_fragmento, self._blocos_do_stream(stream), checksum)
+                self.cache_fragmentos.invalidar(nome_fragmento)
                 
                 return jsonify({'status': 'ok'}), 200
                 
+            except HashDivergente as e:
+                self.registrar_log(f'ERRO ao armazenar fragmento: {e}')
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
                 self.registrar_log(f'ERRO ao armazenar fragmento: {e}')
                 return jsonify({'error': str(e)}), 500
         
         @self.app.route('/list', methods=['GET'])
         def list_files():
-            """Lista todos os arquivos disponíveis"""
+            """Lista os arquivos em páginas (?limit, ?cursor, ?prefix, ?sort=id|name|size, ?order=asc|desc, ?format=ndjson)"""
             try:
-                bd = self._ler_bd()
-                lista_arquivos = []
-                
-                for id_arquivo, info_arquivo in bd['arquivos'].items():
-                    lista_arquivos.append({
-                        'id': int(id_arquivo),
-                        'name': info_arquivo['nome'],
-                        'size': info_arquivo['tamanho']
-                    })
+                consulta = self._consulta_listagem(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            try:
+                if request.args.get('format') == 'ndjson':
+                    return Response(self._exportar_listagem(consulta), mimetype='application/x-ndjson')
                 
-                return jsonify({'files': lista_arquivos}), 200
+                # uma linha a mais só para saber se existe próxima página
+                limite = consulta['limite'] or self.pagina_listagem
+                linhas = self.bd.listar_arquivos(
+                    consulta['ordem'], consulta['decrescente'], consulta['prefixo'], consulta['apos'], limite + 1
+                )
+                proximo = None
+                if len(linhas) > limite:
+                    linhas = linhas[:limite]
+                    proximo = self._cursor_listagem(consulta, linhas[-1])
+                
+                return jsonify({
+                    'files': [self._item_listagem(linha) for linha in linhas],
+                    'next_cursor': proximo
+                }), 200
                 
             except Exception as e:
                 self.registrar_log(f'ERRO ao listar arquivos: {e}')
@@ -335,44 +1260,788 @@ class Nodo:
         
         @self.app.route('/get_fragment/<fragment_filename>', methods=['GET'])
         def get_fragment(fragment_filename):
-            """Retorna um fragmento armazenado localmente"""
+            """Retorna um fragmento armazenado localmente (com ?checksum=... o conteúdo é conferido antes)"""
             try:
-                caminho_fragmento = self.dir_arquivos / fragment_filename
+                nome_fragmento = Path(fragment_filename).name
                 
-                if not caminho_fragmento.exists():
+                if not self._fragmento_existe(nome_fragmento):
                     return jsonify({'error': 'Fragmento não encontrado'}), 404
                 
-                return send_file(caminho_fragmento, as_attachment=True)
+                origem = self._ler_fragmento_local(nome_fragmento, request.args.get('checksum'))
+                if origem is None:
+                    return jsonify({'error': 'Fragmento corrompido'}), 404
+                
+                if isinstance(origem, Path):
+                    return send_file(origem, as_attachment=True)
+                # fragmento de volume: já está em memória (Range tratado pelo make_conditional)
+                resposta = Response(origem, mimetype='application/octet-stream')
+                return resposta.make_conditional(request, accept_ranges=True, complete_length=len(origem))
                 
             except Exception as e:
-                self.registrar_log(f'ERRO ao buscar fragmento: {e}')
+                self.registrar_log(f'ERRO ao buscar fragmento: {e}', fragment=fragment_filename)
                 return jsonify({'error': str(e)}), 500
-    
-    # Busca um fragmento específico localmente ou de outro nodo via HTTP
-    def _obter_fragmento(self, id_arquivo, id_fragmento, id_nodo):
-        """Busca um fragmento de um nodo específico"""
-        nome_fragmento = f'file_{id_arquivo}_frag_{id_fragmento}'
         
-        if id_nodo == self.id_nodo:
-            # Fragmento local
-            caminho_fragmento = self.dir_arquivos / nome_fragmento
-            if caminho_fragmento.exists():
-                with open(caminho_fragmento, 'rb') as f:
-                    return f.read()
-        else:
-            # Fragmento em outro nodo
+        @self.app.route('/membership', methods=['GET'])
+        def membership():
+            """Visão deste nodo sobre a saúde e a latência dos outros"""
+            visao = self.membros.visao()
+            latencias_leitura = self.latencias.resumo()
+            for membro in visao:
+                membro['port'] = self.portas[membro['id'] - 1]
+                membro['http_port'] = self.portas_http[membro['id'] - 1]
+                membro['read_latency_ms'] = latencias_leitura[str(membro['id'])]
+            return jsonify({
+                'node': self.id_nodo,
+                'members': visao,
+                'hedge_threshold_ms': round(self._limiar_hedge() * 1000, 3),
+                'hedged_reads': self.leituras_duplicadas
+            }), 200
+        
+        @self.app.route('/repair_status', methods=['GET'])
+        def repair_status():
+            """Progresso e vazão do reparo de réplicas coordenado por este nodo"""
+            with self.lock_reparo:
+                em_fila = sorted(self.nodos_em_reparo)
+            return jsonify({'node': self.id_nodo, 'queued': em_fila, **self.progresso_reparo.resumo()}), 200
+        
+        @self.app.route('/scrub_status', methods=['GET'])
+        def scrub_status():
+            """Progresso da varredura de integridade dos fragmentos deste nodo"""
+            return jsonify({
+                'node': self.id_nodo,
+                'interval_seconds': self.intervalo_varredura,
+                'quarantined': sum(1 for _ in self.dir_corrompidos.iterdir()),
+                **self.progresso_varredura.resumo()
+            }), 200
+        
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics():
+            return Response(self.metricas.exportar(), mimetype='text/plain; version=0.0.4')
+        
+        @self.app.route('/cache_status', methods=['GET'])
+        def cache_status():
+            """Ocupação e contadores (acertos, faltas, remoções) do cache de fragmentos"""
+            return jsonify({'node': self.id_nodo, **self.cache_fragmentos.estatisticas()}), 200
+        
+        @self.app.route('/health', methods=['GET'])
+        def health():
+            """Liveness: o processo está de pé e atendendo HTTP"""
+            return jsonify({'node': self.id_nodo, 'status': 'ok', 'uptime_seconds': round(time.time() - self.tempo_inicializacao, 3)}), 200
+        
+        @self.app.route('/ready', methods=['GET'])
+        def ready():
+            """Readiness: 200 quando o nodo aceita uploads e downloads, 503 enquanto sobe ou encerra"""
+            pronto = self.pronto.is_set() and self.rodando
+            return jsonify({
+                'node': self.id_nodo,
+                'ready': pronto,
+                'startup_seconds': None if self.tempo_partida is None else round(self.tempo_partida, 3),
+                'checks': {
+                    'tcp': self.socket_servidor is not None,
+                    'http': self.http_pronto.is_set(),
+                    'inventory_reconciled': self.inventario_pronto.is_set(),
+                    'shutting_down': not self.rodando
+                }
+            }), 200 if pronto else 503
+        
+        @self.app.route('/inventory_status', methods=['GET'])
+        def inventory_status():
+            """Inventário dos fragmentos avulsos: tamanho, quantos já conferidos e a última comparação com o disco"""
+            return jsonify({'node': self.id_nodo, **self.inventario.estatisticas()}), 200
+        
+        @self.app.route('/volume_status', methods=['GET'])
+        def volume_status():
+            """Volumes locais: fragmentos, bytes gravados, espaço morto e compactações"""
+            if self.volumes is None:
+                return jsonify({'node': self.id_nodo, 'enabled': False}), 200
+            return jsonify({'node': self.id_nodo, 'enabled': True, 'fragment_limit_bytes': self.volumes.limite_fragmento,
+                            **self.volumes.estatisticas()}), 200
+        
+        @self.app.route('/metadata/<operacao>', methods=['POST'])
+        def metadata(operacao):
+            """Operação de metadados no shard deste nodo (chamada pelos outros nodos no backend distribuido)"""
+            if self.tipo_backend != 'distribuido':
+                return jsonify({'error': 'Backend de metadados não é distribuido'}), 404
+            argumentos = (request.get_json(silent=True) or {}).get('args', [])
+            try:
+                return jsonify({'result': self.bd.executar_local(operacao, argumentos)}), 200
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                self.registrar_log(f'ERRO na operação de metadados {operacao}: {e}')
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/locate/<int:file_id>', methods=['GET'])
+        def locate(file_id):
+            """Nodos donos dos metadados de um arquivo e quais deles estão vivos"""
+            if self.tipo_backend != 'distribuido':
+                return jsonify({'file_id': file_id, 'backend': self.tipo_backend, 'owners': []}), 200
+            donos = self.bd.donos(file_id)
+            vivos = set(self.posicionador.vivos())
+            return jsonify({
+                'file_id': file_id,
+                'backend': self.tipo_backend,
+                'owners': [{'id': id_nodo, 'http_port': self.portas_http[id_nodo - 1], 'alive': id_nodo in vivos}
+                           for id_nodo in donos],
+                'local': self.id_nodo in donos
+            }), 200
+        
+        @self.app.route('/invalidate_cache', methods=['POST'])
+        def invalidate_cache():
+            """Tira do cache os fragmentos de um arquivo removido (chamado pelo nodo que fez a remoção)"""
+            nomes = [Path(nome).name for nome in (request.get_json(silent=True) or {}).get('fragments', [])]
+            self.cache_fragmentos.invalidar(*nomes)
+            return jsonify({'status': 'ok', 'invalidated': len(nomes)}), 200
+        
+        @self.app.route('/delete/<int:file_id>', methods=['DELETE'])
+        def delete(file_id):
+            """Remove um arquivo; chunks deduplicados só são apagados quando nenhum arquivo os usa mais"""
             try:
-                porta_alvo = self.portas_http[id_nodo - 1]
-                url = f'http://localhost:{porta_alvo}/get_fragment/{nome_fragmento}'
-                resposta = requests.get(url, timeout=5)
+                sem_uso = self.bd.remover_arquivo(file_id)
+                
+                if sem_uso is None:
+                    return jsonify({'error': 'Arquivo não encontrado'}), 404
+                
+                futuros = self._apagar_sem_uso(file_id, sem_uso)
+                apagados = sum(1 for futuro in futuros if futuro.result())
+                
+                self.registrar_log(f'Arquivo {file_id} removido ({apagados} de {len(sem_uso)} fragmentos apagados)', file_id=file_id)
+                return jsonify({'id': file_id, 'deleted_fragments': apagados, 'unreferenced_fragments': len(sem_uso)}), 200
                 
-                if resposta.status_code == 200:
-                    return resposta.content
             except Exception as e:
-                self.registrar_log(f'ERRO ao buscar fragmento de nodo {id_nodo}: {e}')
+                self.registrar_log(f'ERRO ao remover arquivo: {e}', file_id=file_id)
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/delete_fragment/<fragment_filename>', methods=['DELETE'])
+        def delete_fragment(fragment_filename):
+            """Apaga um fragmento armazenado localmente"""
+            try:
+                nome_fragmento = Path(fragment_filename).name
+                
+                removido = self._remover_sem_uso_local(nome_fragmento)
+                if removido is None:
+                    return jsonify({'status': 'in_use'}), 200
+                if not removido:
+                    return jsonify({'error': 'Fragmento não encontrado'}), 404
+                
+                self.cache_fragmentos.invalidar(nome_fragmento)
+                return jsonify({'status': 'ok'}), 200
+                
+            except Exception as e:
+                self.registrar_log(f'ERRO ao apagar fragmento: {e}', fragment=fragment_filename)
+                return jsonify({'error': str(e)}), 500
+    
+    # Avisa os outros nodos vivos para tirarem fragmentos do cache (em segundo plano, sem esperar resposta)
+    def _invalidar_cache_remoto(self, nomes):
+        """Os nodos fora do ar perdem o cache ao reiniciar, então não precisam do aviso"""
+        if not nomes:
+            return
+        for id_nodo in self.posicionador.vivos():
+            if id_nodo != self.id_nodo:
+                self.executor_replicas.submit(
+                    self.sessao_http.post, self._url_nodo(id_nodo, '/invalidate_cache'),
+                    json={'fragments': nomes}, timeout=self.timeout_http
+                )
+    
+    # Apaga dos nodos os fragmentos que ficaram sem uso (remoção de arquivo ou fim de um upload)
+    def _apagar_sem_uso(self, id_arquivo, sem_uso):
+        """Retorna os futuros das remoções (True se o fragmento foi apagado)"""
+        nomes = [self._nome_fragmento(id_arquivo, frag) for frag in sem_uso]
+        self.cache_fragmentos.invalidar(*nomes)
+        self._invalidar_cache_remoto(sorted(set(nomes)))
+        return [
+            self.executor_replicas.submit(self._apagar_fragmento, frag['id_nodo'], nome)
+            for frag, nome in zip(sem_uso, nomes)
+        ]
+    
+    # Apaga um fragmento num nodo (localmente ou via HTTP)
+    def _apagar_fragmento(self, id_nodo, nome_fragmento):
+        """Retorna True se o fragmento foi apagado (ou já não existia, ou voltou a ser usado)"""
+        if id_nodo == self.id_nodo:
+            self._remover_sem_uso_local(nome_fragmento)
+            return True
+        try:
+            resposta = self.sessao_http.delete(self._url_nodo(id_nodo, f'/delete_fragment/{nome_fragmento}'), timeout=self.timeout_http)
+            return resposta.status_code in (200, 404)
+        except Exception as e:
+            self.registrar_log(f'ERRO ao apagar fragmento {nome_fragmento} no nodo {id_nodo}: {e}', fragment=nome_fragmento, peer=id_nodo)
+            return False
+    
+    # Agrupa as réplicas por fragmento, em ordem: [(id_fragmento, tamanho, [id_nodo, ...], nome do fragmento, checksum, codec)]
+    # 'tamanho' é o tamanho do fragmento dentro do arquivo (o original, se ele estiver comprimido)
+    def _agrupar_fragmentos(self, id_arquivo, info_arquivo):
+        """Agrupa os fragmentos do arquivo por id_fragmento"""
+        fragmentos_por_id = {}
+        for frag in info_arquivo['fragmentos']:
+            id_frag = frag['id_fragmento']
+            if id_frag not in fragmentos_por_id:
+                fragmentos_por_id[id_frag] = (frag.get('tamanho_original', frag['tamanho']), [],
+                                              self._nome_fragmento(id_arquivo, frag), self._checksum(frag), frag.get('codec'))
+            fragmentos_por_id[id_frag][1].append(frag['id_nodo'])
+        return [(id_frag, *dados) for id_frag, dados in sorted(fragmentos_por_id.items())]
+    
+    # Converte um intervalo [inicio, fim) do arquivo em intervalos dentro de cada fragmento
+    def _pedacos_do_intervalo(self, fragmentos_ordenados, inicio, fim):
+        """Retorna [(nome do fragmento, nodos, inicio_no_fragmento, fim_no_fragmento, checksum, codec)] só dos fragmentos que cobrem o intervalo"""
+        pedacos = []
+        deslocamento = 0
+        for _, tamanho, nodos, nome, checksum, codec in fragmentos_ordenados:
+            inicio_frag, fim_frag = deslocamento, deslocamento + tamanho
+            deslocamento = fim_frag
+            if fim_frag <= inicio or tamanho == 0:
+                continue
+            if inicio_frag >= fim:
+                break
+            fim_no_fragmento = min(fim, fim_frag) - inicio_frag
+            # fim None = até o fim do fragmento (busca sem Range)
+            pedacos.append((nome, nodos, max(inicio, inicio_frag) - inicio_frag,
+                            fim_no_fragmento if fim_no_fragmento < tamanho else None, checksum, codec))
+        return pedacos
+    
+    # Fragmento deste nodo, se ele for um dos donos, o fragmento existir e o conteúdo bater com o checksum
+    def _fragmento_local(self, nome_fragmento, nodos, checksum=None):
+        """Retorna os bytes (fragmento em volume), o Path (arquivo avulso) ou None"""
+        if self.id_nodo not in nodos:
+            return None
+        return self._ler_fragmento_local(nome_fragmento, checksum)
+    
+    # Lê um fragmento local conferindo o checksum: os pequenos estão nos volumes, os outros em arquivos avulsos
+    def _ler_fragmento_local(self, nome_fragmento, checksum=None):
+        """Retorna os bytes (volume), o Path (arquivo avulso) ou None se não existir ou estiver corrompido"""
+        obtido = self.volumes.obter(nome_fragmento) if self.volumes is not None else None
+        if obtido is not None:
+            entrada, dados = obtido
+            if not checksum or self.fragmentos_verificados.get(nome_fragmento) == entrada:
+                return dados
+            if hashlib.sha256(dados).hexdigest() == checksum:
+                self.fragmentos_verificados[nome_fragmento] = entrada
+                return dados
+            self._isolar_fragmento(nome_fragmento, 'checksum divergente na leitura')
+            return None
+        caminho_fragmento = self.dir_arquivos / nome_fragmento
+        if not caminho_fragmento.exists() or not self._verificar_fragmento_local(caminho_fragmento, checksum):
+            return None
+        return caminho_fragmento
+    
+    # Confere um fragmento avulso com o checksum; o resultado fica no inventário e vale enquanto mtime e tamanho
+    # não mudarem, então o fragmento é relido só na primeira leitura, mesmo depois de reiniciar o nodo
+    # (os gravados por este nodo já nascem conferidos)
+    def _verificar_fragmento_local(self, caminho_fragmento, checksum):
+        """Retorna True se o conteúdo bate (ou não há checksum); o fragmento corrompido é isolado"""
+        if not checksum:
+            return True
+        try:
+            estado = caminho_fragmento.stat()
+            if self.inventario.verificado(caminho_fragmento.name, estado.st_size, estado.st_mtime_ns, checksum):
+                return True
+            if checksum_blocos(self._ler_intervalo(caminho_fragmento, 0, estado.st_size)) == checksum:
+                self.inventario.registrar(caminho_fragmento.name, estado.st_size, estado.st_mtime_ns, checksum)
+                return True
+        except FileNotFoundError:
+            return False
+        self._isolar_fragmento(caminho_fragmento.name, 'checksum divergente na leitura')
+        return False
+    
+    # Se o fragmento existe neste nodo (em volume ou avulso); depois de comparado com o disco,
+    # o inventário responde sem stat
+    def _fragmento_existe(self, nome_fragmento):
+        """Retorna True se o fragmento está no disco"""
+        if self.volumes is not None and self.volumes.contem(nome_fragmento):
+            return True
+        if self.inventario.reconciliado:
+            return self.inventario.contem(nome_fragmento)
+        return (self.dir_arquivos / nome_fragmento).is_file()
+    
+    # Grava um fragmento neste nodo: até o limite dos volumes ele vai para o volume ativo, acima disso
+    # para um arquivo avulso; o tamanho só é conhecido lendo, então o começo fica em memória até passar do limite
+    # Com 'checksum' o conteúdo é conferido antes (HashDivergente se não bater)
+    def _gravar_fragmento_local(self, nome_fragmento, blocos, checksum=None):
+        """Grava o fragmento e retorna o total de bytes"""
+        if self.volumes is not None:
+            blocos = iter(blocos)
+            inicio, tamanho = [], 0
+            for bloco in blocos:
+                inicio.append(bloco)
+                tamanho += len(bloco)
+                if tamanho > self.volumes.limite_fragmento:
+                    break
+            else:
+                dados = b''.join(inicio)
+                if checksum and hashlib.sha256(dados).hexdigest() != checksum:
+                    raise HashDivergente(f'{nome_fragmento}: conteúdo com hash {hashlib.sha256(dados).hexdigest()}')
+                entrada = self.volumes.gravar(nome_fragmento, dados)
+                (self.dir_arquivos / nome_fragmento).unlink(missing_ok=True)  # versão avulsa anterior
+                self.inventario.remover(nome_fragmento)
+                if checksum:
+                    self.fragmentos_verificados[nome_fragmento] = entrada
+                return tamanho
+            blocos = chain(inicio, blocos)
+        caminho_fragmento = self.dir_arquivos / nome_fragmento
+        total = self._gravar_stream(caminho_fragmento, blocos, checksum, duravel=True)
+        estado = caminho_fragmento.stat()
+        self.inventario.registrar(nome_fragmento, estado.st_size, estado.st_mtime_ns, checksum)
+        if self.volumes is not None:
+            self.volumes.remover(nome_fragmento)  # versão anterior em volume
+        return total
+    
+    # Remove um fragmento sem uso deste nodo; um chunk só sai se o índice confirmar, na mesma
+    # transação, que nenhum upload voltou a reservá-lo
+    def _remover_sem_uso_local(self, nome_fragmento):
+        """Retorna True se o fragmento existia, False se não, None se o chunk voltou a ser usado"""
+        if nome_fragmento.startswith('chunk_'):
+            return self.bd.coletar_chunk(nome_fragmento[len('chunk_'):], self.id_nodo,
+                                         partial(self._remover_fragmento_local, nome_fragmento))
+        return self._remover_fragmento_local(nome_fragmento)
+    
+    # Apaga um fragmento deste nodo
+    def _remover_fragmento_local(self, nome_fragmento):
+        """Retorna True se o fragmento existia"""
+        removido = self.volumes is not None and self.volumes.remover(nome_fragmento)
+        caminho_fragmento = self.dir_arquivos / nome_fragmento
+        if caminho_fragmento.is_file():
+            caminho_fragmento.unlink(missing_ok=True)
+            removido = True
+        self.inventario.remover(nome_fragmento)
+        self.fragmentos_verificados.pop(nome_fragmento, None)
+        return removido
+    
+    # Tira um fragmento corrompido de circulação (vai para .corrompidos) e agenda a cópia de uma réplica boa
+    def _isolar_fragmento(self, nome_fragmento, motivo):
+        """Move o fragmento para o diretório de corrompidos e enfileira o reparo deste nodo"""
+        destino = self.dir_corrompidos / f'{nome_fragmento}.{int(time.time())}'
+        obtido = self.volumes.obter(nome_fragmento) if self.volumes is not None else None
+        if obtido is not None:
+            destino.write_bytes(obtido[1])
+            if not self.volumes.remover(nome_fragmento):
+                return  # outra thread já isolou
+        else:
+            try:
+                os.replace(self.dir_arquivos / nome_fragmento, destino)
+            except FileNotFoundError:
+                return  # outra thread já isolou
+            self.inventario.remover(nome_fragmento)
+        self.fragmentos_verificados.pop(nome_fragmento, None)
+        self.registrar_log(f'ERRO: fragmento {nome_fragmento} corrompido ({motivo}), movido para {destino}', fragment=nome_fragmento)
+        self._enfileirar_reparo(self.id_nodo, 'fragmento corrompido')
+    
+    # Lê [inicio, fim) de um fragmento local via mmap, em blocos (sem ler o fragmento inteiro)
+    def _blocos_mmap(self, caminho, inicio=0, fim=None):
+        """Gera os bytes de um arquivo local em blocos via mmap"""
+        with open(caminho, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                fim = len(mapa) if fim is None else min(fim, len(mapa))
+                for posicao in range(inicio, fim, self.tamanho_bloco):
+                    yield mapa[posicao:min(posicao + self.tamanho_bloco, fim)]
+    
+    # Busca um fragmento (ou o intervalo [inicio, fim) dele) de outro nodo via HTTP
+    # para um temporário (em memória até um limite, depois em disco)
+    # Com 'checksum' o nodo de origem confere o fragmento antes de enviar (responde 404 se estiver corrompido)
+    # e a busca do fragmento inteiro é conferida de novo aqui, o que pega corrupção que não mudou o mtime
+    # 'respondeu' é sinalizado quando chegam os cabeçalhos e 'cancelado' interrompe a cópia (hedge perdedor)
+    def _obter_fragmento(self, nome_fragmento, id_nodo, inicio=0, fim=None, checksum=None, respondeu=None, cancelado=None):
+        """Busca um fragmento de um nodo específico"""
+        spool = tempfile.SpooledTemporaryFile(max_size=self.tamanho_bloco * 4, dir=self.dir_temporario)
+        parcial = inicio > 0 or fim is not None
+        cabecalhos = {'Range': f'bytes={inicio}-{"" if fim is None else fim - 1}'} if parcial else {}
+        parametros = {'checksum': checksum} if checksum else {}
+        inicio_busca = time.perf_counter()
+        
+        try:
+            url = self._url_nodo(id_nodo, f'/get_fragment/{nome_fragmento}')
+            comeco = time.monotonic()
+            with self.sessao_http.get(url, params=parametros, headers=cabecalhos, timeout=self.timeout_http, stream=True) as resposta:
+                self.latencias.registrar(id_nodo, time.monotonic() - comeco)
+                if respondeu is not None:
+                    respondeu.set()
+                if resposta.status_code in (200, 206):
+                    blocos = resposta.iter_content(self.tamanho_bloco)
+                    if parcial and resposta.status_code == 200:
+                        # o nodo ignorou o Range: recorta o intervalo do fragmento inteiro
+                        blocos = self._recortar_blocos(blocos, inicio, fim)
+                    resumo = hashlib.sha256() if checksum and not parcial else None
+                    for bloco in blocos:
+                        if cancelado is not None and cancelado.is_set():
+                            break
+                        spool.write(bloco)
+                        if resumo is not None:
+                            resumo.update(bloco)
+                    else:
+                        if resumo is None or resumo.hexdigest() == checksum:
+                            self._registrar_transferencia(id_nodo, 'fetch', spool.tell(), inicio_busca, True)
+                            spool.seek(0)
+                            return spool
+                        self.registrar_log(f'ERRO: fragmento {nome_fragmento} do nodo {id_nodo} não bate com o checksum',
+                                          fragment=nome_fragmento, peer=id_nodo)
+        except Exception as e:
+            self.latencias.registrar_falha(id_nodo, sum(self.timeout_http))
+            self.registrar_log(f'ERRO ao buscar fragmento de nodo {id_nodo}: {e}', fragment=nome_fragmento, peer=id_nodo)
         
+        self._registrar_transferencia(id_nodo, 'fetch', spool.tell(), inicio_busca, False)
+        spool.close()
         return None
     
+    # Recorta [inicio, fim) de uma sequência de blocos
+    @staticmethod
+    def _recortar_blocos(blocos, inicio, fim):
+        """Gera só os bytes do intervalo pedido"""
+        posicao = 0
+        for bloco in blocos:
+            proxima = posicao + len(bloco)
+            if fim is not None and posicao >= fim:
+                break
+            if proxima > inicio:
+                yield bloco[max(inicio - posicao, 0):len(bloco) if fim is None else fim - posicao]
+            posicao = proxima
+    
+    # Ordena as réplicas: vivos antes de suspeitos e mortos, depois pela latência das buscas
+    # (ou do heartbeat, se ainda não houve busca); nodo sem medida vai na frente para ser medido
+    def _ordenar_replicas(self, nodos):
+        """Retorna os nodos da réplica mais promissora para a menos"""
+        ordem_estado = {VIVO: 0, SUSPEITO: 1, MORTO: 2}
+        mortos = set(nodos) - set(self.posicionador.vivos())
+        
+        def chave(id_nodo):
+            estado = MORTO if id_nodo in mortos else self.membros.estado(id_nodo)
+            latencia = self.latencias.media(id_nodo)
+            if latencia is None:
+                latencia = self.membros.latencia(id_nodo) or 0
+            return ordem_estado[estado], latencia
+        
+        embaralhados = random.sample(list(nodos), len(nodos))  # desempate aleatório espalha a carga
+        return sorted(embaralhados, key=chave)
+    
+    # Tempo de espera pela primeira resposta antes de mandar a leitura duplicada
+    def _limiar_hedge(self):
+        """Percentil das buscas recentes (metade do timeout de conexão enquanto faltam amostras)"""
+        limiar = self.latencias.percentil(self.percentil_hedge)
+        if limiar is None:
+            limiar = self.timeout_http[0] / 2
+        return max(limiar, self.atraso_minimo_hedge)
+    
+    # Busca nas réplicas remotas da mais rápida para a mais lenta; se a atual não responder dentro do
+    # limiar, dispara a mesma busca na próxima e fica com a que terminar primeiro
+    def _obter_fragmento_remoto(self, nome_fragmento, nodos, inicio=0, fim=None, checksum=None):
+        """Retorna um arquivo temporário com o fragmento ou None"""
+        candidatos = self._ordenar_replicas([id_nodo for id_nodo in nodos if id_nodo != self.id_nodo])
+        tentativas = {}  # {future: (respondeu, cancelado)}
+        proximo = 0
+        
+        def tentar():
+            nonlocal proximo
+            respondeu, cancelado = threading.Event(), threading.Event()
+            futuro = self.executor_leituras.submit(
+                self._obter_fragmento, nome_fragmento, candidatos[proximo], inicio, fim, checksum, respondeu, cancelado
+            )
+            tentativas[futuro] = (respondeu, cancelado)
+            proximo += 1
+        
+        try:
+            while tentativas or proximo < len(candidatos):
+                if not tentativas:
+                    tentar()  # a anterior falhou: próxima réplica na hora
+                
+                # só duplica enquanto nenhuma tentativa começou a receber o fragmento
+                aguardando = not any(respondeu.is_set() for respondeu, _ in tentativas.values())
+                pode_duplicar = self.percentil_hedge > 0 and aguardando and proximo < len(candidatos)
+                prontos, _ = wait(tentativas, timeout=self._limiar_hedge() if pode_duplicar else None,
+                                  return_when=FIRST_COMPLETED)
+                
+                if not prontos:
+                    if not any(respondeu.is_set() for respondeu, _ in tentativas.values()):
+                        with self.lock_leituras_duplicadas:
+                            self.leituras_duplicadas += 1
+                        tentar()
+                    continue
+                
+                for futuro in prontos:
+                    del tentativas[futuro]
+                    spool = futuro.result()
+                    if spool is not None:
+                        return spool
+            return None
+        
+        finally:
+            # as tentativas que perderam param de copiar e descartam o que já receberam
+            for futuro, (_, cancelado) in tentativas.items():
+                cancelado.set()
+                futuro.add_done_callback(self._descartar_spool)
+    
+    # Fecha o temporário de uma busca cujo resultado não vai ser usado
+    @staticmethod
+    def _descartar_spool(futuro):
+        spool = futuro.result()
+        if spool is not None:
+            spool.close()
+    
+    # Busca remota que passa pelo cache: um fragmento inteiro pedido de novo fica guardado em memória
+    def _obter_fragmento_cacheado(self, nome_fragmento, nodos, inicio=0, fim=None, checksum=None):
+        """Retorna um arquivo (temporário ou em memória) com o fragmento ou None"""
+        spool = self._obter_fragmento_remoto(nome_fragmento, nodos, inicio, fim, checksum)
+        if spool is None or inicio > 0 or fim is not None:
+            return spool
+        tamanho = spool.seek(0, os.SEEK_END)
+        spool.seek(0)
+        if not self.cache_fragmentos.admitir(nome_fragmento, tamanho):
+            return spool
+        with spool:
+            dados = spool.read()
+        self.cache_fragmentos.guardar(nome_fragmento, dados)
+        return io.BytesIO(dados)
+    
+    # Repassa o corpo de um download contando os bytes enviados; o tempo total vai para o histograma no fim
+    def _medir_stream(self, blocos, inicio):
+        """Gera os mesmos blocos"""
+        enviados = 0
+        try:
+            for bloco in blocos:
+                enviados += len(bloco)
+                yield bloco
+        finally:
+            self.metricas.incrementar('client_bytes_total', enviados, direction='out')
+            self.metricas.observar('download_stage_seconds', time.perf_counter() - inicio, stage='total')
+    
+    # Lê os parâmetros de /list; com 'cursor' a ordem e o prefixo vêm dele, para a página seguir a anterior
+    def _consulta_listagem(self, argumentos):
+        """Retorna {ordem, decrescente, prefixo, apos, limite} ou levanta ValueError"""
+        limite = argumentos.get('limit')
+        try:
+            limite = None if limite is None else int(limite)
+        except ValueError:
+            raise ValueError('limit deve ser um número inteiro')
+        if limite is not None and not 1 <= limite <= self.pagina_listagem_maxima:
+            raise ValueError(f'limit deve estar entre 1 e {self.pagina_listagem_maxima}')
+        
+        if argumentos.get('cursor'):
+            try:
+                ordem, decrescente, prefixo, valor, id_arquivo = json.loads(base64.urlsafe_b64decode(argumentos['cursor']))
+            except (ValueError, TypeError):
+                raise ValueError('cursor inválido')
+            if ordem not in ORDENS_LISTAGEM:
+                raise ValueError('cursor inválido')
+            apos = (valor, id_arquivo)
+        else:
+            ordens = {'id': 'id', 'name': 'nome', 'size': 'tamanho'}
+            if argumentos.get('sort', 'id') not in ordens:
+                raise ValueError('sort deve ser id, name ou size')
+            if argumentos.get('order', 'asc') not in ('asc', 'desc'):
+                raise ValueError('order deve ser asc ou desc')
+            ordem = ordens[argumentos.get('sort', 'id')]
+            decrescente = argumentos.get('order', 'asc') == 'desc'
+            prefixo = argumentos.get('prefix', '')
+            apos = None
+        
+        return {
+            'ordem': ordem,
+            'decrescente': decrescente,
+            'prefixo': prefixo,
+            'apos': apos,
+            'limite': limite
+        }
+    
+    # Cursor opaco para continuar depois de 'linha' (base64 de [ordem, decrescente, prefixo, valor, id])
+    @staticmethod
+    def _cursor_listagem(consulta, linha):
+        """Retorna o cursor da próxima página"""
+        chave = [consulta['ordem'], consulta['decrescente'], consulta['prefixo'], linha[ORDENS_LISTAGEM[consulta['ordem']]], linha[0]]
+        return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode()
+    
+    @staticmethod
+    def _item_listagem(linha):
+        id_arquivo, nome, tamanho = linha
+        return {'id': id_arquivo, 'name': nome, 'size': tamanho}
+    
+    # Exporta a listagem inteira (ou até 'limit' arquivos) em NDJSON, buscando uma página do índice por vez
+    def _exportar_listagem(self, consulta):
+        """Gera linhas JSON, um arquivo por linha"""
+        restantes = consulta['limite']
+        apos = consulta['apos']
+        while restantes is None or restantes > 0:
+            tamanho_pagina = self.pagina_listagem_maxima if restantes is None else min(restantes, self.pagina_listagem_maxima)
+            linhas = self.bd.listar_arquivos(consulta['ordem'], consulta['decrescente'], consulta['prefixo'], apos, tamanho_pagina)
+            if not linhas:
+                return
+            yield ''.join(json.dumps(self._item_listagem(linha), ensure_ascii=False) + '\n' for linha in linhas)
+            if len(linhas) < tamanho_pagina:
+                return
+            if restantes is not None:
+                restantes -= len(linhas)
+            apos = (linhas[-1][ORDENS_LISTAGEM[consulta['ordem']]], linhas[-1][0])
+    
+    # Gera [inicio, fim) de um fragmento em memória em blocos
+    def _blocos_memoria(self, dados, inicio=0, fim=None):
+        """Gera os bytes de um fragmento do cache"""
+        fim = len(dados) if fim is None else min(fim, len(dados))
+        for posicao in range(inicio, fim, self.tamanho_bloco):
+            yield dados[posicao:min(posicao + self.tamanho_bloco, fim)]
+    
+    # Descomprime os blocos de um fragmento inteiro e recorta [inicio, fim) do conteúdo original
+    # (sem codec os blocos já são os do intervalo e passam direto)
+    def _blocos_originais(self, blocos, codec, inicio, fim):
+        """Gera os bytes originais do intervalo"""
+        if not codec:
+            yield from blocos
+            return
+        medicao = {}
+        try:
+            yield from self._recortar_blocos(descomprimir(blocos, codec, self.tamanho_bloco, medicao), inicio, fim)
+        finally:
+            self._registrar_compressao(codec, 'decompress', medicao)
+    
+    # Gera o arquivo (ou o intervalo pedido) em ordem com uma janela de leitura antecipada de fragmentos
+    # Fragmentos comprimidos circulam comprimidos entre os nodos (e no cache) e só são descomprimidos aqui,
+    # no nodo que responde ao cliente; deles o fragmento vem inteiro e o intervalo é recortado depois
+    def _stream_arquivo(self, id_arquivo, info_arquivo, pedacos):
+        """Gera os bytes do arquivo fragmento a fragmento"""
+        janela = deque()  # (nome do fragmento, inicio, fim, codec, caminho local, bytes do volume ou do cache, ou future da busca remota)
+        proximo = 0
+        
+        try:
+            while proximo < len(pedacos) or janela:
+                # Mantém até 'janela_leitura' fragmentos agendados à frente do que está saindo
+                while proximo < len(pedacos) and len(janela) < self.janela_leitura:
+                    nome_frag, nodos, inicio, fim, checksum, codec = pedacos[proximo]
+                    inicio_leitura, fim_leitura = (0, None) if codec else (inicio, fim)
+                    local = self._fragmento_local(nome_frag, nodos, checksum)
+                    dados = self.cache_fragmentos.obter(nome_frag) if local is None else None
+                    if local is not None:
+                        janela.append((nome_frag, inicio, fim, codec, local))
+                    elif dados is not None:
+                        janela.append((nome_frag, inicio, fim, codec, dados))
+                    else:
+                        futuro = self.executor_fragmentos.submit(
+                            self._obter_fragmento_cacheado, nome_frag, nodos, inicio_leitura, fim_leitura, checksum
+                        )
+                        janela.append((nome_frag, inicio, fim, codec, futuro))
+                    proximo += 1
+                
+                nome_frag, inicio, fim, codec, origem = janela.popleft()
+                inicio_leitura, fim_leitura = (0, None) if codec else (inicio, fim)
+                if isinstance(origem, Path):
+                    yield from self._blocos_originais(self._blocos_mmap(origem, inicio_leitura, fim_leitura), codec, inicio, fim)
+                    continue
+                if isinstance(origem, bytes):
+                    yield from self._blocos_originais(self._blocos_memoria(origem, inicio_leitura, fim_leitura), codec, inicio, fim)
+                    continue
+                
+                spool = origem.result()
+                if spool is None:
+                    raise FragmentoIndisponivel(f'Fragmento {nome_frag} não encontrado')
+                with spool:
+                    yield from self._blocos_originais(self._blocos_do_stream(spool), codec, inicio, fim)
+            
+            self.registrar_log(f'Arquivo {id_arquivo} ({info_arquivo["nome"]}) baixado', file_id=id_arquivo)
+        
+        except FragmentoIndisponivel as e:
+            self.registrar_log(f'ERRO no download do arquivo {id_arquivo}: {e}', file_id=id_arquivo)
+            raise
+        
+        finally:
+            # Cliente desconectou ou deu erro: cancela as buscas que não começaram e fecha o spool
+            # das outras (as que ainda estão rodando fecham quando terminarem)
+            for *_, origem in janela:
+                if isinstance(origem, Future) and not origem.cancel():
+                    origem.add_done_callback(self._fechar_spool)
+    
+    # Fecha o spool de uma busca de fragmento que não vai mais ser lida (callback do Future)
+    @staticmethod
+    def _fechar_spool(futuro):
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        spool = futuro.result()
+        if spool is not None:
+            spool.close()
+    
+    # Busca um shard inteiro (local ou de qualquer réplica remota) para a memória
+    def _obter_shard(self, nome_fragmento, nodos, checksum=None):
+        """Retorna os bytes do fragmento ou None"""
+        origem = self._fragmento_local(nome_fragmento, nodos, checksum)
+        if origem is not None:
+            return origem.read_bytes() if isinstance(origem, Path) else origem
+        dados = self.cache_fragmentos.obter(nome_fragmento)
+        if dados is not None:
+            return dados
+        spool = self._obter_fragmento_cacheado(nome_fragmento, nodos, checksum=checksum)
+        if spool is None:
+            return None
+        with spool:
+            return spool.read()
+    
+    # Gera o intervalo [inicio, fim) de um arquivo com código de apagamento, faixa a faixa
+    # Só os shards de dados que cobrem o intervalo são buscados; a paridade só entra se algum faltar
+    def _stream_arquivo_erasure(self, id_arquivo, info_arquivo, fragmentos_ordenados, inicio, fim):
+        """Gera os bytes do arquivo reconstruindo as faixas"""
+        k, m, tamanho_faixa = info_arquivo['k'], info_arquivo['m'], info_arquivo['tamanho_faixa']
+        codificador = self._codificador_erasure(k, m)
+        nodos_por_fragmento = {id_frag: (nome, nodos, checksum) for id_frag, _, nodos, nome, checksum, _ in fragmentos_ordenados}
+        faixas = range(inicio // tamanho_faixa, -(-fim // tamanho_faixa)) if fim > inicio else range(0)
+        janela = deque()  # (faixa, inicio e fim dentro da faixa, tamanho do shard, {indice: future})
+        proxima = 0
+        
+        def buscar(faixa, indice):
+            id_frag = faixa * (k + m) + indice
+            if id_frag not in nodos_por_fragmento:
+                return None
+            return self.executor_fragmentos.submit(self._obter_shard, *nodos_por_fragmento[id_frag])
+        
+        try:
+            while proxima < len(faixas) or janela:
+                while proxima < len(faixas) and len(janela) < self.janela_leitura:
+                    faixa = faixas[proxima]
+                    inicio_faixa = faixa * tamanho_faixa
+                    tamanho_dados = min(tamanho_faixa, info_arquivo['tamanho'] - inicio_faixa)
+                    tamanho_shard, _ = self._shards_da_faixa(tamanho_dados, k)
+                    a = max(inicio - inicio_faixa, 0)
+                    b = min(fim - inicio_faixa, tamanho_dados)
+                    necessarios = range(a // tamanho_shard, -(-b // tamanho_shard))
+                    janela.append((faixa, a, b, tamanho_shard, {i: buscar(faixa, i) for i in necessarios}))
+                    proxima += 1
+                
+                faixa, a, b, tamanho_shard, futuros = janela.popleft()
+                shards = {i: futuro.result() for i, futuro in futuros.items() if futuro is not None}
+                shards = {i: dados for i, dados in shards.items() if dados is not None}
+                primeiro = min(futuros)
+                
+                if len(shards) < len(futuros):
+                    # Faltou shard de dados: busca os outros da faixa até ter k e reconstrói
+                    outros = {i: buscar(faixa, i) for i in range(k + m) if i not in futuros}
+                    for i, futuro in outros.items():
+                        dados = futuro.result() if futuro is not None else None
+                        if dados is not None:
+                            shards[i] = dados
+                    if len(shards) < k:
+                        raise FragmentoIndisponivel(f'Faixa {faixa}: só {len(shards)} de {k} shards disponíveis')
+                    dados_faixa = codificador.decodificar(shards, tamanho_shard)
+                    shards = dict(enumerate(dados_faixa))
+                    self.registrar_log(f'Faixa {faixa} do arquivo {id_arquivo} reconstruída pela paridade', 'warning', file_id=id_arquivo)
+                
+                # Junta os shards necessários e recorta o intervalo pedido
+                dados = b''.join(shards[i].ljust(tamanho_shard, b'\0') for i in futuros)
+                yield dados[a - primeiro * tamanho_shard:b - primeiro * tamanho_shard]
+            
+            self.registrar_log(f'Arquivo {id_arquivo} ({info_arquivo["nome"]}) baixado', file_id=id_arquivo)
+        
+        except FragmentoIndisponivel as e:
+            self.registrar_log(f'ERRO no download do arquivo {id_arquivo}: {e}', file_id=id_arquivo)
+            raise
+        
+        finally:
+            for *_, futuros in janela:
+                for futuro in futuros.values():
+                    if futuro is not None:
+                        futuro.cancel()
+    
+    # Monta o Content-Disposition de anexo (nomes não-ASCII vão em filename*)
+    @staticmethod
+    def _cabecalho_anexo(nome_arquivo):
+        """Retorna o valor do cabeçalho Content-Disposition"""
+        try:
+            nome_arquivo.encode('ascii')
+            return f'attachment; filename="{nome_arquivo}"'
+        except UnicodeEncodeError:
+            return f"attachment; filename*=UTF-8''{quote(nome_arquivo)}"
+    
     # Inicia o servidor TCP para comunicação entre nodos (heartbeat)
     def iniciar_servidor(self):
         """Inicia o servidor do nodo"""
@@ -415,131 +2084,572 @@ class Nodo:
                     self.registrar_log(f'ERRO ao aceitar conexão: {e}')
     
     # Processa uma conexão TCP recebida (principalmente heartbeats)
+    # A conexão é persistente: uma mensagem JSON por linha até o outro nodo fechar
     def processar_conexao(self, socket_cliente):
         """Processa uma conexão recebida"""
         try:
-            dados = socket_cliente.recv(1024).decode('utf-8')
+            # conexões paradas por muito tempo são descartadas
+            socket_cliente.settimeout(self.timeout_heartbeat * 2)
+            leitor = socket_cliente.makefile('rb')
             
-            if not dados:
-                return
-            
-            mensagem = json.loads(dados)
-            
-            if mensagem.get('type') == 'heartbeat':
-                # Responde ao heartbeat
-                resposta = {'type': 'heartbeat_ack', 'node_id': self.id_nodo, 'port': self.porta}
-                socket_cliente.send(json.dumps(resposta).encode('utf-8'))
+            while self.rodando:
+                dados = leitor.readline()
+                
+                if not dados:
+                    return
+                
+                mensagem = json.loads(dados.decode('utf-8'))
+                
+                if mensagem.get('type') == 'heartbeat':
+                    # Junta a tabela de quem enviou e responde com a nossa
+                    self.membros.mesclar(mensagem.get('gossip', {}))
+                    resposta = {
+                        'type': 'heartbeat_ack',
+                        'node_id': self.id_nodo,
+                        'port': self.porta,
+                        'gossip': self.membros.resumo_gossip()
+                    }
+                    socket_cliente.sendall(json.dumps(resposta).encode('utf-8') + b'\n')
                 
+        except socket.timeout:
+            pass
         except Exception as e:
             self.registrar_log(f'ERRO ao processar conexão: {e}')
         finally:
             socket_cliente.close()
     
-    # Envia heartbeat para um nodo específico e aguarda resposta
-    def enviar_heartbeat(self, porta):
+    # Envia heartbeat (com a tabela de gossip) para um nodo e aguarda a resposta
+    # Reaproveita a conexão TCP do heartbeat anterior; só reconecta se ela caiu
+    async def enviar_heartbeat(self, porta):
         """Envia heartbeat para um nodo específico"""
+        id_nodo = self.portas.index(porta) + 1
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(2.0)
-            sock.connect(('localhost', porta))
+            conexao = self.conexoes_heartbeat.get(porta)
+            if conexao is None:
+                conexao = await asyncio.wait_for(asyncio.open_connection('localhost', porta), timeout=self.timeout_sonda)
+                self.conexoes_heartbeat[porta] = conexao
+            leitor, escritor = conexao
             
-            mensagem = {'type': 'heartbeat', 'node_id': self.id_nodo, 'port': self.porta}
-            sock.send(json.dumps(mensagem).encode('utf-8'))
+            mensagem = {'type': 'heartbeat', 'node_id': self.id_nodo, 'port': self.porta, 'gossip': self.membros.resumo_gossip()}
+            enviado_em = time.monotonic()
+            escritor.write(json.dumps(mensagem).encode('utf-8') + b'\n')
+            await escritor.drain()
             
             # Aguarda resposta
-            resposta = sock.recv(1024).decode('utf-8')
+            resposta = await asyncio.wait_for(leitor.readline(), timeout=self.timeout_sonda)
             if resposta:
-                self.status_nodos[porta] = time.time()
+                self.membros.registrar_latencia(id_nodo, time.monotonic() - enviado_em)
+                self.membros.mesclar(json.loads(resposta.decode('utf-8')).get('gossip', {}))
                 return True
             
         except Exception:
-            return False
-        finally:
-            try:
-                sock.close()
-            except:
-                pass
+            pass
         
+        # Falhou: fecha a conexão para reconectar no próximo heartbeat
+        self._fechar_conexao_heartbeat(porta)
         return False
     
+    # Fecha a conexão persistente de heartbeat com um nodo
+    def _fechar_conexao_heartbeat(self, porta):
+        """Fecha e esquece a conexão de heartbeat com 'porta'"""
+        conexao = self.conexoes_heartbeat.pop(porta, None)
+        if conexao is not None:
+            conexao[1].close()
+    
+    # Próximos nodos a sondar: rodízio embaralhado, FANOUT_HEARTBEAT por rodada
+    # (cada nodo é sondado diretamente pelo menos a cada ceil((N - 1) / FANOUT_HEARTBEAT) rodadas)
+    def _proximos_alvos_heartbeat(self):
+        """Retorna as portas a sondar nesta rodada"""
+        alvos = []
+        while len(alvos) < min(self.fanout_heartbeat, len(self.portas) - 1):
+            if not self.fila_alvos_heartbeat:
+                self.fila_alvos_heartbeat = [porta for porta in self.portas if porta != self.porta]
+                random.shuffle(self.fila_alvos_heartbeat)
+            porta = self.fila_alvos_heartbeat.pop()
+            if porta not in alvos:
+                alvos.append(porta)
+        return alvos
+    
     # Monitora continuamente o status de todos os nodos via heartbeat
     def monitorar_heartbeat(self):
         """Monitora heartbeat de todos os nodos"""
+        asyncio.run(self._monitorar_heartbeat())
+    
+    # Rodadas de gossip: sonda alguns nodos em paralelo e avalia a visão do cluster
+    async def _monitorar_heartbeat(self):
+        """Loop assíncrono do heartbeat"""
+        self.membros.iniciar()
         while self.rodando:
-            tempo_atual = time.time()
-            nodos_vivos = []
-            nodos_mortos = []
+            inicio_rodada = time.monotonic()
+            self.membros.incrementar_proprio()
             
-            # Verifica todos os nodos (exceto o próprio)
-            for porta in self.portas:
-                if porta == self.porta:
-                    continue
-                
-                # Envia heartbeat
-                if self.enviar_heartbeat(porta):
-                    nodos_vivos.append(porta)
-                else:
-                    # Verifica se está morto há tempo suficiente
-                    ultimo_visto = self.status_nodos.get(porta, 0)
-                    if tempo_atual - ultimo_visto > self.timeout_heartbeat:
-                        if porta not in nodos_mortos:
-                            nodos_mortos.append(porta)
-            
-            # Log de status
-            self.registrar_log(f'Nodos vivos: {nodos_vivos}')
+            # Sondagens simultâneas: um nodo lento ou fora do ar não atrasa os outros
+            await asyncio.gather(*(self.enviar_heartbeat(porta) for porta in self._proximos_alvos_heartbeat()))
+            self._avaliar_membros()
             
-            if nodos_mortos:
-                self.registrar_log(f'Nodos mortos detectados: {nodos_mortos}')
-                # Tenta recuperar nodos mortos
-                for porta in nodos_mortos:
+            # Aguarda até o próximo heartbeat
+            await asyncio.sleep(max(0.0, self.intervalo_heartbeat - (time.monotonic() - inicio_rodada)))
+        
+        for porta in list(self.conexoes_heartbeat):
+            self._fechar_conexao_heartbeat(porta)
+    
+    # Age sobre a visão do cluster: escolha de nodos, recuperação e reparo dos mortos
+    def _avaliar_membros(self):
+        """Aplica o estado dos membros depois de uma rodada"""
+        estados = self.membros.por_estado()
+        ids_vivos = estados[VIVO] + estados[SUSPEITO]
+        ids_mortos = estados[MORTO]
+        
+        # Atualiza a membership usada na escolha dos nodos das réplicas
+        self.posicionador.marcar_vivos(ids_vivos)
+        self.posicionador.marcar_mortos(ids_mortos)
+        
+        # Log de status
+        self.registrar_log(f'Nodos vivos: {[self.portas[i - 1] for i in sorted(estados[VIVO])]}', 'debug')
+        if estados[SUSPEITO]:
+            self.registrar_log(f'Nodos suspeitos: {[self.portas[i - 1] for i in sorted(estados[SUSPEITO])]}', 'warning')
+        
+        if ids_mortos:
+            portas_mortas = [self.portas[i - 1] for i in sorted(ids_mortos)]
+            self.registrar_log(f'Nodos mortos detectados: {portas_mortas}', 'warning')
+            # Tenta recuperar nodos mortos (só o nodo vivo de menor ID, como no reparo)
+            if min([self.id_nodo] + ids_vivos) == self.id_nodo:
+                for porta in portas_mortas:
                     self.tentar_recuperar_nodo(porta)
             
-            # Aguarda até o próximo heartbeat
-            time.sleep(self.intervalo_heartbeat)
+            # Os que continuarem mortos têm as réplicas recriadas em outros nodos
+            self._agendar_reparos(ids_mortos, ids_vivos)
     
-    # Tenta reiniciar um nodo que foi detectado como morto
-    def tentar_recuperar_nodo(self, porta):
-        """Tenta recuperar um nodo que caiu"""
-        tempo_atual = time.time()
+    # Agenda a re-replicação dos nodos mortos há mais de ESPERA_REPARO segundos
+    # Só o nodo vivo de menor ID coordena o reparo, para os outros não copiarem as mesmas réplicas
+    def _agendar_reparos(self, ids_mortos, ids_vivos):
+        """Coloca na fila de reparo os nodos mortos há tempo suficiente"""
+        if min([self.id_nodo] + ids_vivos) != self.id_nodo:
+            return
         
-        # Não tenta recuperar nodos durante o período de inicialização (primeiros 15 segundos)
-        if tempo_atual - self.tempo_inicializacao < 15:
-            return  # Ainda no período de inicialização global
+        agora = time.time()
+        for id_nodo in ids_mortos:
+            if agora - self.membros.visto_em(id_nodo) >= self.espera_reparo:
+                self._enfileirar_reparo(id_nodo, 'nodo morto')
+    
+    # Coloca um nodo na fila de reparo (se ele já não estiver nela)
+    def _enfileirar_reparo(self, id_nodo, motivo):
+        """Agenda o reparo das réplicas de 'id_nodo'"""
+        with self.lock_reparo:
+            if id_nodo in self.nodos_em_reparo:
+                return
+            self.nodos_em_reparo.add(id_nodo)
+        self.fila_reparo.put((id_nodo, motivo))
+    
+    # Consome a fila de reparo, um nodo por vez
+    def _executar_reparos(self):
+        """Thread do reparo de réplicas"""
+        while self.rodando:
+            try:
+                id_nodo, motivo = self.fila_reparo.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self._reparar_nodo(id_nodo, motivo)
+            except Exception as e:
+                self.registrar_log(f'ERRO no reparo do nodo {id_nodo}: {e}')
+            finally:
+                with self.lock_reparo:
+                    self.nodos_em_reparo.discard(id_nodo)
+    
+    # Recria as réplicas que estavam em 'id_perdido'
+    # Para outro nodo: copia de uma réplica sobrevivente para um nodo vivo e atualiza o banco
+    # Para este nodo: só traz de volta os fragmentos que sumiram do disco (ex.: files_nodo_N apagado)
+    def _reparar_nodo(self, id_perdido, motivo):
+        """Re-replica os fragmentos de um nodo, com taxa limitada (TAXA_REPARO)"""
+        # Chunks deduplicados aparecem uma vez por arquivo que os usa, mas são copiados uma vez só
+        unicos = {}
+        for frag in self.bd.fragmentos_do_nodo(id_perdido):
+            chave = frag.get('hash') or (frag['id_arquivo'], frag['id_fragmento'])
+            unicos.setdefault(chave, frag)
+        fragmentos = list(unicos.values())
+        if id_perdido == self.id_nodo:
+            fragmentos = [frag for frag in fragmentos if not self._fragmento_existe(self._nome_fragmento(frag['id_arquivo'], frag))]
+        if not fragmentos:
+            return
+        
+        total_bytes = sum(frag['tamanho'] for frag in fragmentos)
+        self.progresso_reparo.iniciar(id_perdido, motivo, len(fragmentos), total_bytes)
+        self.registrar_log(f'Reparo do nodo {id_perdido} ({motivo}): {len(fragmentos)} fragmentos, {total_bytes} bytes')
         
-        # Verifica se já tentamos recuperar esse nodo recentemente (cooldown de 30 segundos)
-        ultima_tentativa = self.tentativas_recuperacao.get(porta, 0)
-        if tempo_atual - ultima_tentativa < self.timeout_heartbeat*2:
-            return  # Evita múltiplas tentativas simultâneas
+        with ThreadPoolExecutor(max_workers=self.threads_reparo, thread_name_prefix=f'reparo_nodo_{self.id_nodo}') as executor:
+            futuros = [executor.submit(self._reparar_fragmento, id_perdido, frag) for frag in fragmentos]
+            ultimo_log = time.time()
+            for _ in as_completed(futuros):
+                if time.time() - ultimo_log >= 10:
+                    ultimo_log = time.time()
+                    self._registrar_progresso_reparo()
+        
+        self.progresso_reparo.concluir()
+        self._registrar_progresso_reparo()
+    
+    # Loga o progresso do reparo atual (ou o resumo do último)
+    def _registrar_progresso_reparo(self):
+        """Registra progresso e vazão do reparo no log"""
+        resumo = self.progresso_reparo.resumo()
+        estado = resumo['current'] or resumo['last']
+        if estado is None:
+            return
+        situacao = 'em andamento' if resumo['current'] else 'concluído'
+        self.registrar_log(
+            f'Reparo do nodo {estado["node"]} {situacao}: {estado["fragments_repaired"]}/{estado["fragments_total"]} fragmentos '
+            f'({estado["fragments_failed"]} falhas), {estado["bytes_copied"]} bytes em {estado["elapsed_seconds"]}s '
+            f'({estado["throughput_bytes_per_second"]} bytes/s)'
+        )
+    
+    # Recria uma réplica perdida de um fragmento
+    def _reparar_fragmento(self, id_perdido, frag):
+        """Retorna True se a réplica foi recriada (None se o reparo não é mais necessário)"""
+        if id_perdido != self.id_nodo and id_perdido in self.posicionador.vivos():
+            return None  # o nodo voltou: as réplicas dele continuam valendo
+        
+        nome_fragmento = self._nome_fragmento(frag['id_arquivo'], frag)
+        origens = [id_nodo for id_nodo in frag['nodos'] if id_nodo != id_perdido]
+        
+        if id_perdido == self.id_nodo:
+            destino = self.id_nodo
+        else:
+            escolhidos = self._obter_nodos_menos_carregados(1, frag['tamanho'], frag['nodos'])
+            if not escolhidos:
+                self.registrar_log(f'ERRO no reparo de {nome_fragmento}: nenhum nodo vivo disponível', fragment=nome_fragmento)
+                self.progresso_reparo.registrar(False)
+                return False
+            destino = escolhidos[0]
         
-        # Encontra o ID do nodo pela porta
         try:
-            id_nodo = self.portas.index(porta) + 1
+            sucesso = self._copiar_fragmento(nome_fragmento, frag, origens, destino, id_perdido)
+            if sucesso and destino != id_perdido:
+                self.bd.mover_replica(frag['id_arquivo'], frag['id_fragmento'], id_perdido, destino, frag.get('hash'))
+        except Exception as e:
+            self.registrar_log(f'ERRO no reparo de {nome_fragmento}: {e}', fragment=nome_fragmento)
+            sucesso = False
+        finally:
+            if destino != id_perdido:
+                self.posicionador.liberar(destino, frag['tamanho'])
+        
+        self.progresso_reparo.registrar(sucesso, frag['tamanho'])
+        return sucesso
+    
+    # Copia um fragmento de uma réplica sobrevivente para 'destino' (shards de erasure são recalculados)
+    def _copiar_fragmento(self, nome_fragmento, frag, origens, destino, id_perdido):
+        """Retorna True se a cópia ficou gravada em 'destino'"""
+        checksum = self._checksum(frag)
+        origem = self._fragmento_local(nome_fragmento, origens, checksum)
+        if isinstance(origem, Path):
+            return self._gravar_copia(destino, nome_fragmento, frag, partial(self._ler_intervalo, origem, 0, frag['tamanho']))
+        if origem is not None:
+            return self._gravar_copia(destino, nome_fragmento, frag, lambda: iter([origem]))
+        
+        # Stream direto da origem para o destino: o limite de taxa segura os dois lados
+        for id_origem in self._ordenar_replicas(origens):
+            if id_origem == self.id_nodo:
+                continue
+            inicio = time.perf_counter()
+            recebidos = [0]
+            sucesso = False
+            try:
+                url = self._url_nodo(id_origem, f'/get_fragment/{nome_fragmento}')
+                parametros = {'checksum': checksum} if checksum else {}
+                with self.sessao_http.get(url, params=parametros, timeout=self.timeout_http, stream=True) as resposta:
+                    if resposta.status_code == 200:
+                        blocos = lambda: self._contar_blocos(resposta.iter_content(self.tamanho_bloco), recebidos)
+                        sucesso = self._gravar_copia(destino, nome_fragmento, frag, blocos)
+                        return sucesso
+            except requests.RequestException as e:
+                self.registrar_log(f'ERRO ao buscar {nome_fragmento} no nodo {id_origem} para reparo: {e}', fragment=nome_fragmento, peer=id_origem)
+            finally:
+                self._registrar_transferencia(id_origem, 'fetch', recebidos[0], inicio, sucesso)
+        
+        # Nenhuma cópia: um shard de código de apagamento ainda pode ser recalculado pelos outros da faixa
+        dados = self._reconstruir_shard(frag, id_perdido)
+        if dados is None:
+            self.registrar_log(f'ERRO no reparo de {nome_fragmento}: nenhuma réplica de origem disponível', fragment=nome_fragmento)
+            return False
+        return self._gravar_copia(destino, nome_fragmento, frag, lambda: iter([dados]))
+    
+    # Grava a cópia de reparo em 'destino' passando pelo limite de taxa
+    def _gravar_copia(self, destino, nome_fragmento, frag, blocos):
+        """Retorna True se a cópia foi gravada"""
+        limitados = lambda: self.limitador_reparo.limitar(blocos())
+        if destino != self.id_nodo:
+            return self._enviar_fragmento_para_nodo(destino, nome_fragmento, limitados, frag.get('hash'), self._checksum(frag))
+        try:
+            self._gravar_fragmento_local(nome_fragmento, limitados(), self._checksum(frag))
+            return True
+        except Exception as e:
+            self.registrar_log(f'ERRO ao gravar {nome_fragmento} no reparo: {e}', fragment=nome_fragmento)
+            return False
+    
+    # Recalcula um shard perdido de um arquivo com código de apagamento a partir de k shards da mesma faixa
+    def _reconstruir_shard(self, frag, id_perdido):
+        """Retorna os bytes do shard ou None"""
+        info_arquivo = self.bd.obter_arquivo(frag['id_arquivo'])
+        if info_arquivo is None or info_arquivo.get('estrategia') != 'erasure':
+            return None
+        
+        k, m, tamanho_faixa = info_arquivo['k'], info_arquivo['m'], info_arquivo['tamanho_faixa']
+        faixa, indice = divmod(frag['id_fragmento'], k + m)
+        tamanho_dados = min(tamanho_faixa, info_arquivo['tamanho'] - faixa * tamanho_faixa)
+        tamanho_shard, intervalos = self._shards_da_faixa(tamanho_dados, k)
+        fragmentos = {id_frag: (nome, nodos, checksum)
+                      for id_frag, _, nodos, nome, checksum, _ in self._agrupar_fragmentos(frag['id_arquivo'], info_arquivo)}
+        
+        shards = {}
+        for i in range(k + m):
+            id_frag = faixa * (k + m) + i
+            if len(shards) >= k or i == indice or id_frag not in fragmentos:
+                continue
+            nome, nodos, checksum = fragmentos[id_frag]
+            dados = self._obter_shard(nome, [id_nodo for id_nodo in nodos if id_nodo != id_perdido], checksum)
+            if dados is not None:
+                self.limitador_reparo.consumir(len(dados))
+                shards[i] = dados
+        if len(shards) < k:
+            return None
+        
+        codificador = self._codificador_erasure(k, m)
+        dados_faixa = codificador.decodificar(shards, tamanho_shard)
+        if indice < k:
+            return dados_faixa[indice][:intervalos[indice][1]]
+        return codificador.codificar(dados_faixa, tamanho_shard)[indice - k]
+    
+    # Repete a varredura dos fragmentos locais a cada INTERVALO_VARREDURA segundos
+    def _executar_varredura(self):
+        """Thread da varredura de integridade"""
+        self.inventario_pronto.wait()  # a varredura parte do inventário já comparado com o disco
+        while self.rodando:
+            try:
+                self._varrer_fragmentos()
+            except Exception as e:
+                self.registrar_log(f'ERRO na varredura de integridade: {e}')
+            time.sleep(self.intervalo_varredura)
+    
+    # Relê os fragmentos locais em ordem de nome com taxa limitada (TAXA_VARREDURA) e confere tamanho e checksum
+    # A posição é salva em disco de tempos em tempos, então uma passada interrompida continua de onde parou
+    def _varrer_fragmentos(self):
+        """Uma passada da varredura: isola os corrompidos e agenda o reparo dos que faltam"""
+        esperados = {self._nome_fragmento(frag['id_arquivo'], frag): frag for frag in self.bd.fragmentos_do_nodo(self.id_nodo)}
+        no_disco = set(self.inventario.nomes())
+        if self.volumes is not None:
+            no_disco.update(self.volumes.nomes())
+        try:
+            cursor = self.arquivo_cursor_varredura.read_text().strip()
+        except FileNotFoundError:
+            cursor = ''
+        nomes = [nome for nome in sorted(set(esperados) | no_disco) if nome > cursor]
+        
+        self.progresso_varredura.iniciar(len(nomes), cursor)
+        ultimo_salvamento = time.time()
+        for nome in nomes:
+            if not self.rodando:
+                return
+            frag = esperados.get(nome)
+            if frag is None:
+                self.progresso_varredura.registrar('orphan_files')  # upload em andamento ou arquivo já removido
+            elif nome not in no_disco:
+                self.progresso_varredura.registrar('fragments_missing')
+            else:
+                self.progresso_varredura.registrar(*self._conferir_fragmento(nome, frag))
+            if time.time() - ultimo_salvamento >= 10:
+                self.arquivo_cursor_varredura.write_text(nome)
+                ultimo_salvamento = time.time()
+        
+        self.arquivo_cursor_varredura.write_text('')
+        self.progresso_varredura.concluir()
+        resumo = self.progresso_varredura.resumo()['last']
+        self.registrar_log(
+            f'Varredura de integridade concluída: {resumo["fragments_checked"]} fragmentos conferidos, '
+            f'{resumo["fragments_corrupt"]} corrompidos, {resumo["fragments_missing"]} ausentes, '
+            f'{resumo["orphan_files"]} sem registro, {resumo["bytes_checked"]} bytes em {resumo["elapsed_seconds"]}s'
+        )
+        if resumo['fragments_missing']:
+            self._enfileirar_reparo(self.id_nodo, 'fragmentos locais ausentes')
+    
+    # Confere um fragmento da varredura (sempre relê, sem confiar no que já foi verificado)
+    def _conferir_fragmento(self, nome_fragmento, frag):
+        """Retorna (contador, bytes lidos) para o progresso da varredura"""
+        obtido = self.volumes.obter(nome_fragmento) if self.volumes is not None else None
+        caminho_fragmento = self.dir_arquivos / nome_fragmento
+        try:
+            if obtido is not None:
+                entrada, dados = obtido
+                tamanho = len(dados)
+                blocos = lambda: iter([dados])
+            else:
+                estado = caminho_fragmento.stat()
+                tamanho = estado.st_size
+                blocos = partial(self._ler_intervalo, caminho_fragmento, 0, tamanho)
+            checksum = self._checksum(frag)
+            if tamanho != frag['tamanho']:
+                self._isolar_fragmento(nome_fragmento, f'tamanho {tamanho} em vez de {frag["tamanho"]}')
+                return 'fragments_corrupt', 0
+            if checksum:
+                if checksum_blocos(self.limitador_varredura.limitar(blocos())) != checksum:
+                    self._isolar_fragmento(nome_fragmento, 'checksum divergente na varredura')
+                    return 'fragments_corrupt', tamanho
+                if obtido is not None:
+                    self.fragmentos_verificados[nome_fragmento] = entrada
+                else:
+                    self.inventario.registrar(nome_fragmento, tamanho, estado.st_mtime_ns, checksum)
+            return 'fragments_checked', tamanho
+        except FileNotFoundError:
+            self.inventario.remover(nome_fragmento)
+            return 'fragments_missing', 0
+    
+    # Salva o índice dos volumes a cada INTERVALO_CHECKPOINT_VOLUMES segundos (se mudou)
+    # e compacta os volumes com muito espaço morto a cada INTERVALO_COMPACTACAO segundos (0 = sem compactação)
+    def _manter_volumes(self):
+        """Thread de manutenção dos volumes"""
+        ultima_compactacao = time.time()
+        while self.rodando:
+            time.sleep(self.intervalo_checkpoint_volumes)
+            try:
+                self.volumes.salvar_indice()
+                if self.intervalo_compactacao > 0 and time.time() - ultima_compactacao >= self.intervalo_compactacao:
+                    ultima_compactacao = time.time()
+                    recuperados = self.volumes.compactar(self.limitador_compactacao)
+                    if recuperados:
+                        self.registrar_log(f'Compactação dos volumes: {recuperados} bytes recuperados')
+            except Exception as e:
+                self.registrar_log(f'ERRO na manutenção dos volumes: {e}')
+    
+    # Anti-entropia do shard de metadados (backend distribuido): a primeira passada sai assim que o heartbeat
+    # conhece o estado dos outros nodos e acerta o que mudou enquanto este nodo estava fora do ar
+    def _sincronizar_metadados(self):
+        """Thread de sincronização do shard local com os outros donos"""
+        espera = self.timeout_heartbeat
+        while self.rodando:
+            time.sleep(espera)
+            espera = self.intervalo_sincronizacao_metadados
+            try:
+                copiados, removidos = self.bd.sincronizar()
+                if copiados or removidos:
+                    self.registrar_log(f'Metadados sincronizados: {copiados} arquivos copiados, {removidos} removidos')
+            except Exception as e:
+                self.registrar_log(f'ERRO na sincronização dos metadados: {e}')
+    
+    # Tenta reiniciar um nodo que foi detectado como morto (chamado pelo heartbeat, não bloqueia)
+    # Em vez de janelas de tempo fixas: não lança outro processo enquanto o último lançado ainda está subindo
+    # nem se o nodo responde em /ready (está de pé e o heartbeat ainda não o viu)
+    def tentar_recuperar_nodo(self, porta):
+        """Tenta recuperar um nodo que caiu"""
+        id_nodo = self.portas.index(porta) + 1
+        with self.lock_recuperacao:
+            if id_nodo in self.recuperacoes:
+                return  # sondagem ou partida em andamento
+            self.recuperacoes[id_nodo] = None
+        thread = threading.Thread(target=self._recuperar_nodo, args=(id_nodo,))
+        thread.daemon = True
+        thread.start()
+    
+    # Sonda o nodo, lança o processo e espera ele ficar pronto; se o processo sair ou passar de
+    # TEMPO_MAXIMO_PARTIDA, a partida é abortada e a próxima rodada do heartbeat pode tentar de novo
+    def _recuperar_nodo(self, id_nodo):
+        """Thread de uma tentativa de recuperação"""
+        porta = self.portas[id_nodo - 1]
+        try:
+            if self._sondar_prontidao(id_nodo) is not None:
+                return
             self.registrar_log(f'Tentando recuperar nodo {id_nodo} na porta {porta}')
             
-            # Registra a tentativa de recuperação
-            self.tentativas_recuperacao[porta] = tempo_atual
-            
             # Inicia um novo processo do nodo
             # Usa o mesmo interpretador Python que está rodando este script
             executavel_python = sys.executable
             caminho_script = os.path.abspath(__file__)
             
             # Inicia o processo em background
-            subprocess.Popen(
+            processo = subprocess.Popen(
                 [executavel_python, caminho_script, str(id_nodo)],
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 start_new_session=True  # Desacopla do processo pai
             )
-            
+            with self.lock_recuperacao:
+                self.recuperacoes[id_nodo] = processo
             self.registrar_log(f'Processo de recuperação iniciado para nodo {id_nodo}')
             
+            inicio = time.monotonic()
+            while self.rodando:
+                if self._sondar_prontidao(id_nodo):
+                    self.registrar_log(f'Nodo {id_nodo} recuperado e pronto em {time.monotonic() - inicio:.3f}s', peer=id_nodo)
+                    self.metricas.incrementar('node_recoveries_total', peer=id_nodo, result='ready')
+                    return
+                if processo.poll() is not None:
+                    # saiu: outro processo do nodo já está com o diretório ou a partida falhou
+                    self.registrar_log(f'Processo de recuperação do nodo {id_nodo} saiu com código {processo.returncode}', 'warning', peer=id_nodo)
+                    self.metricas.incrementar('node_recoveries_total', peer=id_nodo, result='exited')
+                    return
+                if time.monotonic() - inicio > self.tempo_maximo_partida:
+                    self.registrar_log(f'ERRO: nodo {id_nodo} não ficou pronto em {self.tempo_maximo_partida:g}s, processo encerrado', peer=id_nodo)
+                    self.metricas.incrementar('node_recoveries_total', peer=id_nodo, result='timeout')
+                    processo.terminate()
+                    return
+                time.sleep(0.1)
         except Exception as e:
             self.registrar_log(f'ERRO ao tentar recuperar nodo na porta {porta}: {e}')
+        finally:
+            with self.lock_recuperacao:
+                self.recuperacoes.pop(id_nodo, None)
+    
+    # Consulta GET /ready de outro nodo
+    def _sondar_prontidao(self, id_nodo):
+        """Retorna True (pronto), False (respondeu, mas ainda não está pronto) ou None (não respondeu)"""
+        try:
+            resposta = self.sessao_http.get(self._url_nodo(id_nodo, '/ready'), timeout=self.timeout_sonda)
+        except requests.RequestException:
+            return None
+        return resposta.status_code == 200
+    
+    # Trava files_nodo_N/.trava enquanto o processo existir (o sistema solta a trava quando ele morre)
+    def _travar_diretorio(self):
+        """Retorna o arquivo da trava; sai do processo se outro processo já é este nodo"""
+        arquivo_trava = open(self.dir_arquivos / '.trava', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(arquivo_trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f'Nodo {self.id_nodo} já está rodando (files_nodo_{self.id_nodo}/.trava)', file=sys.stderr)
+                sys.exit(1)
+        return arquivo_trava
+    
+    # Compara o inventário com o diretório (em segundo plano, o nodo já está atendendo) e depois
+    # traz de volta os fragmentos que o banco diz que estão neste nodo e não estão no disco
+    def _preparar_inventario(self):
+        """Thread de partida do inventário"""
+        try:
+            resultado = self.inventario.reconciliar(self.dir_arquivos, ('file_', 'chunk_'))
+            self.inventario.salvar()
+            estatisticas = self.inventario.estatisticas()
+            self.registrar_log(
+                f'Inventário: {estatisticas["fragments"]} fragmentos carregados em {estatisticas["load_ms"]}ms, '
+                f'{resultado["added"]} novos, {resultado["changed"]} alterados e {resultado["removed"]} sumidos no disco'
+            )
+        except Exception as e:
+            self.registrar_log(f'ERRO ao comparar o inventário com o disco: {e}')
+        self.inventario_pronto.set()
+        self._enfileirar_reparo(self.id_nodo, 'fragmentos locais ausentes')
+    
+    # Salva o inventário a cada INTERVALO_CHECKPOINT_INVENTARIO segundos (se mudou)
+    def _manter_inventario(self):
+        """Thread de checkpoint do inventário"""
+        while self.rodando:
+            time.sleep(self.intervalo_checkpoint_inventario)
+            try:
+                self.inventario.salvar()
+            except Exception as e:
+                self.registrar_log(f'ERRO ao salvar o inventário: {e}')
     
     # Função principal que inicia todos os componentes do nodo
     def executar(self):
         """Executa o nodo"""
+        # SIGTERM (pkill, mata_nodo.sh) encerra como o Ctrl+C
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'rodando', False))
+        
         # Inicia o servidor TCP
         self.iniciar_servidor()
         
@@ -548,17 +2658,51 @@ class Nodo:
         thread_http.daemon = True
         thread_http.start()
         
-        # Aguarda tempo suficiente para garantir que TODOS os nodos (inclusive HTTP) estejam prontos
-        # Isso evita que nodos tentem recuperar outros que ainda estão iniciando
-        tempo_espera = 10
-        self.registrar_log(f'Aguardando {tempo_espera}s para sincronização inicial dos nodos...')
-        time.sleep(tempo_espera)
+        # Pronto assim que o HTTP aceita conexões: volumes e inventário já vieram dos checkpoints no __init__
+        # (um nodo que ainda está subindo responde /ready com 503 ou nem responde, e ninguém tenta recuperá-lo)
+        if not self.http_pronto.wait(self.tempo_maximo_partida):
+            self.registrar_log(f'ERRO: servidor HTTP não subiu em {self.tempo_maximo_partida:g}s')
+            sys.exit(1)
+        self.tempo_partida = time.monotonic() - self.inicio_partida
+        self.pronto.set()
+        self.registrar_log(f'Nodo pronto em {self.tempo_partida:.3f}s')
         
         # Inicia monitor de heartbeat
         thread_heartbeat = threading.Thread(target=self.monitorar_heartbeat)
         thread_heartbeat.daemon = True
         thread_heartbeat.start()
         
+        # Inicia o reparo de réplicas
+        thread_reparo = threading.Thread(target=self._executar_reparos)
+        thread_reparo.daemon = True
+        thread_reparo.start()
+        
+        # Compara o inventário com o disco, agenda o reparo dos fragmentos locais ausentes e salva o inventário periodicamente
+        thread_partida_inventario = threading.Thread(target=self._preparar_inventario)
+        thread_partida_inventario.daemon = True
+        thread_partida_inventario.start()
+        thread_inventario = threading.Thread(target=self._manter_inventario)
+        thread_inventario.daemon = True
+        thread_inventario.start()
+        
+        # Inicia a varredura de integridade dos fragmentos locais
+        if self.intervalo_varredura > 0:
+            thread_varredura = threading.Thread(target=self._executar_varredura)
+            thread_varredura.daemon = True
+            thread_varredura.start()
+        
+        # Checkpoint do índice e compactação dos volumes
+        if self.volumes is not None:
+            thread_volumes = threading.Thread(target=self._manter_volumes)
+            thread_volumes.daemon = True
+            thread_volumes.start()
+        
+        # Sincronização do shard de metadados com os outros donos
+        if self.tipo_backend == 'distribuido':
+            thread_metadados = threading.Thread(target=self._sincronizar_metadados)
+            thread_metadados.daemon = True
+            thread_metadados.start()
+        
         self.registrar_log(f'Sistema iniciado - TCP:{self.porta} HTTP:{self.porta_http}')
         
         # Loop principal
@@ -566,38 +2710,70 @@ class Nodo:
             while self.rodando:
                 time.sleep(1)
         except KeyboardInterrupt:
-            self.registrar_log('Encerrando nodo...')
             self.rodando = False
-            if self.socket_servidor:
-                self.socket_servidor.close()
+        self._encerrar()
+    
+    # Encerramento gradual: para de aceitar conexões e espera as requisições em andamento
+    def _encerrar(self):
+        """Fecha os servidores e esvazia o log"""
+        self.registrar_log('Encerrando nodo...')
+        if self.socket_servidor:
+            self.socket_servidor.close()
+        if self.servidor_http is not None:
+            pendentes = self.servidor_http.encerrar(self.tempo_encerramento)
+            if pendentes:
+                self.registrar_log(f'{pendentes} requisições HTTP interrompidas após {self.tempo_encerramento:g}s de espera', 'warning')
+        if self.volumes is not None:
+            self.volumes.fechar()
+        self.inventario.salvar()
+        self.log.esvaziar()
     
     # Inicia o servidor HTTP Flask para receber requisições de upload/download
     def _iniciar_servidor_http(self):
         """Inicia o servidor HTTP Flask"""
         try:
             self.registrar_log(f'Servidor HTTP iniciando na porta {self.porta_http}...')
-            self.app.run(
-                host='0.0.0.0',
-                port=self.porta_http,
-                debug=False,
-                use_reloader=False,
-                threaded=True
+            if self.log.nivel_minimo > logging.DEBUG:
+                # o log de acesso do werkzeug escreve no stderr a cada requisição, dentro da própria requisição
+                logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            if self.modo_servidor_http == 'desenvolvimento':
+                self.http_pronto.set()  # app.run não avisa quando a porta abre: conta como pronto na chamada
+                self.app.run(
+                    host='0.0.0.0',
+                    port=self.porta_http,
+                    debug=False,
+                    use_reloader=False,
+                    threaded=True,
+                    request_handler=TratadorKeepAlive  # keep-alive também aqui, senão o pool não reaproveita conexões
+                )
+                return
+            self.servidor_http = ServidorLimitado(
+                '0.0.0.0',
+                self.porta_http,
+                self.app,
+                threads=self.threads_http,
+                tamanho_fila=self.tamanho_fila_http,
+                timeout_cliente=self.timeout_cliente_http,
+                timeout_ocioso=self.timeout_ocioso_http
             )
+            self.http_pronto.set()  # o socket já está escutando: as conexões esperam na fila até o serve_forever
+            self.servidor_http.serve_forever()
         except Exception as e:
             self.registrar_log(f'ERRO ao iniciar servidor HTTP: {e}')
 
 
 # Função principal de entrada do programa
 def main():
+    total_nodos = len(os.getenv('PORTAS', '').split(','))
     if len(sys.argv) != 2:
         print('Uso: python node.py <id_nodo>')
-        print('id_nodo deve ser entre 1 e 8')
+        print(f'id_nodo deve ser entre 1 e {total_nodos} (um por porta em PORTAS)')
         sys.exit(1)
     
     try:
         id_nodo = int(sys.argv[1])
-        if id_nodo < 1 or id_nodo > 8:
-            raise ValueError('id_nodo deve ser entre 1 e 8')
+        if id_nodo < 1 or id_nodo > total_nodos:
+            raise ValueError(f'id_nodo deve ser entre 1 e {total_nodos} (um por porta em PORTAS)')
         
         nodo = Nodo(id_nodo)
         nodo.executar()
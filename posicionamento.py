@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Escolha dos nodos que recebem as réplicas de cada fragmento
+A carga de um nodo é o que ele já armazena mais o que está sendo gravado nele agora
+"""
+
+import heapq
+from threading import Lock
+
+
+# Heap de nodos por carga com remoção preguiçosa: cada mudança de carga empilha
+# uma entrada nova e as antigas são descartadas quando chegam ao topo
+class Posicionador:
+    """Escolhe nodos vivos, distintos e com menor carga"""
+
+    def __init__(self, ids_nodos):
+        self.lock = Lock()
+        self.armazenado = {id_nodo: 0 for id_nodo in ids_nodos}  # bytes já gravados (do banco)
+        self.em_transito = {id_nodo: 0 for id_nodo in ids_nodos}  # bytes reservados e ainda sendo gravados
+        self.mortos = set()
+        self.heap = []
+        self._reconstruir()
+
+    def _carga(self, id_nodo):
+        return self.armazenado[id_nodo] + self.em_transito[id_nodo]
+
+    def _reconstruir(self):
+        self.heap = [(self._carga(id_nodo), id_nodo) for id_nodo in self.armazenado]
+        heapq.heapify(self.heap)
+
+    # Atualiza os bytes armazenados com os contadores do banco (também descarta as entradas velhas)
+    def atualizar_armazenamento(self, armazenamento):
+        """armazenamento: {id_nodo: bytes}; nodos fora do cluster são ignorados"""
+        with self.lock:
+            for id_nodo, total in armazenamento.items():
+                if int(id_nodo) in self.armazenado:
+                    self.armazenado[int(id_nodo)] = total
+            self._reconstruir()
+
+    # Membership vinda do heartbeat (nodo desconhecido conta como vivo)
+    def marcar_vivos(self, ids_nodos):
+        with self.lock:
+            self.mortos.difference_update(ids_nodos)
+
+    def marcar_mortos(self, ids_nodos):
+        with self.lock:
+            self.mortos.update(id_nodo for id_nodo in ids_nodos if id_nodo in self.armazenado)
+
+    def vivos(self):
+        """Retorna os IDs dos nodos considerados vivos"""
+        with self.lock:
+            return [id_nodo for id_nodo in self.armazenado if id_nodo not in self.mortos]
+
+    # Escolhe até 'quantidade' nodos vivos distintos e reserva 'tamanho' bytes em cada um
+    def escolher(self, quantidade, tamanho, excluir=()):
+        """Retorna os nodos escolhidos, do menos para o mais carregado (pode vir menos se faltar nodo vivo)"""
+        with self.lock:
+            escolhidos = []
+            ignorados = []
+            while self.heap and len(escolhidos) < quantidade:
+                carga, id_nodo = heapq.heappop(self.heap)
+                if carga != self._carga(id_nodo) or id_nodo in escolhidos:
+                    continue  # entrada velha ou repetida
+                if id_nodo in self.mortos or id_nodo in excluir:
+                    ignorados.append((carga, id_nodo))
+                    continue
+                escolhidos.append(id_nodo)
+
+            for entrada in ignorados:
+                heapq.heappush(self.heap, entrada)
+            for id_nodo in escolhidos:
+                self.em_transito[id_nodo] += tamanho
+                heapq.heappush(self.heap, (self._carga(id_nodo), id_nodo))
+            return escolhidos
+
+    # Devolve a reserva de uma gravação que terminou (com sucesso ou não)
+    def liberar(self, id_nodo, tamanho):
+        with self.lock:
+            self.em_transito[id_nodo] = max(0, self.em_transito[id_nodo] - tamanho)
+            heapq.heappush(self.heap, (self._carga(id_nodo), id_nodo))
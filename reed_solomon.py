@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Código de apagamento Reed-Solomon (k dados + m paridade) sobre GF(2^8)
+Qualquer k dos k+m shards de uma faixa reconstroem os dados
+"""
+
+import numpy as np
+
+# Polinômio primitivo x^8 + x^4 + x^3 + x^2 + 1
+POLINOMIO = 0x11d
+
+
+# Tabelas de exponencial/log e a tabuada completa 256x256 do corpo
+def _gerar_tabelas():
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    valor = 1
+    for i in range(255):
+        exp[i] = valor
+        log[valor] = i
+        valor <<= 1
+        if valor & 0x100:
+            valor ^= POLINOMIO
+    exp[255:510] = exp[:255]
+
+    # tabuada[a][b] = a * b no corpo; multiplicar um shard inteiro vira uma indexação
+    indices = (log[1:, None] + log[None, 1:]) % 255
+    tabuada = np.zeros((256, 256), dtype=np.uint8)
+    tabuada[1:, 1:] = exp[indices]
+    return exp, log, tabuada
+
+
+EXP, LOG, TABUADA = _gerar_tabelas()
+
+
+def _mul(a, b):
+    return int(TABUADA[a, b])
+
+
+def _inv(a):
+    if a == 0:
+        raise ZeroDivisionError('0 não tem inverso em GF(256)')
+    return int(EXP[255 - LOG[a]])
+
+
+# Inverte uma matriz quadrada em GF(256) por Gauss-Jordan
+def _inverter(matriz):
+    n = len(matriz)
+    aumentada = [list(linha) + [int(i == j) for j in range(n)] for i, linha in enumerate(matriz)]
+
+    for coluna in range(n):
+        pivo = next((i for i in range(coluna, n) if aumentada[i][coluna]), None)
+        if pivo is None:
+            raise ValueError('Matriz singular')
+        aumentada[coluna], aumentada[pivo] = aumentada[pivo], aumentada[coluna]
+
+        inverso = _inv(aumentada[coluna][coluna])
+        aumentada[coluna] = [_mul(inverso, v) for v in aumentada[coluna]]
+
+        for i in range(n):
+            fator = aumentada[i][coluna]
+            if i != coluna and fator:
+                aumentada[i] = [v ^ _mul(fator, p) for v, p in zip(aumentada[i], aumentada[coluna])]
+
+    return [linha[n:] for linha in aumentada]
+
+
+# Codificador/decodificador sistemático: os k primeiros shards são os próprios dados
+class ReedSolomon:
+    """Reed-Solomon (k+m) com matriz de Cauchy"""
+
+    def __init__(self, k, m):
+        if k < 1 or m < 0 or k + m > 256:
+            raise ValueError('Parâmetros inválidos: precisa de 1 <= k e k + m <= 256')
+        self.k = k
+        self.m = m
+
+        # Cauchy: C[i][j] = 1 / (x_i + y_j), com x_i = k + i e y_j = j (todos distintos).
+        # Qualquer k linhas de [I; C] formam uma matriz inversível.
+        self.matriz = [[int(i == j) for j in range(k)] for i in range(k)]
+        self.matriz += [[_inv((k + i) ^ j) for j in range(k)] for i in range(m)]
+
+    # Multiplica linhas da matriz pelos shards (k x tamanho) em GF(256)
+    @staticmethod
+    def _multiplicar(linhas, shards):
+        resultado = np.zeros((len(linhas), shards.shape[1]), dtype=np.uint8)
+        for i, linha in enumerate(linhas):
+            for j, coeficiente in enumerate(linha):
+                if coeficiente:
+                    resultado[i] ^= TABUADA[coeficiente][shards[j]]
+        return resultado
+
+    @staticmethod
+    def _empilhar(shards, tamanho_shard):
+        matriz = np.zeros((len(shards), tamanho_shard), dtype=np.uint8)
+        for i, shard in enumerate(shards):
+            matriz[i, :len(shard)] = np.frombuffer(shard, dtype=np.uint8)
+        return matriz
+
+    # Calcula os m shards de paridade a partir dos k shards de dados
+    def codificar(self, shards_dados, tamanho_shard):
+        """Retorna a lista de shards de paridade (bytes); shards menores são completados com zeros"""
+        if len(shards_dados) != self.k:
+            raise ValueError(f'Esperados {self.k} shards de dados')
+        dados = self._empilhar(shards_dados, tamanho_shard)
+        return [linha.tobytes() for linha in self._multiplicar(self.matriz[self.k:], dados)]
+
+    # Reconstrói os k shards de dados a partir de quaisquer k shards disponíveis
+    def decodificar(self, shards, tamanho_shard):
+        """shards: {indice: bytes} com pelo menos k entradas. Retorna os k shards de dados"""
+        if len(shards) < self.k:
+            raise ValueError(f'São necessários {self.k} shards, só há {len(shards)}')
+
+        # Se todos os shards de dados estão presentes não há o que calcular
+        if all(i in shards for i in range(self.k)):
+            return [bytes(shards[i]).ljust(tamanho_shard, b'\0') for i in range(self.k)]
+
+        indices = sorted(shards)[:self.k]
+        inversa = _inverter([self.matriz[i] for i in indices])
+        disponiveis = self._empilhar([shards[i] for i in indices], tamanho_shard)
+        return [linha.tobytes() for linha in self._multiplicar(inversa, disponiveis)]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Log assíncrono do nodo: quem registra só põe o registro numa fila e volta na hora
+Uma thread junta os registros em lotes, grava no arquivo (uma linha JSON por registro,
+com rotação por tamanho) e repete no terminal em formato legível
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+NIVEIS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}  # mesmos valores do módulo logging
+
+
+# Fila limitada + thread escritora; com a fila cheia o registro é descartado (e contado) em vez de bloquear
+class RegistroAssincrono:
+    """Logger em JSON lines com lotes e rotação"""
+
+    def __init__(self, caminho, id_nodo, nivel='info', tamanho_maximo=10 * 1024 * 1024, arquivos_antigos=3,
+                 tamanho_fila=10000, tamanho_lote=500, terminal=True):
+        if nivel not in NIVEIS:
+            raise ValueError(f'Nível de log inválido: {nivel} (use {", ".join(NIVEIS)})')
+        self.caminho = caminho
+        self.id_nodo = id_nodo
+        self.nivel_minimo = NIVEIS[nivel]
+        self.tamanho_maximo = tamanho_maximo
+        self.arquivos_antigos = arquivos_antigos
+        self.tamanho_lote = tamanho_lote
+        self.terminal = terminal
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.descartados = 0
+        self.lock_descartados = threading.Lock()  # somado por quem registra, lido e zerado pela escritora
+        self.arquivo = None
+        self.thread = threading.Thread(target=self._escrever, name=f'log_nodo_{id_nodo}', daemon=True)
+        self.thread.start()
+
+    # Enfileira um registro (nunca bloqueia); 'campos' vão como chaves extras do JSON
+    def registrar(self, mensagem, nivel='info', **campos):
+        if NIVEIS[nivel] < self.nivel_minimo:
+            return
+        registro = {'ts': time.time(), 'level': nivel, 'node': self.id_nodo, 'msg': mensagem}
+        registro.update((chave, valor) for chave, valor in campos.items() if valor is not None)
+        try:
+            self.fila.put_nowait(registro)
+        except queue.Full:
+            with self.lock_descartados:
+                self.descartados += 1
+
+    # Espera a fila esvaziar (usado no encerramento)
+    def esvaziar(self, timeout=2.0):
+        limite = time.monotonic() + timeout
+        while self.fila.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.01)
+
+    def _abrir(self):
+        self.arquivo = open(self.caminho, 'a', encoding='utf-8')
+
+    # Renomeia nodo_N.log -> nodo_N.log.1 -> ... e descarta o mais antigo
+    def _rotacionar(self):
+        self.arquivo.close()
+        for i in range(self.arquivos_antigos - 1, 0, -1):
+            antigo = f'{self.caminho}.{i}'
+            if os.path.exists(antigo):
+                os.replace(antigo, f'{self.caminho}.{i + 1}')
+        if self.arquivos_antigos > 0:
+            os.replace(self.caminho, f'{self.caminho}.1')
+        else:
+            os.remove(self.caminho)
+        self._abrir()
+
+    @staticmethod
+    def _linha_terminal(registro):
+        horario = datetime.fromtimestamp(registro['ts']).strftime('%Y-%m-%d %H:%M:%S')
+        nivel = '' if registro['level'] == 'info' else f'{registro["level"].upper()} '
+        return f'[{horario}] {nivel}{registro["msg"]}'
+
+    # Thread escritora: um write e um flush por lote
+    def _escrever(self):
+        self._abrir()
+        while True:
+            lote = [self.fila.get()]
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            recebidos = len(lote)
+            try:
+                with self.lock_descartados:
+                    descartados, self.descartados = self.descartados, 0
+                if descartados:
+                    lote.append({'ts': time.time(), 'level': 'warning', 'node': self.id_nodo,
+                                 'msg': f'{descartados} registros descartados (fila de log cheia)'})
+                self.arquivo.write(''.join(json.dumps(registro, ensure_ascii=False) + '\n' for registro in lote))
+                self.arquivo.flush()
+                if self.terminal:
+                    sys.stdout.write(''.join(self._linha_terminal(registro) + '\n' for registro in lote))
+                    sys.stdout.flush()
+                if self.tamanho_maximo and self.arquivo.tell() >= self.tamanho_maximo:
+                    self._rotacionar()
+            except Exception as e:
+                sys.stderr.write(f'ERRO ao gravar log: {e}\n')
+            finally:
+                for _ in range(recebidos):
+                    self.fila.task_done()
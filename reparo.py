@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Apoio ao reparo de réplicas: limite de taxa do tráfego de reconstrução
+e acompanhamento do progresso
+"""
+
+import time
+from threading import Lock
+
+
+# Balde de fichas: o tráfego de reparo não passa de 'bytes_por_segundo' (0 = sem limite)
+class LimitadorTaxa:
+    """Limita a taxa de bytes de quem chama consumir()"""
+
+    def __init__(self, bytes_por_segundo, rajada=None):
+        self.taxa = bytes_por_segundo
+        self.capacidade = rajada or max(bytes_por_segundo // 10, 1)  # rajada padrão: 100 ms de tráfego
+        self.fichas = self.capacidade
+        self.ultimo = time.monotonic()
+        self.lock = Lock()
+
+    # Bloqueia até haver fichas para 'quantidade' bytes
+    def consumir(self, quantidade):
+        if self.taxa <= 0:
+            return
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.taxa)
+            self.ultimo = agora
+            self.fichas -= quantidade
+            espera = -self.fichas / self.taxa if self.fichas < 0 else 0
+        # dorme fora do lock: as outras threads já enxergam a dívida e esperam a vez delas
+        if espera > 0:
+            time.sleep(espera)
+
+    # Repassa os blocos respeitando a taxa
+    def limitar(self, blocos):
+        for bloco in blocos:
+            self.consumir(len(bloco))
+            yield bloco
+
+
+# Contadores do reparo em andamento e do último concluído
+class ProgressoReparo:
+    """Progresso e vazão do reparo de um nodo"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.atual = None
+        self.ultimo = None
+
+    # Começa a contar o reparo de um nodo
+    def iniciar(self, id_nodo, motivo, fragmentos, total_bytes):
+        with self.lock:
+            self.atual = {
+                'node': id_nodo,
+                'reason': motivo,
+                'started_at': time.time(),
+                'fragments_total': fragmentos,
+                'fragments_repaired': 0,
+                'fragments_failed': 0,
+                'bytes_total': total_bytes,
+                'bytes_copied': 0
+            }
+
+    # Registra o resultado de um fragmento
+    def registrar(self, sucesso, tamanho=0):
+        with self.lock:
+            if self.atual is None:
+                return
+            if sucesso:
+                self.atual['fragments_repaired'] += 1
+                self.atual['bytes_copied'] += tamanho
+            else:
+                self.atual['fragments_failed'] += 1
+
+    def concluir(self):
+        with self.lock:
+            if self.atual is not None:
+                self.atual['finished_at'] = time.time()
+                self.ultimo = self.atual
+                self.atual = None
+
+    @staticmethod
+    def _com_vazao(estado):
+        if estado is None:
+            return None
+        estado = dict(estado)
+        duracao = max(estado.get('finished_at', time.time()) - estado['started_at'], 1e-6)
+        estado['elapsed_seconds'] = round(duracao, 3)
+        estado['throughput_bytes_per_second'] = round(estado['bytes_copied'] / duracao)
+        return estado
+
+    # Retorna {'current': ..., 'last': ...} com tempo decorrido e vazão
+    def resumo(self):
+        with self.lock:
+            return {'current': self._com_vazao(self.atual), 'last': self._com_vazao(self.ultimo)}
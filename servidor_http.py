@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP do nodo com número fixo de threads
+As conexões aceitas esperam numa fila limitada por uma das threads de trabalho; com a fila cheia
+a conexão é recusada na hora com 503 em vez de abrir mais uma thread
+As conexões são HTTP/1.1 keep-alive (o pool de conexões entre nodos reaproveita a mesma conexão):
+entre uma requisição e outra a conexão não segura thread, fica num seletor e volta para a fila
+quando chega a próxima requisição; ociosa por mais de 'timeout_ocioso' segundos, é fechada
+"""
+
+import json
+import queue
+import select
+import selectors
+import socket
+import time
+import traceback
+from threading import Lock, Thread
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+# Erros de conexão que só encerram a conexão (o cliente foi embora)
+ERROS_CONEXAO = (ConnectionError, socket.timeout)
+
+
+# Tratador WSGI com keep-alive
+# O run_wsgi do Werkzeug fecha toda conexão porque não sabe onde termina o corpo da requisição;
+# aqui o corpo é lido por um LimitedStream (Content-Length) ou pelo DechunkedInput (chunked) e o que
+# a rota não leu é drenado depois da resposta, deixando o socket no início da próxima requisição
+class TratadorKeepAlive(WSGIRequestHandler):
+    """Tratador HTTP/1.1 que mantém a conexão aberta entre requisições"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True     # cabeçalho e corpo saem em writes separados: sem isso cada resposta espera o ACK atrasado
+    timeout = 60                       # cada leitura/escrita no socket durante uma requisição
+    timeout_ocioso = 5                 # espera pela próxima requisição numa conexão mantida aberta
+    drenagem_maxima = 1024 * 1024      # sobra de corpo maior que isso fecha a conexão em vez de ser lida
+
+    # Cria o tratador de uma conexão sem atendê-la (o ServidorLimitado chama atender() uma requisição por vez)
+    @classmethod
+    def preparar(cls, requisicao, endereco, servidor):
+        tratador = cls.__new__(cls)
+        tratador.request, tratador.client_address, tratador.server = requisicao, endereco, servidor
+        tratador.setup()
+        return tratador
+
+    # Servidor com uma thread por conexão (SERVIDOR_HTTP=desenvolvimento): a thread espera a próxima requisição
+    def handle(self):
+        while self.atender() and self._aguardar_requisicao():
+            pass
+
+    # Atende uma requisição
+    def atender(self):
+        """Retorna True se a conexão continua aberta para a próxima"""
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+        except ERROS_CONEXAO as e:
+            self.close_connection = True
+            self.connection_dropped(e)
+        return not self.close_connection
+
+    # Se a próxima requisição já está no buffer de leitura (lida junto com o fim do corpo anterior),
+    # onde um select no socket não enxerga; o peek sem bloquear devolve o buffer ou b''
+    def pendente(self):
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _aguardar_requisicao(self):
+        if self.pendente():
+            return True
+        try:
+            prontos, _, _ = select.select([self.connection], [], [], self.timeout_ocioso)
+        except (OSError, ValueError):
+            return False
+        return bool(prontos)
+
+    # Uma requisição: a conexão continua aberta se o cliente é HTTP/1.1, não pediu para fechar e o
+    # servidor não está encerrando
+    # O '100 Continue' de 'Expect: 100-continue' já sai no parse_request do http.server (protocolo HTTP/1.1)
+    def run_wsgi(self):
+        self.environ = environ = self.make_environ()
+        if 'wsgi.input_terminated' in environ:
+            corpo = environ['wsgi.input']
+        else:
+            try:
+                tamanho = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                tamanho = -1
+            if tamanho < 0:
+                self.close_connection = True
+                tamanho = 0
+            corpo = environ['wsgi.input'] = LimitedStream(self.rfile, tamanho)
+            environ['wsgi.input_terminated'] = True
+
+        servidor = self.server
+        if self.request_version != 'HTTP/1.1' or getattr(servidor, 'encerrando', False):
+            self.close_connection = True
+        status = cabecalhos = None
+        enviado = False
+        em_blocos = False
+        sem_corpo = False
+
+        def write(dados):
+            nonlocal enviado, em_blocos, sem_corpo
+            if not enviado:
+                enviado = True
+                codigo, _, mensagem = status.partition(' ')
+                codigo = int(codigo)
+                self.send_response(codigo, mensagem)
+                chaves = set()
+                for chave, valor in cabecalhos:
+                    self.send_header(chave, valor)
+                    chaves.add(chave.lower())
+                sem_corpo = environ['REQUEST_METHOD'] == 'HEAD' or 100 <= codigo < 200 or codigo in (204, 304)
+                if 'content-length' not in chaves and not sem_corpo:
+                    if self.request_version == 'HTTP/1.1':
+                        em_blocos = True
+                        self.send_header('Transfer-Encoding', 'chunked')
+                    else:
+                        self.close_connection = True  # sem tamanho, o fim do corpo é o fim da conexão
+                if isinstance(corpo, LimitedStream) and corpo.limit - corpo.tell() > self.drenagem_maxima:
+                    self.close_connection = True  # a rota deixou um corpo grande sem ler: não vale drenar
+                if self.close_connection:
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+            if dados and not sem_corpo:  # a resposta de um HEAD tem os cabeçalhos do GET, mas nunca corpo
+                if em_blocos:
+                    self.wfile.write(b'%x\r\n' % len(dados) + dados + b'\r\n')
+                else:
+                    self.wfile.write(dados)
+            self.wfile.flush()
+
+        def start_response(novo_status, novos_cabecalhos, exc_info=None):
+            nonlocal status, cabecalhos
+            if exc_info:
+                try:
+                    if enviado:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif cabecalhos is not None:
+                raise AssertionError('Cabeçalhos já definidos')
+            status, cabecalhos = novo_status, novos_cabecalhos
+            return write
+
+        def executar(app):
+            resposta = app(environ, start_response)
+            try:
+                for dados in resposta:
+                    write(dados)
+                if not enviado:
+                    write(b'')
+                if em_blocos:
+                    self.wfile.write(b'0\r\n\r\n')
+                    self.wfile.flush()
+            finally:
+                if hasattr(resposta, 'close'):
+                    resposta.close()
+
+        try:
+            executar(servidor.app)
+        except ERROS_CONEXAO as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+            return
+        except Exception:
+            self.close_connection = True
+            if servidor.passthrough_errors:
+                raise
+            if not enviado:
+                status = cabecalhos = None
+                try:
+                    executar(InternalServerError())
+                except Exception:
+                    pass
+            servidor.log('error', f'Erro na requisição:\n{traceback.format_exc()}')
+            return
+
+        if not self.close_connection:
+            self._drenar_corpo(corpo)
+
+    # Lê o que sobrou do corpo da requisição para a próxima começar no lugar certo
+    def _drenar_corpo(self, corpo):
+        lidos = 0
+        try:
+            while lidos <= self.drenagem_maxima:
+                dados = corpo.read(64 * 1024)
+                if not dados:
+                    return
+                lidos += len(dados)
+        except (OSError, ValueError):
+            pass
+        self.close_connection = True
+
+
+# Pool de threads + fila limitada de conexões na frente da aplicação WSGI
+class ServidorLimitado(BaseWSGIServer):
+    """Servidor WSGI com concorrência limitada e encerramento gradual"""
+
+    multithread = True
+
+    def __init__(self, host, porta, app, threads=32, tamanho_fila=64, timeout_cliente=60, timeout_ocioso=5):
+        # o timeout vale para cada leitura/escrita no socket: um cliente parado não prende a thread para sempre
+        tratador = type('TratadorLimitado', (TratadorKeepAlive,), {
+            'timeout': timeout_cliente or None,
+            'timeout_ocioso': timeout_ocioso
+        })
+        super().__init__(host, porta, app, handler=tratador)
+        # a fila recebe conexões novas (requisicao, endereco) e tratadores de conexões keep-alive com requisição
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.encerrando = False
+        self.lock = Lock()
+        self.ocupadas = 0
+        self.recusadas = 0
+        # conexões keep-alive entre requisições: {tratador: instante em que ela é fechada por ociosidade}
+        self.seletor = selectors.DefaultSelector()
+        self.lock_ociosas = Lock()
+        self.ociosas = {}
+        Thread(target=self._vigiar_ociosas, name=f'http_{porta}_ociosas', daemon=True).start()
+        self.trabalhadores = []
+        for i in range(threads):
+            trabalhador = Thread(target=self._trabalhar, name=f'http_{porta}_{i}', daemon=True)
+            trabalhador.start()
+            self.trabalhadores.append(trabalhador)
+
+    # Chamado pelo laço de accept: só enfileira (ou recusa), nunca bloqueia
+    def process_request(self, requisicao, endereco):
+        try:
+            self.fila.put_nowait((requisicao, endereco))
+        except queue.Full:
+            with self.lock:
+                self.recusadas += 1
+            self._recusar(requisicao)
+            self.shutdown_request(requisicao)
+
+    @staticmethod
+    def _recusar(requisicao):
+        corpo = json.dumps({'error': 'Servidor ocupado, tente de novo'}).encode()
+        cabecalho = (
+            'HTTP/1.1 503 Service Unavailable\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(corpo)}\r\n'
+            'Retry-After: 1\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode()
+        try:
+            requisicao.settimeout(1)
+            requisicao.sendall(cabecalho + corpo)
+            # descarta o que o cliente já mandou: fechar com dados não lidos vira RST e pode apagar o 503
+            requisicao.setblocking(False)
+            while requisicao.recv(65536):
+                pass
+        except OSError:
+            pass
+
+    def _trabalhar(self):
+        while True:
+            item = self.fila.get()
+            requisicao, endereco = item if isinstance(item, tuple) else (item.request, item.client_address)
+            with self.lock:
+                self.ocupadas += 1
+            try:
+                tratador = self.RequestHandlerClass.preparar(requisicao, endereco, self) if isinstance(item, tuple) else item
+                # a próxima requisição já no buffer é atendida na mesma thread
+                while tratador.atender() and not self.encerrando:
+                    if not tratador.pendente():
+                        self._estacionar(tratador)
+                        break
+                else:
+                    self._fechar(tratador)
+            except Exception:
+                self.handle_error(requisicao, endereco)
+                self.shutdown_request(requisicao)
+            finally:
+                with self.lock:
+                    self.ocupadas -= 1
+                self.fila.task_done()
+
+    # Conexão keep-alive depois da resposta: espera a próxima requisição no seletor, sem ocupar thread
+    def _estacionar(self, tratador):
+        with self.lock_ociosas:
+            self.ociosas[tratador] = time.monotonic() + tratador.timeout_ocioso
+            self.seletor.register(tratador.connection, selectors.EVENT_READ, tratador)
+
+    def _retirar(self, tratador):
+        with self.lock_ociosas:
+            if self.ociosas.pop(tratador, None) is None:
+                return False
+            self.seletor.unregister(tratador.connection)
+            return True
+
+    def _fechar(self, tratador):
+        try:
+            tratador.finish()
+        except OSError:
+            pass
+        self.shutdown_request(tratador.request)
+
+    # Devolve à fila as conexões ociosas que receberam uma requisição (ou fecharam, o tratador percebe)
+    # e fecha as que passaram do timeout ocioso ou todas no encerramento
+    def _vigiar_ociosas(self):
+        while True:
+            for chave, _ in self.seletor.select(timeout=0.25):
+                if self._retirar(chave.data):
+                    self._reenfileirar(chave.data)
+            agora = time.monotonic()
+            with self.lock_ociosas:
+                vencidas = [tratador for tratador, limite in self.ociosas.items() if limite <= agora or self.encerrando]
+            for tratador in vencidas:
+                if not self._retirar(tratador):
+                    continue
+                # uma requisição que chegou depois do select é atendida: fechar agora faria o cliente,
+                # que já a mandou, receber a conexão fechada sem resposta
+                if not self.encerrando and select.select([tratador.connection], [], [], 0)[0]:
+                    self._reenfileirar(tratador)
+                else:
+                    self._fechar(tratador)
+
+    # Volta uma conexão keep-alive com requisição para a fila sem nunca bloquear o vigia (é ele que
+    # expira as ociosas e as fecha no encerramento); com a fila cheia ela leva o mesmo 503 das conexões novas
+    def _reenfileirar(self, tratador):
+        try:
+            self.fila.put_nowait(tratador)
+        except queue.Full:
+            with self.lock:
+                self.recusadas += 1
+            self._recusar(tratador.request)
+            self._fechar(tratador)
+
+    # Para de aceitar conexões e espera as que já entraram (em andamento ou na fila) por até 'timeout' segundos
+    # Retorna quantas ainda não tinham terminado
+    def encerrar(self, timeout=30):
+        self.encerrando = True  # conexões keep-alive fecham depois da requisição atual
+        self.shutdown()  # serve_forever retorna e fecha o socket de escuta
+        limite = time.monotonic() + timeout
+        while self.fila.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.05)
+        return self.fila.unfinished_tasks
+
+    # Ocupação atual (JSON)
+    def estado(self):
+        with self.lock:
+            estado = {
+                'workers': len(self.trabalhadores),
+                'busy': self.ocupadas,
+                'queued': self.fila.qsize(),
+                'queue_limit': self.fila.maxsize,
+                'rejected': self.recusadas
+            }
+        with self.lock_ociosas:
+            estado['idle_connections'] = len(self.ociosas)
+        return estado
@@ -0,0 +1,63 @@
+# Os módulos do ShardBox ficam na raiz do projeto, um nível acima dos testes
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# Cria nodos num diretório temporário sem subir os servidores TCP e HTTP: as rotas são chamadas
+# pelo cliente de teste do Flask. A configuração vem das variáveis de ambiente, como num nodo de verdade
+@pytest.fixture
+def criar_nodo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PORTAS', '1,2,3')  # nunca abertas: os testes trocam o envio para outros nodos
+    monkeypatch.setenv('PORTAS_HTTP', '1,2,3')
+    monkeypatch.setenv('LOG_TERMINAL', '0')
+    nodos = []
+
+    def criar(id_nodo=1, **variaveis):
+        from node import Nodo
+        for nome, valor in variaveis.items():
+            monkeypatch.setenv(nome, str(valor))
+        nodo = Nodo(id_nodo)
+        nodos.append(nodo)
+        return nodo
+
+    yield criar
+    for nodo in nodos:
+        nodo.executor_replicas.shutdown(wait=True)
+        nodo._encerrar()
+        nodo.bd.fechar()
+        nodo.trava_diretorio.close()
+
+
+# Cria os backends distribuídos de um cluster no mesmo processo: 'chamar' vai direto ao shard do outro
+# nodo, com argumentos e resultado passando por JSON como na rota /metadata/<operacao>. Um nodo fora
+# de 'vivos' não responde
+@pytest.fixture(scope='session')
+def criar_shards():
+    from metadados import BackendDistribuido
+    criados = []
+
+    def criar(diretorio, ids_nodos, vivos=None, replicas=3):
+        vivos = set(ids_nodos) if vivos is None else vivos
+        backends = {}
+
+        def chamar(id_nodo, operacao, argumentos):
+            if id_nodo not in vivos:
+                raise ConnectionError(f'nodo {id_nodo} fora do ar')
+            resultado = backends[id_nodo].executar_local(operacao, json.loads(json.dumps(argumentos)))
+            return json.loads(json.dumps(resultado))
+
+        for id_nodo in ids_nodos:
+            backends[id_nodo] = BackendDistribuido(id_nodo, ids_nodos, Path(diretorio) / f'shard_{id_nodo}.sqlite3', chamar,
+                                                   lambda: sorted(vivos), replicas=replicas)
+        criados.extend(backends.values())
+        return backends
+
+    yield criar
+    for backend in criados:
+        backend.fechar()
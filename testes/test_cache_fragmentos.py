@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de fragmentos: admissão na segunda leitura, LRU dentro do limite de bytes
+e invalidação dos fragmentos de um arquivo removido
+"""
+
+from cache_fragmentos import CacheFragmentos
+
+
+# Uma leitura como a do nodo (_obter_fragmento_cacheado): consulta o cache e, na falta, "busca" o
+# fragmento e pergunta se ele entra. Retorna True se veio do cache
+def _ler(cache, chave, dados):
+    if cache.obter(chave) is not None:
+        return True
+    if cache.admitir(chave, len(dados)):
+        cache.guardar(chave, dados)
+    return False
+
+
+def test_primeira_leitura_falta_e_nao_guarda():
+    cache = CacheFragmentos(1000)
+    assert not _ler(cache, 'file_1_frag_0', b'x' * 100)
+    estatisticas = cache.estatisticas()
+    assert estatisticas['misses'] == 1 and estatisticas['items'] == 0 and estatisticas['used_bytes'] == 0
+
+
+def test_segunda_leitura_admite_e_a_terceira_acerta():
+    cache = CacheFragmentos(1000)
+    dados = b'x' * 100
+    assert not _ler(cache, 'file_1_frag_0', dados)
+    assert not _ler(cache, 'file_1_frag_0', dados)
+    assert cache.obter('file_1_frag_0') == dados
+    estatisticas = cache.estatisticas()
+    assert estatisticas['items'] == 1 and estatisticas['used_bytes'] == 100
+    assert estatisticas['hits'] == 1 and estatisticas['misses'] == 2
+
+
+def test_fragmento_maior_que_o_limite_por_item_nunca_entra():
+    cache = CacheFragmentos(1000)  # limite por item padrão: 1/8 do cache
+    for _ in range(3):
+        assert not _ler(cache, 'grande', b'x' * 126)
+    assert cache.estatisticas()['items'] == 0
+
+
+def test_lru_expulsa_o_menos_usado_dentro_do_limite_de_bytes():
+    cache = CacheFragmentos(1000, tamanho_maximo_item=400)
+    for chave in 'abc':
+        cache.guardar(chave, chave.encode() * 300)
+    assert cache.obter('a') is not None  # 'b' passa a ser o menos usado
+
+    cache.guardar('d', b'd' * 300)
+    assert cache.obter('b') is None
+    assert all(cache.obter(chave) is not None for chave in 'acd')
+    assert cache.estatisticas()['evictions'] == 1
+
+    # regravar um fragmento troca o tamanho sem contar duas vezes
+    cache.guardar('c', b'c' * 100)
+    cache.guardar('e', b'e' * 400)
+    estatisticas = cache.estatisticas()
+    assert estatisticas['used_bytes'] == sum(len(dados) for dados in cache.itens.values()) <= 1000
+    assert set(cache.itens) == {'c', 'd', 'e'}
+
+
+# O nodo invalida pelos nomes dos fragmentos do arquivo removido (os mesmos de _nome_fragmento)
+def test_invalidar_os_fragmentos_de_um_arquivo_tira_todos_eles():
+    cache = CacheFragmentos(10000)
+    do_arquivo = [f'file_7_frag_{i}' for i in range(4)]
+    outros = [f'file_8_frag_{i}' for i in range(2)]
+    for chave in do_arquivo + outros:
+        cache.guardar(chave, b'x' * 100)
+    cache.admitir('file_7_frag_4', 100)  # visto uma vez, ainda na lista fantasma
+
+    cache.invalidar(*do_arquivo, 'file_7_frag_4')
+
+    assert all(cache.obter(chave) is None for chave in do_arquivo)
+    assert all(cache.obter(chave) is not None for chave in outros)
+    assert cache.estatisticas()['used_bytes'] == 200
+    # a leitura seguinte do fragmento fantasma volta a ser a primeira
+    assert not cache.admitir('file_7_frag_4', 100)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Testes da deduplicação por chunks: o mesmo conteúdo enviado duas vezes fica uma vez só
+no disco, com uma referência por arquivo, e a coleta nunca apaga um chunk ainda referenciado
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from metadados import BackendJSON, BackendSQLite
+
+CONTEUDO = random.Random(9).randbytes(300 * 1024)
+
+
+# Nodo sozinho no cluster: todos os chunks ficam no disco dele, em arquivos avulsos
+@pytest.fixture(params=['sqlite', 'json'])
+def nodo(request, criar_nodo):
+    return criar_nodo(1, PORTAS='1', PORTAS_HTTP='1', BACKEND_METADADOS=request.param,
+                      ESTRATEGIA_FRAGMENTACAO='cdc', CDC_MINIMO=4096, CDC_MEDIO=16384, CDC_MAXIMO=65536,
+                      REPLICAS_FRAGMENTO=1, LIMITE_VOLUME=0)
+
+
+# Índice de chunks lido direto do arquivo do banco: {hash: {tamanho, refs, nodos}}
+def _indice(nodo):
+    if nodo.tipo_backend == 'json':
+        return json.loads(nodo.arquivo_bd.read_text()).get('chunks', {})
+    with sqlite3.connect(nodo.arquivo_bd_sqlite) as conexao:
+        linhas = conexao.execute('SELECT hash, tamanho, refs, nodos FROM chunks').fetchall()
+    return {h: {'tamanho': tamanho, 'refs': refs, 'nodos': json.loads(nodos)} for h, tamanho, refs, nodos in linhas}
+
+
+def _chunks_no_disco(nodo):
+    return {caminho.name[len('chunk_'):] for caminho in nodo.dir_arquivos.glob('chunk_*')}
+
+
+def _enviar(cliente, nome):
+    resposta = cliente.post(f'/upload?filename={nome}', data=CONTEUDO)
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()['id']
+
+
+def test_mesmo_conteudo_duas_vezes_guarda_cada_chunk_uma_vez(nodo):
+    cliente = nodo.app.test_client()
+    primeiro = _enviar(cliente, 'a.bin')
+    segundo = _enviar(cliente, 'b.bin')
+
+    hashes = [frag['hash'] for frag in nodo.bd.obter_arquivo(primeiro)['fragmentos']]
+    assert len(hashes) > 3 and len(set(hashes)) == len(hashes)
+    assert [frag['hash'] for frag in nodo.bd.obter_arquivo(segundo)['fragmentos']] == hashes
+
+    indice = _indice(nodo)
+    assert set(indice) == set(hashes) == _chunks_no_disco(nodo)
+    assert all(indice[h]['refs'] == 2 and indice[h]['nodos'] == [1] for h in hashes)
+    # o espaço do nodo conta cada chunk uma vez só
+    assert nodo.bd.armazenamento_nodos()[1] == len(CONTEUDO)
+    assert cliente.get(f'/download/{segundo}').data == CONTEUDO
+
+
+def test_apagar_uma_copia_mantem_os_chunks(nodo):
+    cliente = nodo.app.test_client()
+    primeiro = _enviar(cliente, 'a.bin')
+    segundo = _enviar(cliente, 'b.bin')
+    hashes = set(_indice(nodo))
+
+    resposta = cliente.delete(f'/delete/{primeiro}')
+    assert resposta.get_json()['unreferenced_fragments'] == 0
+
+    indice = _indice(nodo)
+    assert set(indice) == hashes == _chunks_no_disco(nodo)
+    assert all(chunk['refs'] == 1 for chunk in indice.values())
+    assert nodo.bd.armazenamento_nodos()[1] == len(CONTEUDO)
+    assert cliente.get(f'/download/{segundo}').data == CONTEUDO
+
+
+def test_apagar_as_duas_copias_coleta_os_chunks(nodo):
+    cliente = nodo.app.test_client()
+    primeiro = _enviar(cliente, 'a.bin')
+    segundo = _enviar(cliente, 'b.bin')
+    hashes = set(_indice(nodo))
+
+    cliente.delete(f'/delete/{primeiro}')
+    resposta = cliente.delete(f'/delete/{segundo}').get_json()
+    assert resposta['unreferenced_fragments'] == resposta['deleted_fragments'] == len(hashes)
+
+    assert _indice(nodo) == {} and _chunks_no_disco(nodo) == set()
+    assert nodo.bd.armazenamento_nodos()[1] == 0
+    # sem referência, o mesmo conteúdo volta a ser gravado como chunk novo
+    terceiro = _enviar(cliente, 'c.bin')
+    assert _chunks_no_disco(nodo) == hashes
+    assert cliente.get(f'/download/{terceiro}').data == CONTEUDO
+
+
+# Corrida entre uploads e remoções do mesmo chunk, no fluxo do nodo: reserva, grava o que o índice não tem,
+# salva o arquivo e devolve a reserva; a remoção coleta o chunk sem referência em cada nodo
+@pytest.mark.parametrize('tipo', ['sqlite', 'json'])
+def test_reserva_concorrente_com_a_coleta_nao_perde_chunk_referenciado(tmp_path, tipo):
+    if tipo == 'json':
+        bd = BackendJSON(tmp_path / 'files_db.json', [1, 2])
+    else:
+        bd = BackendSQLite(tmp_path / 'files_db.sqlite3', [1, 2])
+    hash_chunk = 'ab' * 32
+    disco = set()  # (hash, id_nodo) dos chunks gravados
+    lock_disco = threading.Lock()
+    perdidos = []
+
+    def apagar(id_nodo):
+        with lock_disco:
+            disco.discard((hash_chunk, id_nodo))
+        return True
+
+    def coletar(sem_uso):
+        for frag in sem_uso:
+            time.sleep(0.001)  # a ida até o nodo (/delete_fragment): outros uploads reservam o chunk nesse meio-tempo
+            bd.coletar_chunk(frag['hash'], frag['id_nodo'], lambda id_nodo=frag['id_nodo']: apagar(id_nodo))
+
+    def cliente(numero):
+        for rodada in range(50):
+            id_arquivo = numero * 1000 + rodada
+            id_nodo = 1 + (numero + rodada) % 2
+            nodos = bd.reservar_chunks({hash_chunk: 10}).get(hash_chunk)
+            if not nodos:
+                with lock_disco:
+                    disco.add((hash_chunk, id_nodo))
+                nodos = [id_nodo]
+            bd.salvar_arquivo(id_arquivo, {'nome': f'{id_arquivo}.bin', 'tamanho': 10, 'fragmentos': [
+                {'id_nodo': n, 'id_fragmento': 0, 'tamanho': 10, 'hash': hash_chunk} for n in nodos
+            ]})
+            coletar(bd.liberar_chunks([hash_chunk]))
+            # enquanto o arquivo existe, o chunk está no disco em todos os nodos que o índice aponta
+            with lock_disco:
+                perdidos.extend((hash_chunk, n) for n in nodos if (hash_chunk, n) not in disco)
+            coletar(bd.remover_arquivo(id_arquivo))
+
+    threads = [threading.Thread(target=cliente, args=(numero,)) for numero in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert perdidos == []
+    # no fim ninguém usa o chunk e ele sai do índice (a cópia que uma reserva impediu de coletar
+    # depois da marca pode sobrar no disco: é a limitação dos chunks órfãos descrita no README)
+    assert bd.obter_chunks([hash_chunk]) == {}
+    bd.fechar()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Testes dos checksums dos fragmentos: calculados na mesma passada que já lê os bytes
+(staging do upload, busca de cortes do cdc, gravação do fragmento comprimido)
+"""
+
+import hashlib
+import io
+import random
+from itertools import repeat
+
+import pytest
+
+import node
+from integridade import ChecksumsFaixas
+
+CONTEUDO = random.Random(5).randbytes(150 * 1024) + b'texto repetido ' * 20000
+
+
+def _sha256(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+
+@pytest.mark.parametrize('tamanho_bloco', [1, 7, 4096, 10 ** 6])
+def test_checksums_faixas_iguais_aos_de_cada_pedaco(tamanho_bloco):
+    dados = CONTEUDO[:50000]
+    blocos = [dados[i:i + tamanho_bloco] for i in range(0, len(dados), tamanho_bloco)]
+
+    fixas = ChecksumsFaixas(repeat(10000))
+    assert b''.join(fixas.passar(blocos)) == dados
+    assert fixas.checksums() == [_sha256(dados[i:i + 10000]) for i in range(0, len(dados), 10000)]
+
+    ate_o_fim = ChecksumsFaixas([12000, 12000, 12000, None])
+    list(ate_o_fim.passar(blocos))
+    assert ate_o_fim.checksums() == [_sha256(dados[:12000]), _sha256(dados[12000:24000]),
+                                     _sha256(dados[24000:36000]), _sha256(dados[36000:])]
+
+
+def test_checksums_faixas_de_stream_vazio():
+    vazio = ChecksumsFaixas(repeat(10))
+    assert list(vazio.passar([])) == []
+    assert vazio.checksums() == [_sha256(b'')]
+
+
+# Nodo sozinho no cluster: a gravação local confere cada fragmento com o checksum calculado, então um
+# checksum errado faz o upload falhar. 'releituras' conta os checksums calculados relendo o staging
+@pytest.fixture
+def upload(criar_nodo, monkeypatch):
+    def enviar(modo, **variaveis):
+        nodo = criar_nodo(1, PORTAS='1', PORTAS_HTTP='1', LIMITE_VOLUME=0, **variaveis)
+        releituras = []
+        checksum_blocos = node.checksum_blocos
+        monkeypatch.setattr(node, 'checksum_blocos', lambda blocos: (releituras.append(1), checksum_blocos(blocos))[1])
+        cliente = nodo.app.test_client()
+        if modo == 'multipart':
+            resposta = cliente.post('/upload', data={'file': (io.BytesIO(CONTEUDO), 'a.bin')})
+        elif modo == 'chunked':
+            resposta = cliente.post('/upload?filename=a.bin', input_stream=io.BytesIO(CONTEUDO),
+                                    headers={'Transfer-Encoding': 'chunked'}, environ_overrides={'wsgi.input_terminated': True})
+        else:
+            resposta = cliente.post('/upload?filename=a.bin', data=CONTEUDO)
+        assert resposta.status_code == 200, resposta.get_json()
+        fragmentos = nodo.bd.obter_arquivo(resposta.get_json()['id'])['fragmentos']
+        assert cliente.get(f'/download/{resposta.get_json()["id"]}').data == CONTEUDO
+        return fragmentos, len(releituras)
+    return enviar
+
+
+@pytest.mark.parametrize('modo', ['cru', 'multipart', 'chunked'])
+@pytest.mark.parametrize('estrategia', ['adaptativa', 'fixa'])
+def test_checksums_saem_do_staging(upload, estrategia, modo):
+    fragmentos, releituras = upload(modo, ESTRATEGIA_FRAGMENTACAO=estrategia, TAMANHO_FRAGMENTO=64 * 1024)
+    inicio = 0
+    for frag in sorted(fragmentos, key=lambda frag: frag['id_fragmento']):
+        assert frag['checksum'] == _sha256(CONTEUDO[inicio:inicio + frag['tamanho']])
+        inicio += frag['tamanho']
+    assert inicio == len(CONTEUDO)
+    # só a adaptativa em chunked não sabe o tamanho (e a divisão) antes de receber o arquivo
+    assert releituras == (len(fragmentos) if (estrategia, modo) == ('adaptativa', 'chunked') else 0)
+
+
+def test_hash_dos_chunks_sai_da_busca_de_cortes(upload):
+    fragmentos, releituras = upload('cru', ESTRATEGIA_FRAGMENTACAO='cdc', REPLICAS_FRAGMENTO=1,
+                                    CDC_MINIMO=4096, CDC_MEDIO=16384, CDC_MAXIMO=65536)
+    inicio = 0
+    for frag in sorted(fragmentos, key=lambda frag: frag['id_fragmento']):
+        assert frag['hash'] == _sha256(CONTEUDO[inicio:inicio + frag['tamanho']])
+        inicio += frag['tamanho']
+    assert releituras == 0
+
+
+def test_checksum_do_comprimido_sai_da_gravacao(upload):
+    fragmentos, releituras = upload('cru', ESTRATEGIA_FRAGMENTACAO='fixa', TAMANHO_FRAGMENTO=64 * 1024,
+                                    COMPRESSAO=1, COMPRESSAO_CODECS='zlib:1')
+    assert {frag.get('codec') for frag in fragmentos} == {None, 'zlib'}  # o começo aleatório fica cru
+    assert releituras == 0
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Testes da listagem paginada: os backends JSON, SQLite e distribuído devolvem as mesmas páginas
+(cursor, filtro por prefixo, ordem e empates na chave de ordenação)
+"""
+
+import pytest
+
+from metadados import ORDENS_LISTAGEM, BackendJSON, BackendSQLite
+
+# Nomes e tamanhos repetidos de propósito: o desempate é sempre pelo ID
+ARQUIVOS = [
+    ('relatorio.pdf', 300), ('foto.jpg', 100), ('relatorio.pdf', 100), ('rel.txt', 50),
+    ('Zebra.txt', 300), ('ação.txt', 7), ('relatório.pdf', 300), ('foto.jpg', 100),
+    ('r', 0), ('rel_2024%.txt', 50), ('relatorio.pdf', 300), ('b.bin', 100),
+]
+
+
+# O distribuído tem 4 nodos com 3 donos por arquivo: cada página junta as páginas de todos os shards
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory, criar_shards):
+    diretorio = tmp_path_factory.mktemp('listagem')
+    json_ = BackendJSON(diretorio / 'files_db.json', [1, 2])
+    sqlite = BackendSQLite(diretorio / 'files_db.sqlite3', [1, 2])
+    distribuido = criar_shards(diretorio, [1, 2, 3, 4])[1]
+    for backend in (json_, sqlite, distribuido):
+        for id_arquivo, (nome, tamanho) in enumerate(ARQUIVOS, start=1):
+            backend.salvar_arquivo(id_arquivo, {'nome': nome, 'tamanho': tamanho, 'fragmentos': []})
+    yield json_, sqlite, distribuido
+    sqlite.fechar()
+
+
+# Percorre a listagem página a página, como a rota /list faz com o cursor
+def _paginas(backend, ordem, decrescente, prefixo, limite):
+    paginas = []
+    apos = None
+    while True:
+        pagina = [tuple(linha) for linha in backend.listar_arquivos(ordem, decrescente, prefixo, apos, limite)]
+        paginas.append(pagina)
+        if len(pagina) < limite:
+            return paginas
+        apos = (pagina[-1][ORDENS_LISTAGEM[ordem]], pagina[-1][0])
+
+
+def _esperado(ordem, decrescente, prefixo):
+    posicao = ORDENS_LISTAGEM[ordem]
+    linhas = [(id_arquivo, nome, tamanho) for id_arquivo, (nome, tamanho) in enumerate(ARQUIVOS, start=1)
+              if nome.startswith(prefixo)]
+    return sorted(linhas, key=lambda linha: (linha[posicao], linha[0]), reverse=decrescente)
+
+
+@pytest.mark.parametrize('ordem', list(ORDENS_LISTAGEM))
+@pytest.mark.parametrize('decrescente', [False, True])
+@pytest.mark.parametrize('prefixo', ['', 'rel', 'relatorio.pdf', 'foto', 'ação', 'nada'])
+@pytest.mark.parametrize('limite', [1, 2, 3, 5, 100])
+def test_backends_devolvem_as_mesmas_paginas(backends, ordem, decrescente, prefixo, limite):
+    json_, sqlite, distribuido = backends
+    paginas = _paginas(json_, ordem, decrescente, prefixo, limite)
+    assert paginas == _paginas(sqlite, ordem, decrescente, prefixo, limite)
+    assert paginas == _paginas(distribuido, ordem, decrescente, prefixo, limite)
+    assert [linha for pagina in paginas for linha in pagina] == _esperado(ordem, decrescente, prefixo)
+
+
+@pytest.mark.parametrize('ordem', list(ORDENS_LISTAGEM))
+def test_empates_na_chave_seguem_o_id(backends, ordem):
+    for backend in backends:
+        linhas = backend.listar_arquivos(ordem)
+        posicao = ORDENS_LISTAGEM[ordem]
+        chaves = [(linha[posicao], linha[0]) for linha in linhas]
+        assert chaves == sorted(chaves)
+
+
+@pytest.mark.parametrize('backend', [0, 1], ids=['json', 'sqlite'])
+def test_ultima_pagina_vazia(backends, backend):
+    backend = backends[backend]
+    # 12 arquivos em páginas de 4: a quarta consulta não tem mais nada
+    paginas = _paginas(backend, 'nome', False, '', 4)
+    assert [len(pagina) for pagina in paginas] == [4, 4, 4, 0]
+
+    ultima = backend.listar_arquivos('tamanho', True, '', (0, 9), 10)
+    assert ultima == []
+
+
+def test_cursor_no_meio_de_um_empate(backends):
+    # cursor no primeiro 'relatorio.pdf' (ID 1): os outros dois com o mesmo nome vêm em seguida
+    for backend in backends:
+        linhas = [tuple(linha) for linha in backend.listar_arquivos('nome', False, 'relatorio', ('relatorio.pdf', 1), 10)]
+        assert linhas == [(3, 'relatorio.pdf', 100), (11, 'relatorio.pdf', 300)]
+        linhas = [tuple(linha) for linha in backend.listar_arquivos('tamanho', True, '', (300, 7), 2)]
+        assert linhas == [(5, 'Zebra.txt', 300), (1, 'relatorio.pdf', 300)]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Testes dos metadados distribuídos: donos estáveis no anel de hashing consistente quando
+um nodo entra, e anti-entropia (sincronizar) de um shard que perdeu escritas
+"""
+
+import time
+
+import pytest
+
+from anel import AnelConsistente
+
+CHAVES = range(1, 5001)
+
+
+def test_anel_e_o_mesmo_em_todos_os_nodos():
+    primeiro, segundo = AnelConsistente([1, 2, 3, 4]), AnelConsistente([4, 3, 2, 1])
+    assert all(primeiro.donos(chave, 3) == segundo.donos(chave, 3) for chave in CHAVES)
+
+
+# O nodo novo só entra na lista de donos: os outros mantêm a ordem e ninguém mais troca de lugar
+@pytest.mark.parametrize('replicas', [1, 2, 3])
+def test_nodo_novo_nao_embaralha_os_donos(replicas):
+    antes, depois = AnelConsistente([1, 2, 3, 4]), AnelConsistente([1, 2, 3, 4, 5])
+    mudaram = 0
+    for chave in CHAVES:
+        antigos, novos = antes.donos(chave, replicas), depois.donos(chave, replicas)
+        assert len(novos) == replicas and len(set(novos)) == replicas
+        if 5 in novos:
+            mudaram += 1
+            assert [d for d in novos if d != 5] == antigos[:replicas - 1]
+        else:
+            assert novos == antigos
+    # cada nodo fica com ~1/5 dos pontos do anel: a fração de chaves que ganha o nodo novo fica perto de replicas/5
+    assert abs(mudaram / len(CHAVES) - replicas / 5) < 0.1
+
+
+# 3 nodos, 3 donos por arquivo e quorum de 2: com o nodo 3 fora do ar as escritas valem só nos nodos 1 e 2
+def test_sincronizar_repara_o_shard_que_perdeu_escritas(tmp_path, criar_shards):
+    vivos = {1, 2, 3}
+    shards = criar_shards(tmp_path, [1, 2, 3], vivos)
+    removido = {'nome': 'velho.txt', 'tamanho': 10, 'fragmentos': []}
+    novo = {'nome': 'novo.txt', 'tamanho': 20, 'fragmentos': [{'id_nodo': 1, 'id_fragmento': 0, 'tamanho': 20}]}
+    shards[1].salvar_arquivo(8, removido)
+    shards[1].salvar_arquivo(9, dict(removido, nome='fica.txt'))
+    # a escrita volta com o quorum; a do terceiro dono termina em segundo plano
+    local = shards[3].local
+    prazo = time.monotonic() + 5
+    while len(local.listar_arquivos()) < 2 and time.monotonic() < prazo:
+        time.sleep(0.01)
+
+    vivos.discard(3)
+    shards[1].salvar_arquivo(7, novo)
+    shards[2].remover_arquivo(8)
+    vivos.add(3)
+
+    assert local.obter_arquivo(7) is None and local.obter_arquivo(8) is not None
+    # a leitura pelo nodo 3 já acha o arquivo novo nos outros donos
+    assert shards[3].obter_arquivo(7)['nome'] == 'novo.txt'
+
+    # a remoção acabou de acontecer: com a idade mínima padrão o arquivo ainda pode estar a caminho
+    assert shards[3].sincronizar() == (1, 0)
+    assert shards[3].sincronizar(idade_minima=0) == (0, 1)
+    assert shards[3].sincronizar(idade_minima=0) == (0, 0)
+
+    assert local.obter_arquivo(7)['fragmentos'] == novo['fragmentos']
+    assert local.obter_arquivo(8) is None and local.obter_arquivo(9)['nome'] == 'fica.txt'
+    assert [linha[0] for linha in shards[3].listar_arquivos()] == [7, 9]
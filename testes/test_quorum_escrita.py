@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Testes do quorum de escrita no upload: a resposta sai com QUORUM_ESCRITA réplicas confirmadas
+por fragmento e, sem quorum, todas as réplicas gravadas são apagadas dos nodos
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import pytest
+
+CONTEUDO = random.Random(7).randbytes(200 * 1024)
+
+
+# Nodo 1 de um cluster de 4 que só coordena: ele fica fora da escolha e as 3 réplicas de cada
+# fragmento vão para os nodos 2, 3 e 4, cujo envio é trocado por 'aceitar(id_nodo)'
+def _preparar(criar_nodo, monkeypatch, quorum, aceitar):
+    nodo = criar_nodo(1, PORTAS='1,2,3,4', PORTAS_HTTP='1,2,3,4', QUORUM_ESCRITA=quorum, REPLICAS_FRAGMENTO=3,
+                      ESTRATEGIA_FRAGMENTACAO='fixa', TAMANHO_FRAGMENTO=64 * 1024, COMPRESSAO=0)
+    nodo.posicionador.marcar_mortos([1])
+    gravadas = set()  # (id_nodo, nome do fragmento) confirmadas pelo nodo
+    apagadas = set()  # (id_nodo, nome do fragmento) que receberam /delete_fragment
+    lock = threading.Lock()
+
+    def enviar(id_nodo, nome_fragmento, blocos, hash_chunk=None, checksum=None):
+        b''.join(blocos())
+        if not aceitar(id_nodo):
+            return False
+        with lock:
+            gravadas.add((id_nodo, nome_fragmento))
+        return True
+
+    def apagar(url, **_):
+        partes = urlsplit(url)
+        assert partes.path.startswith('/delete_fragment/')
+        with lock:
+            apagadas.add((partes.port, partes.path[len('/delete_fragment/'):]))
+        return SimpleNamespace(status_code=200)
+
+    monkeypatch.setattr(nodo, '_enviar_fragmento_para_nodo', enviar)
+    monkeypatch.setattr(nodo.sessao_http, 'delete', apagar)
+    monkeypatch.setattr(nodo.sessao_http, 'post', lambda *args, **kwargs: SimpleNamespace(status_code=200))
+    return nodo, gravadas, apagadas
+
+
+def _locais_por_fragmento(localizacoes):
+    locais = {}
+    for local in localizacoes:
+        locais.setdefault(local['id_fragmento'], set()).add(local['id_nodo'])
+    return locais
+
+
+# 'aceitos' dos 3 nodos confirmam a gravação; QUORUM_ESCRITA=0 exige todas as réplicas
+@pytest.mark.parametrize('quorum', [1, 2, 3, 0])
+@pytest.mark.parametrize('aceitos', [0, 1, 2, 3])
+def test_upload_sai_exatamente_com_o_quorum(criar_nodo, monkeypatch, quorum, aceitos):
+    confirmam = {2, 3, 4} if aceitos == 3 else set(range(2, 2 + aceitos))
+    nodo, gravadas, apagadas = _preparar(criar_nodo, monkeypatch, quorum, lambda id_nodo: id_nodo in confirmam)
+
+    resposta = nodo.app.test_client().post('/upload?filename=a.bin', data=CONTEUDO)
+    nodo.executor_replicas.shutdown(wait=True)
+
+    if aceitos >= (quorum or 3):
+        assert resposta.status_code == 200
+        localizacoes = nodo.bd.obter_arquivo(resposta.get_json()['id'])['fragmentos']
+        locais = _locais_por_fragmento(localizacoes)
+        assert len(locais) == 4
+        # as confirmadas estão todas no banco (as recusadas só entram se ainda estavam em andamento)
+        assert all(confirmam <= nodos for nodos in locais.values())
+        assert apagadas == set()
+    else:
+        assert resposta.status_code == 500
+        assert nodo.bd.listar_arquivos() == []
+        assert apagadas == gravadas
+
+
+# Sem quorum, a réplica que ainda estava sendo gravada também é esperada e apagada
+def test_sem_quorum_apaga_tambem_a_replica_que_terminou_depois(criar_nodo, monkeypatch):
+    def aceitar(id_nodo):
+        if id_nodo == 3:
+            time.sleep(0.2)
+        return id_nodo != 4
+
+    nodo, gravadas, apagadas = _preparar(criar_nodo, monkeypatch, 3, aceitar)
+
+    resposta = nodo.app.test_client().post('/upload?filename=a.bin', data=CONTEUDO)
+    assert resposta.status_code == 500
+    nodo.executor_replicas.shutdown(wait=True)
+
+    assert {id_nodo for id_nodo, _ in gravadas} == {2, 3}
+    assert apagadas == gravadas
+    assert nodo.bd.listar_arquivos() == []
+    assert sum(nodo.bd.armazenamento_nodos().values()) == 0
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Testes do código de apagamento: qualquer perda de até m shards de uma faixa é recuperável
+"""
+
+import random
+from itertools import combinations
+
+import pytest
+
+from reed_solomon import ReedSolomon
+
+
+# Divide 'dados' em k shards de tamanho_shard (o último completado com zeros) e calcula a paridade
+def _faixa(codificador, dados):
+    tamanho_shard = -(-len(dados) // codificador.k)
+    shards_dados = [dados[i * tamanho_shard:(i + 1) * tamanho_shard] for i in range(codificador.k)]
+    paridade = codificador.codificar(shards_dados, tamanho_shard)
+    return dict(enumerate(shards_dados + paridade)), tamanho_shard
+
+
+@pytest.mark.parametrize('k, m', [(1, 1), (2, 1), (4, 2), (3, 3), (6, 3)])
+@pytest.mark.parametrize('tamanho', [1, 1000, 4099])
+def test_recupera_qualquer_perda_de_ate_m_shards(k, m, tamanho):
+    codificador = ReedSolomon(k, m)
+    dados = random.Random(f'{k}-{m}-{tamanho}').randbytes(tamanho)
+    shards, tamanho_shard = _faixa(codificador, dados)
+
+    for perdidos in range(m + 1):
+        for apagados in combinations(range(k + m), perdidos):
+            restantes = {i: shard for i, shard in shards.items() if i not in apagados}
+            recuperados = codificador.decodificar(restantes, tamanho_shard)
+            assert b''.join(recuperados)[:tamanho] == dados, f'falhou sem os shards {apagados}'
+
+
+def test_paridade_reconstroi_os_shards_perdidos():
+    codificador = ReedSolomon(4, 2)
+    dados = random.Random(42).randbytes(4096)
+    shards, tamanho_shard = _faixa(codificador, dados)
+
+    restantes = {i: shards[i] for i in (0, 3, 4, 5)}
+    recuperados = codificador.decodificar(restantes, tamanho_shard)
+    assert codificador.codificar(recuperados, tamanho_shard) == [shards[4], shards[5]]
+
+
+@pytest.mark.parametrize('k, m', [(2, 1), (4, 2), (6, 3)])
+def test_perda_de_mais_de_m_shards_da_erro(k, m):
+    codificador = ReedSolomon(k, m)
+    shards, tamanho_shard = _faixa(codificador, random.Random(7).randbytes(1000))
+
+    for apagados in combinations(range(k + m), m + 1):
+        restantes = {i: shard for i, shard in shards.items() if i not in apagados}
+        with pytest.raises(ValueError, match='São necessários'):
+            codificador.decodificar(restantes, tamanho_shard)
+
+
+def test_parametros_invalidos():
+    for k, m in [(0, 2), (2, -1), (200, 57)]:
+        with pytest.raises(ValueError):
+            ReedSolomon(k, m)
+    with pytest.raises(ValueError, match='Esperados 3'):
+        ReedSolomon(3, 1).codificar([b'a', b'b'], 1)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Testes do servidor HTTP limitado com keep-alive: pipelining, drenagem do corpo não lido,
+100-continue, resposta chunked, HEAD e o 503 com a fila cheia
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from servidor_http import ServidorLimitado
+
+LIBERAR = threading.Event()
+
+
+# Aplicação WSGI mínima: cada caminho exercita um jeito de ler o corpo ou de responder
+def _aplicacao(ambiente, iniciar_resposta):
+    caminho = ambiente['PATH_INFO']
+    if caminho == '/eco':
+        corpo = ambiente['wsgi.input'].read()
+        iniciar_resposta('200 OK', [('Content-Length', str(len(corpo)))])
+        return [corpo]
+    if caminho == '/ignora':  # não lê o corpo
+        iniciar_resposta('200 OK', [('Content-Length', '2')])
+        return [b'ok']
+    if caminho == '/stream':  # sem Content-Length: vai em chunked
+        iniciar_resposta('200 OK', [('Content-Type', 'text/plain')])
+        return (parte for parte in (b'um-', b'dois-', b'tres'))
+    if caminho == '/lento':
+        LIBERAR.wait(10)
+        iniciar_resposta('200 OK', [('Content-Length', '5')])
+        return [b'lento']
+    corpo = b'ola mundo'
+    iniciar_resposta('200 OK', [('Content-Length', str(len(corpo)))])
+    return [corpo]
+
+
+def _iniciar(**opcoes):
+    servidor = ServidorLimitado('127.0.0.1', 0, _aplicacao, **opcoes)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    return servidor
+
+
+@pytest.fixture
+def servidor():
+    LIBERAR.clear()
+    servidor = _iniciar(threads=4, tamanho_fila=8, timeout_cliente=5, timeout_ocioso=5)
+    yield servidor
+    LIBERAR.set()
+    servidor.encerrar(2)
+
+
+def _conectar(servidor):
+    conexao = socket.create_connection(servidor.server_address[:2], timeout=5)
+    return conexao, conexao.makefile('rb')
+
+
+# Lê uma resposta do stream: (status, {cabeçalho em minúsculas: valor}, corpo)
+def _ler_resposta(arquivo, head=False):
+    linha = arquivo.readline()
+    if not linha:
+        raise ConnectionError('conexão fechada')
+    status = int(linha.split()[1])
+    cabecalhos = {}
+    while (linha := arquivo.readline()) not in (b'\r\n', b''):
+        nome, valor = linha.decode().split(':', 1)
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    if head or status in (100, 204, 304):
+        return status, cabecalhos, b''
+    if cabecalhos.get('transfer-encoding') == 'chunked':
+        corpo = b''
+        while (tamanho := int(arquivo.readline().strip(), 16)):
+            corpo += arquivo.read(tamanho)
+            arquivo.readline()
+        arquivo.readline()
+        return status, cabecalhos, corpo
+    return status, cabecalhos, arquivo.read(int(cabecalhos.get('content-length', 0)))
+
+
+def _requisicao(metodo, caminho, corpo=b'', extra=''):
+    return (f'{metodo} {caminho} HTTP/1.1\r\nHost: teste\r\nContent-Length: {len(corpo)}\r\n{extra}\r\n').encode() + corpo
+
+
+def test_duas_requisicoes_em_pipeline_no_mesmo_socket(servidor):
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(_requisicao('POST', '/eco', b'primeira') + _requisicao('POST', '/eco', b'segunda'))
+    assert _ler_resposta(arquivo)[::2] == (200, b'primeira')
+    assert _ler_resposta(arquivo)[::2] == (200, b'segunda')
+    conexao.close()
+
+
+def test_corpo_nao_lido_pequeno_e_drenado(servidor):
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(_requisicao('POST', '/ignora', b'x' * 1000))
+    status, cabecalhos, corpo = _ler_resposta(arquivo)
+    assert (status, corpo) == (200, b'ok')
+    assert cabecalhos.get('connection') != 'close'
+    conexao.sendall(_requisicao('GET', '/'))
+    assert _ler_resposta(arquivo)[::2] == (200, b'ola mundo')
+    conexao.close()
+
+
+def test_corpo_nao_lido_grande_fecha_a_conexao(servidor):
+    servidor.RequestHandlerClass.drenagem_maxima = 1024
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(_requisicao('POST', '/ignora', b'x' * 64 * 1024))
+    status, cabecalhos, corpo = _ler_resposta(arquivo)
+    assert (status, corpo) == (200, b'ok')
+    assert cabecalhos['connection'] == 'close'
+    try:
+        assert arquivo.read() == b''
+    except ConnectionResetError:
+        pass  # fechar com corpo não lido pode virar RST
+    conexao.close()
+
+
+def test_expect_100_continue(servidor):
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(_requisicao('POST', '/eco', extra='Expect: 100-continue\r\n').replace(b'Content-Length: 0', b'Content-Length: 5'))
+    assert _ler_resposta(arquivo)[0] == 100
+    conexao.sendall(b'dados')
+    assert _ler_resposta(arquivo)[::2] == (200, b'dados')
+    conexao.close()
+
+
+def test_resposta_chunked_sem_content_length(servidor):
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(_requisicao('GET', '/stream'))
+    status, cabecalhos, corpo = _ler_resposta(arquivo)
+    assert (status, corpo) == (200, b'um-dois-tres')
+    assert cabecalhos['transfer-encoding'] == 'chunked' and 'content-length' not in cabecalhos
+    conexao.sendall(_requisicao('GET', '/'))  # a conexão continua utilizável
+    assert _ler_resposta(arquivo)[::2] == (200, b'ola mundo')
+    conexao.close()
+
+
+def test_head_nao_manda_corpo(servidor):
+    conexao, arquivo = _conectar(servidor)
+    for caminho in ('/', '/stream'):
+        conexao.sendall(_requisicao('HEAD', caminho))
+        assert _ler_resposta(arquivo, head=True)[0] == 200
+    # se algum corpo tivesse saído, ele apareceria no lugar da linha de status desta resposta
+    conexao.sendall(_requisicao('GET', '/'))
+    assert _ler_resposta(arquivo)[::2] == (200, b'ola mundo')
+    conexao.close()
+
+
+def test_http_1_0_fecha_a_conexao(servidor):
+    conexao, arquivo = _conectar(servidor)
+    conexao.sendall(b'GET / HTTP/1.0\r\n\r\n')
+    status, cabecalhos, corpo = _ler_resposta(arquivo)
+    assert (status, corpo, cabecalhos['connection']) == (200, b'ola mundo', 'close')
+    assert arquivo.read() == b''
+    conexao.close()
+
+
+# Espera até a condição valer (o servidor trabalha em outras threads)
+def _aguardar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, 'condição não atingida'
+        time.sleep(0.01)
+
+
+def test_fila_cheia_responde_503_com_retry_after():
+    LIBERAR.clear()
+    servidor = _iniciar(threads=1, tamanho_fila=1, timeout_cliente=5, timeout_ocioso=5)
+    conexoes = []
+    try:
+        # uma conexão keep-alive atendida e estacionada no seletor
+        ociosa, arquivo_ociosa = _conectar(servidor)
+        ociosa.sendall(_requisicao('GET', '/'))
+        assert _ler_resposta(arquivo_ociosa)[0] == 200
+        _aguardar(lambda: servidor.estado()['idle_connections'] == 1)
+
+        # a única thread presa numa requisição lenta (já fora da fila) e a fila ocupada por outra conexão
+        for chave in ('busy', 'queued'):
+            conexao, arquivo = _conectar(servidor)
+            conexao.sendall(_requisicao('GET', '/lento'))
+            conexoes.append((conexao, arquivo))
+            _aguardar(lambda: servidor.estado()[chave] == 1)
+
+        # conexão nova: recusada pelo laço de accept
+        recusada, arquivo = _conectar(servidor)
+        recusada.sendall(_requisicao('GET', '/'))
+        status, cabecalhos, _ = _ler_resposta(arquivo)
+        assert (status, cabecalhos['retry-after'], cabecalhos['connection']) == (503, '1', 'close')
+        recusada.close()
+
+        # requisição numa conexão keep-alive estacionada: o vigia não bloqueia na fila cheia, responde 503
+        ociosa.sendall(_requisicao('GET', '/'))
+        status, cabecalhos, _ = _ler_resposta(arquivo_ociosa)
+        assert (status, cabecalhos['retry-after']) == (503, '1')
+        assert servidor.estado()['rejected'] == 2
+        assert servidor.estado()['idle_connections'] == 0
+
+        LIBERAR.set()
+        for conexao, arquivo in conexoes:
+            assert _ler_resposta(arquivo)[::2] == (200, b'lento')
+    finally:
+        LIBERAR.set()
+        for conexao, _ in conexoes:
+            conexao.close()
+        assert servidor.encerrar(2) == 0
+
+
+def test_ociosa_expira_e_encerramento_fecha_as_estacionadas():
+    servidor = _iniciar(threads=2, tamanho_fila=2, timeout_cliente=5, timeout_ocioso=0.3)
+    expira, arquivo_expira = _conectar(servidor)
+    expira.sendall(_requisicao('GET', '/'))
+    assert _ler_resposta(arquivo_expira)[0] == 200
+    _aguardar(lambda: servidor.estado()['idle_connections'] == 1)
+    _aguardar(lambda: servidor.estado()['idle_connections'] == 0)
+    assert arquivo_expira.read() == b''
+
+    servidor.RequestHandlerClass.timeout_ocioso = 60
+    estacionada, arquivo = _conectar(servidor)
+    estacionada.sendall(_requisicao('GET', '/'))
+    assert _ler_resposta(arquivo)[0] == 200
+    _aguardar(lambda: servidor.estado()['idle_connections'] == 1)
+    assert servidor.encerrar(2) == 0
+    _aguardar(lambda: servidor.estado()['idle_connections'] == 0)
+    assert arquivo.read() == b''
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Testes dos volumes append-only: leitura de volta, corte do fim rasgado pelo CRC,
+checkpoint do índice com releitura e compactação
+"""
+
+import json
+import os
+
+from volumes import CABECALHO, Volumes
+
+
+def _conteudo(i, tamanho=500):
+    return bytes([i % 256]) * tamanho
+
+
+def test_grava_e_le_de_volta(tmp_path):
+    volumes = Volumes(tmp_path)
+    for i in range(20):
+        volumes.gravar(f'frag_{i}', _conteudo(i))
+    volumes.gravar('frag_3', b'nova versao')
+
+    assert volumes.obter('frag_0')[1] == _conteudo(0)
+    assert volumes.obter('frag_19')[1] == _conteudo(19)
+    assert volumes.obter('frag_3')[1] == b'nova versao'
+    assert volumes.obter('inexistente') is None
+    assert volumes.remover('frag_5') and not volumes.remover('frag_5')
+    assert not volumes.contem('frag_5') and volumes.obter('frag_5') is None
+    assert len(volumes.nomes()) == 19
+    volumes.fechar()
+
+
+def test_gravar_so_retorna_depois_do_fsync(tmp_path, monkeypatch):
+    volumes = Volumes(tmp_path)
+    sincronizados = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda descritor: (sincronizados.append(volumes.gravados), fsync(descritor)))
+
+    volumes.gravar('frag', b'dados')
+    assert sincronizados == [1]
+    assert volumes.sincronizados == volumes.gravados == 1
+    volumes.fechar()
+
+
+def test_fim_rasgado_e_cortado_pelo_crc(tmp_path):
+    volumes = Volumes(tmp_path)
+    volumes.gravar('inteiro', _conteudo(1))
+    volumes.gravar('rasgado', _conteudo(2))
+    volumes.fechar()
+    (tmp_path / 'indice.json').unlink()  # sem checkpoint: relê o volume inteiro
+
+    # corrompe um byte do conteúdo do último registro (o CRC não bate mais)
+    caminho = tmp_path / 'volume_000001.dat'
+    dados = bytearray(caminho.read_bytes())
+    dados[-1] ^= 0xFF
+    caminho.write_bytes(bytes(dados))
+
+    volumes = Volumes(tmp_path)
+    assert volumes.obter('inteiro')[1] == _conteudo(1)
+    assert volumes.obter('rasgado') is None
+    tamanho_registro = CABECALHO.size + len('inteiro') + 500
+    assert caminho.stat().st_size == tamanho_registro
+    volumes.fechar()
+
+
+def test_registro_incompleto_no_fim_e_descartado(tmp_path):
+    volumes = Volumes(tmp_path)
+    volumes.gravar('inteiro', _conteudo(1))
+    volumes.gravar('cortado', _conteudo(2))
+    volumes.fechar()
+    (tmp_path / 'indice.json').unlink()
+
+    caminho = tmp_path / 'volume_000001.dat'
+    os.truncate(caminho, caminho.stat().st_size - 100)  # queda no meio da gravação
+
+    volumes = Volumes(tmp_path)
+    assert volumes.nomes() == ['inteiro']
+    volumes.gravar('depois', b'continua')  # o volume segue gravável depois do corte
+    assert volumes.obter('depois')[1] == b'continua'
+    volumes.fechar()
+
+
+def test_checkpoint_e_releitura_do_que_veio_depois(tmp_path):
+    volumes = Volumes(tmp_path)
+    for i in range(5):
+        volumes.gravar(f'antes_{i}', _conteudo(i))
+    assert volumes.salvar_indice()
+    assert not volumes.salvar_indice()  # nada mudou desde o checkpoint
+    checkpoint = json.loads((tmp_path / 'indice.json').read_text())
+
+    # depois do checkpoint: gravações, substituição e remoção que só estão no volume
+    volumes.gravar('depois', b'depois do checkpoint')
+    volumes.gravar('antes_1', b'substituido')
+    volumes.remover('antes_2')
+    os.close(volumes.descritor)  # queda: sem o checkpoint do encerramento
+
+    assert set(checkpoint['indice']) == {f'antes_{i}' for i in range(5)}
+    volumes = Volumes(tmp_path)
+    assert sorted(volumes.nomes()) == ['antes_0', 'antes_1', 'antes_3', 'antes_4', 'depois']
+    assert volumes.obter('antes_1')[1] == b'substituido'
+    assert volumes.obter('depois')[1] == b'depois do checkpoint'
+    assert volumes.obter('antes_4')[1] == _conteudo(4)
+    volumes.fechar()
+
+
+def test_compactacao_mantem_os_registros_vivos(tmp_path):
+    volumes = Volumes(tmp_path, tamanho_maximo=4096, fracao_compactacao=0.5)
+    for i in range(30):
+        volumes.gravar(f'frag_{i}', _conteudo(i))
+    assert volumes.ativo > 2
+    vivos = {f'frag_{i}' for i in range(30) if i % 4 == 0}
+    for i in range(30):
+        if f'frag_{i}' not in vivos:
+            volumes.remover(f'frag_{i}')
+    volumes.obter('frag_0')  # deixa um mmap aberto no volume que vai ser compactado
+    volumes_antes = set(volumes.volumes)
+
+    assert volumes.compactar() > 0
+    assert volumes.compactados > 0
+    compactados = volumes_antes - set(volumes.volumes)
+    assert compactados
+    for id_volume in compactados:
+        assert not volumes._caminho(id_volume).exists()
+        assert id_volume not in volumes.mapas
+    assert set(volumes.nomes()) == vivos
+    for nome in vivos:
+        assert volumes.obter(nome)[1] == _conteudo(int(nome.split('_')[1]))
+    volumes.fechar()
+
+    # a compactação sobrevive à reabertura: removidos continuam removidos
+    volumes = Volumes(tmp_path, tamanho_maximo=4096)
+    assert set(volumes.nomes()) == vivos
+    assert volumes.obter('frag_8')[1] == _conteudo(8)
+    volumes.fechar()
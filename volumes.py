@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Volumes do nodo: fragmentos pequenos gravados em poucos arquivos grandes, só por append
+Cada registro tem cabeçalho, nome e conteúdo; um índice em memória {nome: posição} permite ler
+qualquer fragmento com uma fatia do mmap do volume, sem abrir nem dar stat num arquivo por fragmento
+Remover grava um registro de remoção; o espaço morto é recuperado pela compactação, que copia
+os registros vivos de um volume para o volume ativo e apaga o antigo
+O índice é salvo de tempos em tempos (checkpoint): na partida só o fim de cada volume é relido
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from threading import Lock
+
+# Cabeçalho de cada registro: marca, tipo, tamanho do nome, tamanho do conteúdo, CRC32 de nome + conteúdo
+CABECALHO = struct.Struct('<4sBHII')
+MARCA = b'SBV1'
+DADOS, REMOCAO = 1, 2
+
+
+# Volumes de um diretório (volume_000001.dat, ...) e o checkpoint do índice (indice.json)
+class Volumes:
+    """Armazenamento de fragmentos pequenos em volumes append-only"""
+
+    def __init__(self, diretorio, limite_fragmento=64 * 1024, tamanho_maximo=1024 * 1024 * 1024, fracao_compactacao=0.5):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.arquivo_indice = self.diretorio / 'indice.json'
+        self.limite_fragmento = limite_fragmento      # fragmentos maiores ficam em arquivos avulsos
+        self.tamanho_maximo = tamanho_maximo          # o volume ativo é fechado ao passar disso
+        self.fracao_compactacao = fracao_compactacao  # fração de espaço morto que faz um volume ser compactado
+        self.lock = Lock()
+        self.lock_mapas = Lock()
+        self.lock_sincronia = Lock()
+        self.gravados = 0       # registros acrescentados
+        self.sincronizados = 0  # registros que já passaram por um fsync
+        self.indice = {}   # {nome: (id_volume, posição do conteúdo, tamanho)}
+        self.volumes = {}  # {id_volume: {'tamanho': bytes, 'mortos': bytes}}
+        self.mapas = {}    # {id_volume: mmap}
+        self.ativo = None
+        self.descritor = None
+        self.alterado = False
+        self.compactados = 0
+        self._carregar()
+
+    @staticmethod
+    def _tamanho_registro(nome, tamanho):
+        return CABECALHO.size + len(nome.encode()) + tamanho
+
+    def _caminho(self, id_volume):
+        return self.diretorio / f'volume_{id_volume:06d}.dat'
+
+    # Carrega o checkpoint e relê o que foi gravado nos volumes depois dele
+    # Volumes fora do checkpoint com id menor que o último dele sobraram de uma compactação interrompida
+    def _carregar(self):
+        lidos = {}
+        try:
+            checkpoint = json.loads(self.arquivo_indice.read_text())
+            self.indice = {nome: tuple(entrada) for nome, entrada in checkpoint['indice'].items()}
+            self.volumes = {int(id_volume): estado for id_volume, estado in checkpoint['volumes'].items()}
+            lidos = {int(id_volume): posicao for id_volume, posicao in checkpoint['lidos'].items()}
+        except (FileNotFoundError, ValueError, KeyError):
+            self.indice, self.volumes = {}, {}
+
+        no_disco = sorted(int(caminho.stem.split('_')[1]) for caminho in self.diretorio.glob('volume_*.dat'))
+        ultimo_checkpoint = max(self.volumes, default=0)
+        for id_volume in list(self.volumes):
+            if id_volume not in no_disco:
+                # volume sumiu do disco: as entradas dele saem do índice
+                self.volumes.pop(id_volume)
+                self.indice = {nome: entrada for nome, entrada in self.indice.items() if entrada[0] != id_volume}
+        for id_volume in no_disco:
+            if id_volume not in self.volumes and id_volume < ultimo_checkpoint:
+                self._caminho(id_volume).unlink()
+                continue
+            self.volumes.setdefault(id_volume, {'tamanho': 0, 'mortos': 0})
+            self._reler(id_volume, lidos.get(id_volume, 0), id_volume == no_disco[-1])
+
+        self.ativo = max(self.volumes, default=1)
+        self.volumes.setdefault(self.ativo, {'tamanho': 0, 'mortos': 0})
+        self.descritor = os.open(self._caminho(self.ativo), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    # Aplica ao índice os registros de um volume a partir de 'posicao'
+    # Um registro incompleto ou com CRC errado no fim do último volume (gravação interrompida) é cortado
+    def _reler(self, id_volume, posicao, ultimo):
+        caminho = self._caminho(id_volume)
+        tamanho_arquivo = caminho.stat().st_size
+        if tamanho_arquivo > posicao:
+            with open(caminho, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                while posicao + CABECALHO.size <= tamanho_arquivo:
+                    marca, tipo, tamanho_nome, tamanho, crc = CABECALHO.unpack_from(mapa, posicao)
+                    inicio_nome = posicao + CABECALHO.size
+                    fim = inicio_nome + tamanho_nome + tamanho
+                    if marca != MARCA or fim > tamanho_arquivo or zlib.crc32(mapa[inicio_nome:fim]) != crc:
+                        break
+                    nome = mapa[inicio_nome:inicio_nome + tamanho_nome].decode()
+                    self._aplicar(id_volume, tipo, nome, inicio_nome + tamanho_nome, tamanho, fim - posicao)
+                    posicao = fim
+        if posicao < tamanho_arquivo and ultimo:
+            os.truncate(caminho, posicao)
+        self.volumes[id_volume]['tamanho'] = max(posicao, self.volumes[id_volume]['tamanho'])
+        self.alterado = True
+
+    # Atualiza índice e espaço morto com um registro (usado na releitura e na gravação)
+    def _aplicar(self, id_volume, tipo, nome, posicao, tamanho, tamanho_registro):
+        anterior = self.indice.pop(nome, None)
+        if anterior is not None and anterior[0] in self.volumes:
+            self.volumes[anterior[0]]['mortos'] += self._tamanho_registro(nome, anterior[2])
+        if tipo == DADOS:
+            self.indice[nome] = (id_volume, posicao, tamanho)
+        else:
+            self.volumes[id_volume]['mortos'] += tamanho_registro
+
+    # Acrescenta um registro ao volume ativo (com o lock); troca de volume quando ele enche
+    def _acrescentar(self, tipo, nome, dados):
+        nome_bytes = nome.encode()
+        registro = CABECALHO.pack(MARCA, tipo, len(nome_bytes), len(dados), zlib.crc32(dados, zlib.crc32(nome_bytes))) + nome_bytes + dados
+        estado = self.volumes[self.ativo]
+        if estado['tamanho'] and estado['tamanho'] + len(registro) > self.tamanho_maximo:
+            with self.lock_sincronia:  # um fsync em andamento não pode ver o descritor fechado
+                os.fsync(self.descritor)
+                os.close(self.descritor)
+                self.ativo += 1
+                estado = self.volumes[self.ativo] = {'tamanho': 0, 'mortos': 0}
+                self.descritor = os.open(self._caminho(self.ativo), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        posicao = estado['tamanho']
+        os.write(self.descritor, registro)
+        estado['tamanho'] += len(registro)
+        self.gravados += 1
+        self._aplicar(self.ativo, tipo, nome, posicao + CABECALHO.size + len(nome_bytes), len(dados), len(registro))
+        self.alterado = True
+        return self.indice.get(nome)
+
+    # Grava (ou substitui) um fragmento e retorna a entrada do índice depois que o registro está no disco
+    def gravar(self, nome, dados):
+        with self.lock:
+            entrada = self._acrescentar(DADOS, nome, dados)
+            numero = self.gravados
+        self._sincronizar(numero)
+        return entrada
+
+    # Commit em grupo: um só fsync do volume ativo cobre todos os registros acrescentados até ele
+    # começar; quem chega enquanto ele roda espera e, se já foi coberto, volta sem outro fsync
+    # A troca de volume faz o fsync do volume que fecha, então só o ativo pode ter registros pendentes
+    def _sincronizar(self, numero):
+        with self.lock_sincronia:
+            if self.sincronizados >= numero:
+                return
+            alvo = self.gravados
+            os.fsync(self.descritor)
+            self.sincronizados = alvo
+
+    # Remove um fragmento; retorna False se ele não estava nos volumes
+    def remover(self, nome):
+        with self.lock:
+            if nome not in self.indice:
+                return False
+            self._acrescentar(REMOCAO, nome, b'')
+            return True
+
+    def contem(self, nome):
+        return nome in self.indice
+
+    def nomes(self):
+        return list(self.indice)
+
+    # mmap do volume cobrindo pelo menos até 'fim' (o do volume ativo é refeito quando ele cresce)
+    def _mapa(self, id_volume, fim):
+        with self.lock_mapas:
+            mapa = self.mapas.get(id_volume)
+            if mapa is None or len(mapa) < fim:
+                with open(self._caminho(id_volume), 'rb') as f:
+                    mapa = self.mapas[id_volume] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapa
+
+    # Lê um fragmento: retorna (entrada do índice, bytes) ou None
+    # A entrada identifica a gravação (muda se o fragmento for regravado ou movido pela compactação)
+    def obter(self, nome):
+        for _ in range(2):
+            entrada = self.indice.get(nome)
+            if entrada is None:
+                return None
+            id_volume, posicao, tamanho = entrada
+            try:
+                return entrada, self._mapa(id_volume, posicao + tamanho)[posicao:posicao + tamanho]
+            except (FileNotFoundError, ValueError):
+                continue  # o volume acabou de ser compactado (mmap fechado): a entrada nova está no índice
+        return None
+
+    # Salva o índice e até onde cada volume já foi lido (gravação atômica por rename)
+    def salvar_indice(self):
+        with self.lock:
+            if not self.alterado:
+                return False
+            os.fsync(self.descritor)
+            checkpoint = {
+                'indice': dict(self.indice),
+                'volumes': {id_volume: dict(estado) for id_volume, estado in self.volumes.items()},
+                'lidos': {id_volume: estado['tamanho'] for id_volume, estado in self.volumes.items()}
+            }
+            self.alterado = False
+        temporario = self.arquivo_indice.with_suffix('.tmp')
+        temporario.write_text(json.dumps(checkpoint, separators=(',', ':')))
+        os.replace(temporario, self.arquivo_indice)
+        return True
+
+    # Compacta os volumes fechados com fração de espaço morto acima de 'fracao_compactacao'
+    # Os registros vivos vão para o volume ativo; remoções só são copiadas se um volume mais antigo
+    # ainda pode ter o registro removido. Retorna os bytes mortos recuperados
+    def compactar(self, limitador=None):
+        recuperados = 0
+        for id_volume in sorted(self.volumes):
+            estado = self.volumes.get(id_volume)
+            if id_volume == self.ativo or not estado['tamanho'] or estado['mortos'] / estado['tamanho'] < self.fracao_compactacao:
+                continue
+            mais_antigos = any(outro < id_volume for outro in self.volumes)
+            with open(self._caminho(id_volume), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                posicao = 0
+                while posicao < estado['tamanho']:
+                    _, tipo, tamanho_nome, tamanho, _ = CABECALHO.unpack_from(mapa, posicao)
+                    inicio_nome = posicao + CABECALHO.size
+                    nome = mapa[inicio_nome:inicio_nome + tamanho_nome].decode()
+                    entrada = (id_volume, inicio_nome + tamanho_nome, tamanho)
+                    dados = mapa[entrada[1]:entrada[1] + tamanho]
+                    if limitador is not None:
+                        limitador.consumir(len(dados))
+                    with self.lock:
+                        if tipo == DADOS and self.indice.get(nome) == entrada:
+                            self._acrescentar(DADOS, nome, dados)
+                        elif tipo == REMOCAO and mais_antigos and nome not in self.indice:
+                            self._acrescentar(REMOCAO, nome, b'')
+                    posicao = entrada[1] + tamanho
+            with self.lock:
+                self.volumes.pop(id_volume)
+                self.alterado = True
+            # o checkpoint sai antes do apagamento: o índice salvo nunca aponta para um volume que não existe
+            self.salvar_indice()
+            with self.lock_mapas:
+                mapa = self.mapas.pop(id_volume, None)
+            if mapa is not None:
+                mapa.close()
+            self._caminho(id_volume).unlink()
+            recuperados += estado['mortos']
+            self.compactados += 1
+        return recuperados
+
+    def fechar(self):
+        self.salvar_indice()
+        with self.lock, self.lock_sincronia:
+            os.close(self.descritor)
+
+    # Situação dos volumes (JSON)
+    def estatisticas(self):
+        with self.lock:
+            total = sum(estado['tamanho'] for estado in self.volumes.values())
+            mortos = sum(estado['mortos'] for estado in self.volumes.values())
+            return {
+                'volumes': len(self.volumes),
+                'active_volume': self.ativo,
+                'fragments': len(self.indice),
+                'bytes': total,
+                'dead_bytes': mortos,
+                'compacted_volumes': self.compactados
+            }